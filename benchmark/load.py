@@ -0,0 +1,98 @@
+"""
+在本地模拟的源OJ (test.mockoj) 上压测 提交 -> 轮询 -> 结果 的完整流程，输出每个平台每分钟完成的操作数
+
+    python -m benchmark.load [--oj HDU POJ] [--workers 8] [--duration 30] [--latency 0.02] [--error-rate 0.01]
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from spider.config import Account, Result
+from spider.core import Core
+from spider.tracing import activate, memory_exporter, tracer
+from test.mockoj import MockFarm, targets
+
+
+class Counter(object):
+    def __init__(self):
+        self.operations = 0
+        self.verdicts = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, operations=0, verdicts=0, errors=0):
+        with self._lock:
+            self.operations += operations
+            self.verdicts += verdicts
+            self.errors += errors
+
+
+def worker(oj_name, index, deadline, counter, poll_interval):
+    # 每个 worker 使用自己的账号，轮询的时候只会看到自己的提交
+    account = Account(f'load{index}', 'secret')
+    core = Core(oj_name)
+    pid, language = targets[oj_name]
+    while time.monotonic() < deadline:
+        trace = tracer.start(oj_name, pid, account.username)
+        with activate(trace):
+            cycle(core, account, pid, language, index, deadline, counter, poll_interval)
+        tracer.finish(trace)
+
+
+# 一次 提交 -> 轮询 直到出结果
+def cycle(core, account, pid, language, index, deadline, counter, poll_interval):
+    result = core.submit(account, pid, language, f'// run {index}')
+    counter.add(operations=1)
+    if result.status != Result.Status.STATUS_SUBMIT_SUCCESS:
+        counter.add(errors=1)
+        return
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        result = core.get_result(account, pid)
+        counter.add(operations=1)
+        if result.status != Result.Status.STATUS_RESULT_SUCCESS:
+            counter.add(errors=1)
+        elif result.verdict != Result.Verdict.VERDICT_RUNNING:
+            counter.add(verdicts=1)
+            return
+
+
+def run(oj_name, workers, duration, poll_interval):
+    counter = Counter()
+    deadline = time.monotonic() + duration
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index in range(workers):
+            executor.submit(worker, oj_name, index, deadline, counter, poll_interval)
+    return counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--oj', nargs='+', default=list(targets), choices=list(targets))
+    parser.add_argument('--workers', type=int, default=8, help='每个平台同时进行的提交数')
+    parser.add_argument('--duration', type=float, default=10, help='每个平台压测的秒数')
+    parser.add_argument('--poll', type=float, default=0.05, help='轮询间隔秒数')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟的请求延迟秒数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟的 500 错误概率')
+    parser.add_argument('--throttle', type=float, default=None, help='模拟的每个域名每秒请求数上限')
+    args = parser.parse_args()
+
+    print(f'{"platform":<12}{"ops/min":>10}{"verdicts/min":>14}{"errors":>8}')
+    with MockFarm(latency=args.latency, error_rate=args.error_rate, throttle=args.throttle,
+                  judge_time=(0.1, 0.1)):
+        for oj_name in args.oj:
+            counter = run(oj_name, args.workers, args.duration, args.poll)
+            scale = 60 / args.duration
+            print(f'{oj_name:<12}{counter.operations * scale:>10.0f}{counter.verdicts * scale:>14.0f}'
+                  f'{counter.errors:>8}')
+
+    # 每个平台排队、评测和出结果时间的分位数 (秒)，精度受轮询间隔限制
+    print(f'\n{"platform":<12}{"stage":<18}{"p50":>8}{"p90":>8}{"p99":>8}')
+    for oj_name, stages in memory_exporter.percentiles().items():
+        for name, item in stages.items():
+            print(f'{oj_name:<12}{name:<18}{item["p50"]:>8.2f}{item["p90"]:>8.2f}{item["p99"]:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+对比整页解析和只解析部分节点的耗时和内存峰值，以及 bs4 和 lxml 两个解析后端完整解析一个页面的耗时和内存峰值。
+parsers 和 measure 也供 benchmark.suite 和 test 使用，新增平台只需要改这里
+
+    python -m benchmark.parsers [-n 200]
+"""
+import argparse
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from spider.parser_backend import BACKEND_BS4, BACKEND_LXML
+from spider.platforms.aizu import AizuParser
+from spider.platforms.codeforces import CodeforcesParser
+from spider.platforms.hdu import HDUParser
+from spider.platforms.poj import POJParser
+from spider.platforms.wust import WUSTParser
+from spider.platforms.zoj import ZOJParser
+from test.fixtures import problem_response, result_response
+
+parsers = {
+    'HDU': HDUParser,
+    'POJ': POJParser,
+    'ZOJ': ZOJParser,
+    'WUST': WUSTParser,
+    'Aizu': AizuParser,
+    'Codeforces': CodeforcesParser,
+}
+
+
+def measure(func, number, setup=None, repeat=5):
+    """
+    和 timeit 一样重复 repeat 轮取最快的一轮，减少机器负载带来的抖动
+
+    :param func: 被测函数，setup 不为空时以 setup() 的返回值为参数
+    :param setup: 每次调用前准备参数，不计入耗时，用于 update_tag 这种会修改输入的函数
+    :return: (每秒调用次数, 单次调用的内存峰值)
+    """
+    call = func if setup else (lambda _: func())
+    elapsed = float('inf')
+    for _ in range(repeat):
+        args = [setup() if setup else None for _ in range(number)]
+        start = time.perf_counter()
+        for arg in args:
+            call(arg)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    arg = setup() if setup else None
+    tracemalloc.start()
+    call(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return number / elapsed if elapsed else float('inf'), peak
+
+
+def compare(text, strainer, number):
+    full = measure(lambda: BeautifulSoup(text, 'lxml'), number)
+    partial = measure(lambda: BeautifulSoup(text, 'lxml', parse_only=strainer), number)
+    return full, partial
+
+
+def compare_backends(oj_name, page, number):
+    results = []
+    for backend in (BACKEND_BS4, BACKEND_LXML):
+        parser = parsers[oj_name]()
+        parser.backend = backend
+        if page == 'problem':
+            response = problem_response(oj_name)
+            results.append(measure(lambda: parser.problem_parse(response, '', ''), number))
+        else:
+            response = result_response(oj_name)
+            results.append(measure(lambda: parser.result_parse(response), number))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=200, help='每个页面解析的次数')
+    args = parser.parse_args()
+
+    print(f'{"platform":<12}{"page":<9}{"full ms":>10}{"part ms":>10}{"saved":>8}'
+          f'{"full KiB":>11}{"part KiB":>11}{"saved":>8}')
+    for oj_name, parser_class in parsers.items():
+        pages = [('problem', problem_response(oj_name).text, parser_class.problem_strainer),
+                 ('result', result_response(oj_name).text, parser_class.result_strainer)]
+        for page, text, strainer in pages:
+            if strainer is None:
+                continue
+            (full_rate, full_peak), (part_rate, part_peak) = compare(text, strainer, args.number)
+            print(f'{oj_name:<12}{page:<9}{1000 / full_rate:>10.3f}{1000 / part_rate:>10.3f}'
+                  f'{1 - full_rate / part_rate:>8.0%}{full_peak / 1024:>11.1f}{part_peak / 1024:>11.1f}'
+                  f'{1 - part_peak / full_peak:>8.0%}')
+
+    print()
+    print(f'{"platform":<12}{"page":<9}{"bs4 ms":>10}{"lxml ms":>10}{"saved":>8}'
+          f'{"bs4 KiB":>11}{"lxml KiB":>11}{"saved":>8}')
+    for oj_name in parsers:
+        for page in ('problem', 'result'):
+            (bs4_rate, bs4_peak), (lxml_rate, lxml_peak) = compare_backends(oj_name, page, args.number)
+            print(f'{oj_name:<12}{page:<9}{1000 / bs4_rate:>10.3f}{1000 / lxml_rate:>10.3f}'
+                  f'{1 - bs4_rate / lxml_rate:>8.0%}{bs4_peak / 1024:>11.1f}{lxml_peak / 1024:>11.1f}'
+                  f'{1 - lxml_peak / bs4_peak:>8.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+启动耗时：在新的解释器进程中测量导入 spider 各个模块、构建第一个 Core 的时间 (毫秒)，
+扣除空解释器启动的时间，取多次中最快的一次
+
+    python -m benchmark.startup [-r 10] [--top 15] [--check 80]
+
+--top 列出导入 spider.core 时最慢的模块 (python -X importtime)，
+--check 导入 spider.core 超过这个毫秒数的时候以状态 1 退出
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+cases = {
+    'import spider.core': 'import spider.core',
+    'import spider.utils': 'import spider.utils',
+    "Core('HDU')": "from spider.core import Core; Core('HDU')",
+    "AsyncCore('HDU')": "from spider.core import AsyncCore; AsyncCore('HDU')",
+}
+
+# 在子进程中执行 statement，输出它本身的耗时，不包括解释器启动
+TIMER = 'import time; _start = time.perf_counter(); {statement}; print(time.perf_counter() - _start)'
+
+
+def _run(args, env=None):
+    return subprocess.run([sys.executable] + args, cwd=ROOT, env=env, check=True, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def measure(statement, repeat=10):
+    """
+    返回 statement 在新进程中执行的最短耗时 (秒)
+    """
+    return min(float(_run(['-c', TIMER.format(statement=statement)]).stdout.split()[-1]) for _ in range(repeat))
+
+
+def run(repeat=10):
+    return {name: measure(statement, repeat) for name, statement in cases.items()}
+
+
+def slowest_imports(statement='import spider.core', top=15):
+    """
+    返回 [(模块, 累计微秒)]，按累计耗时从大到小
+    """
+    items = []
+    for line in _run(['-X', 'importtime', '-c', statement]).stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        items.append((module.strip(), int(cumulative)))
+    return sorted(items, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-r', '--repeat', type=int, default=10, help='每个用例启动的进程数，取最快的一次')
+    parser.add_argument('--top', type=int, default=0, help='列出导入最慢的模块数')
+    parser.add_argument('--check', type=float, default=None, help='导入 spider.core 的毫秒数上限')
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(f'{"case":<22}{"ms":>8}')
+    for name, seconds in results.items():
+        print(f'{name:<22}{seconds * 1000:>8.1f}')
+    if args.top:
+        print(f'\n{"module":<40}{"cumulative ms":>14}')
+        for module, cumulative in slowest_imports(top=args.top):
+            print(f'{module:<40}{cumulative / 1000:>14.1f}')
+    if args.check is not None and results['import spider.core'] * 1000 > args.check:
+        print(f'regression: import spider.core took {results["import spider.core"] * 1000:.1f} ms '
+              f'> {args.check:.1f} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+离线基准测试：在 test/fixtures 保存的页面上测量各平台 problem_parse、result_parse 和 HtmlTag.update_tag
+每秒处理的次数和内存峰值
+
+    python -m benchmark.suite [-n 100] [-r 5] [--backend lxml] [--save] [--check] [--tolerance 0.3] [--metric peak]
+
+--save 把本次结果写入 baseline.json，--check 和 baseline.json 中同一后端的结果比较，
+吞吐量下降或者内存峰值上升超过 tolerance 时以状态 1 退出。吞吐量和机器有关，换机器之后需要重新 --save，
+CI 的机器和保存基准的机器不同，只用 --metric peak 检查内存峰值
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+
+from bs4 import BeautifulSoup, element
+
+from benchmark.parsers import measure, parsers
+from spider.parser_backend import backends, get_default_backend
+from spider.utils import HtmlTag
+from test.fixtures import pages, problem_response, result_response
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+def statement_tags(oj_name):
+    """
+    题面中交给 HtmlTag.update_tag 处理的顶级节点
+    """
+    parser_class = parsers[oj_name]
+    if oj_name == 'Aizu':
+        soup = BeautifulSoup(json.loads(problem_response(oj_name).text).get('html'), 'lxml').body
+    else:
+        soup = BeautifulSoup(problem_response(oj_name).text, 'lxml', parse_only=parser_class.problem_strainer)
+        if oj_name == 'HDU':
+            soup = soup.find('h1').parent
+    return [tag for tag in soup.children if isinstance(tag, element.Tag)]
+
+
+def cases(oj_name, backend):
+    parser = parsers[oj_name]()
+    parser.backend = backend
+    pid = pages[oj_name][2]
+    problem = problem_response(oj_name)
+    result = result_response(oj_name)
+    prefix = parser._static_prefix
+
+    def update_tags(tags):
+        for tag in tags:
+            HtmlTag.update_tag(tag, prefix)
+
+    return [
+        ('problem_parse', lambda: parser.problem_parse(problem, pid, ''), None),
+        ('result_parse', lambda: parser.result_parse(result), None),
+        ('update_tag', update_tags, lambda: statement_tags(oj_name)),
+    ]
+
+
+def run(number, backend, repeat=5):
+    """
+    :return: {oj_name: {case: {'rate': 每秒次数, 'peak': 内存峰值字节数}}}
+    """
+    results = {}
+    for oj_name in parsers:
+        results[oj_name] = {}
+        for name, func, setup in cases(oj_name, backend):
+            rate, peak = measure(func, number, setup, repeat)
+            results[oj_name][name] = {'rate': round(rate, 1), 'peak': peak}
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(results, backend, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    baseline[backend] = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(results, baseline, tolerance, metrics=('rate', 'peak')):
+    """
+    :param metrics: 检查的指标，rate 为吞吐量，peak 为内存峰值
+    :return: [(oj_name, case, 指标, 基准值, 本次值)]，吞吐量低于基准或者内存峰值高于基准超过 tolerance
+    """
+    found = []
+    for oj_name, items in results.items():
+        for name, current in items.items():
+            expected = baseline.get(oj_name, {}).get(name)
+            if expected is None:
+                continue
+            if 'rate' in metrics and current['rate'] < expected['rate'] * (1 - tolerance):
+                found.append((oj_name, name, 'rate', expected['rate'], current['rate']))
+            if 'peak' in metrics and current['peak'] > expected['peak'] * (1 + tolerance):
+                found.append((oj_name, name, 'peak', expected['peak'], current['peak']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=100, help='每轮每个用例执行的次数')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='重复的轮数，取最快的一轮')
+    parser.add_argument('--backend', choices=backends, default=get_default_backend(), help='解析后端')
+    parser.add_argument('--save', action='store_true', help='把结果保存为新的基准')
+    parser.add_argument('--check', action='store_true', help='和保存的基准比较，退步时返回 1')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='允许的相对退步幅度')
+    parser.add_argument('--metric', action='append', choices=('rate', 'peak'), help='--check 检查的指标，默认全部')
+    args = parser.parse_args()
+
+    results = run(args.number, args.backend, args.repeat)
+    baseline = load_baseline().get(args.backend, {}).get('results', {})
+    print(f'{"platform":<12}{"case":<15}{"ops/s":>10}{"base":>10}{"peak KiB":>11}{"base":>11}')
+    for oj_name, items in results.items():
+        for name, current in items.items():
+            expected = baseline.get(oj_name, {}).get(name, {})
+            base_rate = f'{expected["rate"]:.0f}' if expected else '-'
+            base_peak = f'{expected["peak"] / 1024:.1f}' if expected else '-'
+            print(f'{oj_name:<12}{name:<15}{current["rate"]:>10.0f}{base_rate:>10}'
+                  f'{current["peak"] / 1024:>11.1f}{base_peak:>11}')
+
+    if args.save:
+        save_baseline(results, args.backend)
+        print(f'baseline saved to {BASELINE_PATH}')
+    if args.check:
+        found = regressions(results, baseline, args.tolerance, args.metric or ('rate', 'peak'))
+        for oj_name, name, metric, expected, current in found:
+            print(f'regression: {oj_name} {name} {metric} {expected:.1f} -> {current:.1f}')
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,26 @@
 import json
-import time
+import threading
+from concurrent.futures import TimeoutError
 
 from flask import Flask, render_template, request
 
 from spider.config import Account
 from spider.config import Problem, Result
 from spider.core import Core
+from spider.pool import AccountPool, PoolExhausted, get_pool
 
 app = Flask(__name__, template_folder='.')
+pool = get_pool()
+# 每个OJ一个账号池，提交到拿到最终结果期间独占账号，并发的提交不会拿到彼此的结果
+account_pools = {}
+account_pools_lock = threading.Lock()
+
+
+def account_pool(remote_oj):
+    with account_pools_lock:
+        if remote_oj not in account_pools:
+            account_pools[remote_oj] = AccountPool(remote_oj, [Account('robot4test', 'robot4test')])
+        return account_pools[remote_oj]
 
 
 @app.route("/submit", methods=['POST'])
@@ -18,25 +31,20 @@ def submit():
         remote_id = request.form['remote_id']
         language = request.form['language']
 
-        ans = False
-        tries = 3
-        account = Account('robot4test', 'robot4test')
-        while ans is False and tries > 0:
-            tries -= 1
-            core = Core(str(remote_oj))
-            ans = core.submit_code(pid=remote_id, account=account, code=source_code.read(), language=language)
-            account.set_cookies(core.get_cookies())
-        if ans.status in [Result.Status.STATUS_SUBMIT_ERROR, Result.Status.STATUS_SPIDER_ERROR,
-                          Result.Status.STATUS_SYSTEM_ERROR]:
+        try:
+            handle = account_pool(str(remote_oj)).submit_code_async(remote_id, language, source_code.read(), wait=60)
+        except PoolExhausted:
+            return "BUSY"
+        try:
+            result = handle.result(timeout=60)
+        except TimeoutError:
+            # 源OJ评测太慢，返回目前的状态，poller 在后台继续跟踪，拿到结果之后归还账号
+            result = handle.latest
+        if result is None:
+            return "PENDING"
+        if result.status in [Result.Status.STATUS_SUBMIT_ERROR, Result.Status.STATUS_SPIDER_ERROR,
+                             Result.Status.STATUS_SYSTEM_ERROR]:
             return "SUBMIT FAILED"
-        core = Core(remote_oj)
-        result = core.get_result(account=account, pid=remote_id)
-        account.set_cookies(core.get_cookies())
-        tries = 5
-        while result.verdict == Result.Verdict.VERDICT_RUNNING and tries > 0:
-            time.sleep(2)
-            result = Core(remote_oj).get_result_by_rid_and_pid(rid=result.unique_key, pid=remote_id)
-            tries -= 1
 
         if result.status == Result.Status.STATUS_RESULT_SUCCESS:
             return str(result.__dict__)
@@ -46,24 +54,29 @@ def submit():
 
 @app.route("/raw/<string:remote_oj>/<string:remote_id>")
 def get_raw(remote_oj, remote_id):
-    problem = Core(remote_oj).get_problem(remote_id, account=Account('robot4test', 'robot4test'))
+    account = Account('robot4test', 'robot4test')
+    with pool.core(remote_oj, account=account) as core:
+        problem = core.get_problem(remote_id, account=account)
     if problem and problem.status:
-        problem.status = problem.status.value
         return '<xmp>' + str(
-            json.dumps(problem.__dict__, sort_keys=True, indent=4)) + '</xmp>'
+            json.dumps(problem.to_dict(), sort_keys=True, indent=4)) + '</xmp>'
     return 'No Such OJ'
 
 
 @app.route("/languages/<string:remote_oj>")
 def language(remote_oj):
-    return json.dumps({
-        'languages': Core(remote_oj).find_language(account=Account('robot4test', 'robot4test'))
-    })
+    account = Account('robot4test', 'robot4test')
+    with pool.core(remote_oj, account=account) as core:
+        return json.dumps({
+            'languages': core.find_language(account=account)
+        })
 
 
 @app.route("/<string:remote_oj>/<string:remote_id>")
 def problem(remote_oj, remote_id):
-    problem_json = Core(remote_oj).get_problem(remote_id, account=Account('robot4test', 'robot4test'))
+    account = Account('robot4test', 'robot4test')
+    with pool.core(remote_oj, account=account) as core:
+        problem_json = core.get_problem(remote_id, account=account)
     if problem_json.status == Problem.Status.STATUS_SUCCESS:
         return problem_json.html
     return problem_json.status.name
@@ -5,8 +5,11 @@ setuptools.setup(name='spider',
                  description='Virtual Judge Spider',
                  author='dianhsu',
                  author_email='xudian.cn@gmail.com',
-                 packages=setuptools.find_packages(),
+                 packages=setuptools.find_packages(exclude=['benchmark', 'benchmark.*', 'test', 'test.*']),
                  install_requires=['beautifulsoup4', 'lxml', 'requests'],
+                 extras_require={
+                     'async': ['aiohttp'],
+                 },
                  classifiers=[
                      "Programming Language :: Python :: 3",
                      "License :: OSI Approved :: MIT License",
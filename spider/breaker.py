@@ -0,0 +1,255 @@
+"""
+按平台的熔断器和健康状态。一个OJ连续 threshold 次请求超时、连接失败或者返回 5xx 之后熔断，
+熔断期间 HttpUtil 不再发出请求，直接按请求失败处理 (返回 None)，不用每次都等完连接和读取超时。
+熔断之后每隔 reset_timeout 秒在后台用这个平台的 is_working() 探测一次，探测成功之后恢复:
+
+    VJ_BREAKER=off VJ_BREAKER_THRESHOLD=5 VJ_BREAKER_RESET=30
+
+所有平台的健康状态由 health.snapshot() 给出，过期之后并发调用各个平台的 is_working() 刷新:
+
+    {'HDU': {'working': True, 'state': 'closed', 'failures': 0, 'checked_at': 1700000000.0, 'elapsed': 0.12}, ...}
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from spider.limiter import platform_hosts
+from spider.log import logger
+from spider.metrics import platform_of
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+
+# 探测期间的请求不受熔断限制，也不计入失败次数
+_probing = contextvars.ContextVar('spider_breaker_probing', default=False)
+
+
+class CircuitBreaker(object):
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                self.failures = 0
+
+    # 返回 True 表示这次失败让熔断器打开
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == STATE_CLOSED and self.failures >= self.threshold:
+                self.state = STATE_OPEN
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def close(self):
+        with self._lock:
+            opened, self.state = self.state == STATE_OPEN, STATE_CLOSED
+            self.failures = 0
+            self.opened_at = None
+            return opened
+
+    def to_dict(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'opened_at': self.opened_at,
+                    'rejected': self.rejected}
+
+
+class BreakerRegistry(object):
+    """
+    每个平台一个 CircuitBreaker，平台由请求的域名决定 (spider.limiter.platform_hosts)，其他域名不熔断
+
+    :param threshold: 连续失败多少次之后熔断
+    :param reset_timeout: 熔断之后每隔多少秒探测一次
+    :param enabled: 为 False 的时候所有请求都直接放行
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0, enabled=True):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.enabled = enabled
+        self._breakers = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, threshold=None, reset_timeout=None, enabled=None):
+        with self._lock:
+            if threshold is not None:
+                self.threshold = threshold
+            if reset_timeout is not None:
+                self.reset_timeout = reset_timeout
+            if enabled is not None:
+                self.enabled = enabled
+            for breaker in self._breakers.values():
+                breaker.threshold, breaker.reset_timeout = self.threshold, self.reset_timeout
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, self.threshold, self.reset_timeout)
+            return self._breakers[name]
+
+    def _for_url(self, url):
+        if not self.enabled or _probing.get():
+            return None
+        name = platform_of(url)
+        return self.get(name) if name in platform_hosts else None
+
+    def allow(self, url):
+        """
+        请求之前调用，熔断期间返回 False
+        """
+        breaker = self._for_url(url)
+        return breaker is None or breaker.allow()
+
+    # 请求结束之后调用，failed 为超时、连接失败或者 5xx
+    def record(self, url, failed):
+        breaker = self._for_url(url)
+        if breaker is None:
+            return
+        if not failed:
+            breaker.success()
+        elif breaker.failure():
+            logger.warning(f'circuit for {breaker.name} opened after {breaker.failures} failures')
+            self._schedule(breaker.name)
+
+    def reset(self, name=None):
+        """
+        关闭熔断器，name 为空的时候关闭所有平台的熔断器
+        """
+        with self._lock:
+            names = [name] if name is not None else list(self._breakers)
+            for item in names:
+                timer = self._timers.pop(item, None)
+                if timer is not None:
+                    timer.cancel()
+        for item in names:
+            self.get(item).close()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def probing():
+        token = _probing.set(True)
+        try:
+            yield
+        finally:
+            _probing.reset(token)
+
+    def _schedule(self, name):
+        with self._lock:
+            if name in self._timers:
+                return
+            timer = self._timers[name] = threading.Timer(self.reset_timeout, self._probe, (name,))
+            timer.daemon = True
+            timer.start()
+
+    def _probe(self, name):
+        with self._lock:
+            self._timers.pop(name, None)
+        if self.get(name).state == STATE_OPEN and not health.probe(name)['working']:
+            self._schedule(name)
+
+    # 探测的结果，is_working() 成功的时候关闭熔断器
+    def observe(self, name, working):
+        if working and self.get(name).close():
+            logger.warning(f'circuit for {name} closed, is_working() succeeded')
+
+    def states(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.to_dict() for breaker in breakers}
+
+
+class HealthMonitor(object):
+    """
+    所有平台的健康状态，snapshot 过期之后并发刷新，同时只有一次刷新
+
+    :param max_age: snapshot 的有效秒数
+    :param max_workers: 刷新时的并发数，默认每个平台一个线程
+    """
+
+    def __init__(self, max_age=60.0, max_workers=None):
+        self.max_age = max_age
+        self.max_workers = max_workers
+        self._status = {}
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @staticmethod
+    def platforms():
+        from spider.core import Core
+        return list(Core.get_supports())
+
+    def probe(self, name):
+        """
+        在熔断限制之外调用一次 name 的 is_working()，更新熔断器和这个平台的健康状态
+        """
+        from spider.core import Core
+        start = time.perf_counter()
+        try:
+            with BreakerRegistry.probing():
+                working = bool(Core(name).is_working())
+        except Exception as e:
+            logger.exception(e)
+            working = False
+        breakers.observe(name, working)
+        status = dict(breakers.get(name).to_dict(), working=working, checked_at=time.time(),
+                      elapsed=time.perf_counter() - start)
+        status.pop('rejected')
+        with self._lock:
+            self._status[name] = status
+        return status
+
+    def refresh(self):
+        with self._refresh_lock:
+            self._refresh()
+        return self.snapshot(max_age=float('inf'))
+
+    def _refresh(self):
+        names = self.platforms()
+        with ThreadPoolExecutor(max_workers=self.max_workers or max(1, len(names)),
+                                thread_name_prefix='spider-health') as executor:
+            list(executor.map(self.probe, names))
+        self._refreshed_at = time.monotonic()
+
+    def snapshot(self, max_age=None):
+        """
+        返回 {平台: 状态}，距离上一次刷新超过 max_age (默认 self.max_age) 秒的时候先刷新，
+        其他线程正在刷新的时候等它完成，不重复请求
+        """
+        max_age = self.max_age if max_age is None else max_age
+        if time.monotonic() - self._refreshed_at > max_age:
+            refreshed_at = self._refreshed_at
+            with self._refresh_lock:
+                if self._refreshed_at == refreshed_at:
+                    self._refresh()
+        # 熔断状态取当前的值，不等下一次刷新
+        states = breakers.states()
+        with self._lock:
+            return {name: dict(status, state=states[name]['state'], failures=states[name]['failures'])
+                    if name in states else dict(status) for name, status in self._status.items()}
+
+
+breakers = BreakerRegistry(threshold=int(os.getenv('VJ_BREAKER_THRESHOLD', 5)),
+                           reset_timeout=float(os.getenv('VJ_BREAKER_RESET', 30)),
+                           enabled=os.getenv('VJ_BREAKER', 'on') != 'off')
+health = HealthMonitor(max_age=float(os.getenv('VJ_HEALTH_MAX_AGE', 60)))
@@ -1,3 +1,4 @@
+import struct
 from enum import Enum
 
 default_headers = {
@@ -33,10 +34,125 @@ class Account:
         self._cookies = cookies
 
 
-class Problem(object):
+# to_bytes 的格式: 类型 (1 字节)、版本 (1 字节)、字段数 (1 字节)，然后按 __slots__ 的顺序依次是每个字段:
+# 标记 (1 字节)，字符串后面跟 4 字节长度和 utf-8 内容，整数和浮点数后面跟 8 字节，None 和布尔值只有标记
+_ENCODING_VERSION = 1
+_NONE, _STR, _TRUE, _FALSE, _INT, _FLOAT = range(6)
+_header = struct.Struct('<BBB')
+_str_head = struct.Struct('<BI')
+_int = struct.Struct('<Bq')
+_float = struct.Struct('<Bd')
+
+
+class Model(object):
+    """
+    Problem 和 Result 的基类，字段保存在 __slots__ 中，不再为每个对象分配 __dict__。
+    新字段只能加在 __slots__ 的末尾，这样旧版本 to_bytes 的数据仍然可以读取
+    """
+    __slots__ = ()
+    # 字段名: Enum 类，to_dict 和 to_bytes 中保存 Enum 的 value
+    _enums = {}
+    _magic = 0
+
+    # 兼容原来直接读取 __dict__ 的代码，比如 json.dumps(problem.__dict__)，每次返回新的 dict，修改它不影响对象
+    @property
+    def __dict__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_dict(self):
+        """
+        返回只包含 str, bool, int, float, None 的 dict，Enum 字段保存为它的 value，可以直接 json.dumps
+        """
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            data[name] = value.value if isinstance(value, Enum) else value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        to_dict 的逆操作，不认识的字段会被忽略，Enum 字段可以是 value 也可以是 Enum 本身
+        """
+        obj = cls()
+        for name in cls.__slots__:
+            if name in data:
+                setattr(obj, name, cls._field(name, data[name]))
+        return obj
+
+    @classmethod
+    def _field(cls, name, value):
+        enum = cls._enums.get(name)
+        if enum is None or value is None or isinstance(value, enum):
+            return value
+        return enum(value)
+
+    def to_bytes(self):
+        """
+        紧凑的二进制编码，用于缓存和进程间传递，比 json 更小也更快
+        """
+        parts = [_header.pack(self._magic, _ENCODING_VERSION, len(self.__slots__))]
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, Enum):
+                value = value.value
+            if value is None:
+                parts.append(b'\x00')
+            elif value is True:
+                parts.append(b'\x02')
+            elif value is False:
+                parts.append(b'\x03')
+            elif isinstance(value, str):
+                data = value.encode('utf-8')
+                parts.append(_str_head.pack(_STR, len(data)))
+                parts.append(data)
+            elif isinstance(value, int):
+                parts.append(_int.pack(_INT, value))
+            elif isinstance(value, float):
+                parts.append(_float.pack(_FLOAT, value))
+            else:
+                raise TypeError(f'{type(self).__name__}.{name} of type {type(value).__name__} cannot be encoded')
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, count = _header.unpack_from(data)
+        if magic != cls._magic or version != _ENCODING_VERSION:
+            raise ValueError(f'not an encoded {cls.__name__} (type {magic}, version {version})')
+        obj = cls()
+        offset = _header.size
+        for index in range(count):
+            tag = data[offset]
+            if tag == _STR:
+                size = _str_head.unpack_from(data, offset)[1]
+                offset += _str_head.size
+                value = str(data[offset:offset + size], 'utf-8')
+                offset += size
+            elif tag == _INT:
+                value = _int.unpack_from(data, offset)[1]
+                offset += _int.size
+            elif tag == _FLOAT:
+                value = _float.unpack_from(data, offset)[1]
+                offset += _float.size
+            elif tag in (_NONE, _TRUE, _FALSE):
+                value = None if tag == _NONE else tag == _TRUE
+                offset += 1
+            else:
+                raise ValueError(f'unknown field tag {tag} at offset {offset}')
+            # 新版本写入的多余字段直接跳过
+            if index < len(cls.__slots__):
+                name = cls.__slots__[index]
+                setattr(obj, name, cls._field(name, value))
+        return obj
+
+
+class Problem(Model):
     """
     从原网站抓取的题目对象
     """
+    __slots__ = ('remote_id', 'status', 'remote_oj', 'remote_url', 'title', 'time_limit', 'memory_limit',
+                 'special_judge', 'html', 'template')
+    _magic = 1
 
     class Status(Enum):
         """
@@ -68,11 +184,15 @@ class Problem(object):
         # 这个属性代表使用的开源OJ类型，比如hustoj,qduoj等。
         self.template = None
 
+    _enums = {'status': Status}
+
 
-class Result(object):
+class Result(Model):
     """
     提交代码到源网站和从原网站抓取结果的返回对象
     """
+    __slots__ = ('unique_key', 'verdict_info', 'verdict', 'execute_time', 'execute_memory', 'status', 'compile_info')
+    _magic = 2
 
     def __init__(self, status=None):
         self.unique_key = None
@@ -117,3 +237,5 @@ class Result(object):
         VERDICT_AC = 'AC'
         VERDICT_CE = 'CE'
         VERDICT_WA = 'WA'
+
+    _enums = {'status': Status, 'verdict': Verdict}
@@ -1,7 +1,16 @@
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+from spider.breaker import health
 from spider.config import Problem, Result
-from spider.utils import logger
+from spider.log import logger
+from spider.metrics import operation
+from spider.platforms import registry
+from spider.poller import get_poller
+from spider.profiling import profiled
+from spider.store import statement_hash
+from spider.tracing import activate, mark_submitted, observe, stage, tracer
 
 supports = [
     'Aizu',
@@ -14,31 +23,140 @@ supports = [
     'Codeforces'
 ]
 
+# 批量抓取题目时每个OJ同时进行的请求数，整个进程共享
+concurrency = {
+    'Codeforces': 2,
+}
+DEFAULT_CONCURRENCY = 4
+
+# 增量刷新时题目相对于仓库的变化
+CHANGE_ADDED = 'added'
+CHANGE_MODIFIED = 'modified'
+CHANGE_REMOVED = 'removed'
+CHANGE_UNCHANGED = 'unchanged'
+# 源OJ没有正常响应，返回的是仓库中缓存的题目
+CHANGE_STALE = 'stale'
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_concurrency(oj_name):
+    return concurrency.get(oj_name, DEFAULT_CONCURRENCY)
+
+
+def _oj_semaphore(oj_name):
+    with _semaphores_lock:
+        if oj_name not in _semaphores:
+            _semaphores[oj_name] = threading.BoundedSemaphore(get_concurrency(oj_name))
+        return _semaphores[oj_name]
+
+
+def _error_problem(oj_name, pid, status=Problem.Status.STATUS_ERROR):
+    problem = Problem(status)
+    problem.remote_oj = oj_name
+    problem.remote_id = pid
+    return problem
+
+
+def _refresh_stored(oj, store, remote_oj, pid, stored, response):
+    """
+    用 fetch_problem 得到的响应刷新仓库中的题目，原始响应或者题面区域的指纹没有变化的时候不解析
+
+    :return: (Problem, 变化)，抓取失败的时候变化为空，源OJ有响应但是解析失败的已有题目为 CHANGE_REMOVED，
+             是否从仓库删除由调用者决定。仓库中已有题目而源OJ请求失败或者返回其他状态码的时候，
+             返回仓库中的题目，变化为 CHANGE_STALE
+    """
+    if stored is not None and stored.is_unchanged(response):
+        store.touch(remote_oj, pid, response)
+        return stored.problem, CHANGE_UNCHANGED
+    statement = statement_hash(response, oj.statement_pattern, oj.volatile_patterns)
+    if stored is not None and stored.is_statement_unchanged(statement):
+        store.touch(remote_oj, pid, response)
+        return stored.problem, CHANGE_UNCHANGED
+    problem = Core.strip_problem(oj.parse_problem(response, pid))
+    if problem.status == Problem.Status.STATUS_SUCCESS:
+        store.put(problem, response, statement)
+        if stored is None:
+            return problem, CHANGE_ADDED
+        return problem, CHANGE_UNCHANGED if problem.to_dict() == stored.problem.to_dict() else CHANGE_MODIFIED
+    if stored is not None and response is not None and response.status_code in (200, 404, 410):
+        return problem, CHANGE_REMOVED
+    if stored is not None:
+        return stored.problem, CHANGE_STALE
+    return problem, None
+
 
 class OJBuilder(object):
     @staticmethod
     def build_oj(name, *args, **kwargs):
+        return OJBuilder._build(name, False, *args, **kwargs)
+
+    # 构建异步版本的平台，类名为 Async + 平台名，和同步版本放在同一个模块
+    @staticmethod
+    def build_async_oj(name, *args, **kwargs):
+        return OJBuilder._build(name, True, *args, **kwargs)
+
+    # 平台类从 spider.platforms.registry 中获取，每个平台的模块只导入一次
+    @staticmethod
+    def _build(name, asynchronous, *args, **kwargs):
         if name:
             try:
-                module_meta = __import__(f'spider.platforms.{str(name).lower()}', globals(), locals(), [name])
-                class_meta = getattr(module_meta, name)
-                oj = class_meta(*args, **kwargs)
-                return oj
+                class_meta = registry.get(name, asynchronous)
+                if class_meta is not None:
+                    return class_meta(*args, **kwargs)
             except ModuleNotFoundError as e:
                 logger.exception(e)
         return None
 
 
 class Core(object):
-    def __init__(self, oj_name, proxies=None, timeout=5):
+    def __init__(self, oj_name, proxies=None, timeout=None, store=None, mirror=None):
         self._remote_oj = oj_name
+        # timeout 为空的时候使用 spider.timeouts 按 平台/操作 自适应的超时，数字或者 (连接超时, 读取超时) 优先
         self._oj = OJBuilder.build_oj(oj_name, proxies=proxies, timeout=timeout)
+        # spider.store.ProblemStore，为空的时候每次都重新抓取题面
+        self._store = store
+        # spider.mirror.AssetMirror，为空的时候题面中保留源OJ的图片和附件地址
+        self._mirror = mirror
 
     @staticmethod
     def strip_blank(data):
         if data:
             return str(data).strip(' ').strip('\r\n').strip(' ')
 
+    @staticmethod
+    def strip_problem(problem):
+        problem.title = Core.strip_blank(problem.title)
+        problem.time_limit = Core.strip_blank(problem.time_limit)
+        problem.memory_limit = Core.strip_blank(problem.memory_limit)
+        return problem
+
+    # 题面中的图片和附件换成镜像地址，仓库中保存的仍然是源OJ的地址
+    @staticmethod
+    def mirror_problem(mirror, problem):
+        if mirror is not None and problem.status == Problem.Status.STATUS_SUCCESS:
+            return mirror.mirror(problem)
+        return problem
+
+    # 根据源OJ的运行状态填充 verdict，并清理时间和内存字段
+    @staticmethod
+    def judge_result(oj, result):
+        if result is not None:
+            with stage('classify'):
+                if oj.is_accepted(result.verdict_info):
+                    result.verdict = Result.Verdict.VERDICT_AC
+                elif oj.is_running(result.verdict_info):
+                    result.verdict = Result.Verdict.VERDICT_RUNNING
+                elif oj.is_compile_error(result.verdict_info):
+                    result.verdict = Result.Verdict.VERDICT_CE
+                else:
+                    result.verdict = Result.Verdict.VERDICT_WA
+            result.execute_time = Core.strip_blank(result.execute_time)
+            result.execute_memory = Core.strip_blank(result.execute_memory)
+            return result
+        return Result(Result.Status.STATUS_RESULT_ERROR)
+
     # 获取支持的OJ列表
     @staticmethod
     def get_supports():
@@ -49,6 +167,14 @@ class Core(object):
     def is_support(oj_name):
         return oj_name in supports
 
+    # 所有支持的OJ的健康状态和熔断状态，见 spider.breaker.HealthMonitor.snapshot
+    @staticmethod
+    def get_health(max_age=None):
+        return health.snapshot(max_age)
+
+    def get_remote_oj(self):
+        return self._remote_oj
+
     def get_home_page_url(self):
         if not self._oj:
             return None
@@ -59,36 +185,152 @@ class Core(object):
             return None
         return self._oj.get_cookies()
 
+    # 是否可以通过状态页一次获取多个运行id的结果
+    def supports_result_page(self):
+        return bool(self._oj and self._oj.status_page_size)
+
     # 获取题面的时候是否需要登录状态
     def account_required(self):
         return self._oj.account_required()
 
     # 获取题面
+    @operation('get_problem')
+    @profiled
     def get_problem(self, pid, account):
         if not self._oj:
-            problem = Problem(Problem.Status.STATUS_ERROR)
-            problem.remote_oj = self._remote_oj
-            problem.remote_id = pid
-            return problem
+            return _error_problem(self._remote_oj, pid)
         self._oj.set_cookies(account.cookies)
-        problem = self._oj.get_problem(pid=pid, account=account)
-        problem.title = Core.strip_blank(problem.title)
-        problem.time_limit = Core.strip_blank(problem.time_limit)
-        problem.memory_limit = Core.strip_blank(problem.memory_limit)
-        return problem
+        if self._store is not None:
+            return Core.mirror_problem(self._mirror, self._get_problem_from_store(pid))
+        return Core.mirror_problem(self._mirror, Core.strip_problem(self._oj.get_problem(pid=pid, account=account)))
 
-    # 提交代码
+    # 批量获取题面，返回的顺序和 pids 一致
+    def get_problems(self, pids, account=None, max_workers=None):
+        problems = {}
+        pids = list(pids)
+        for problem in self.iter_problems(pids, account=account, max_workers=max_workers):
+            problems[problem.remote_id] = problem
+        return [problems[pid] for pid in pids]
+
+    def iter_problems(self, pids, account=None, max_workers=None):
+        """
+        并发抓取多个题目，按照完成的先后顺序返回 Problem，单个题目失败不会影响其他题目，
+        失败的题目 status 为 STATUS_RETRYABLE 或者 STATUS_ERROR。
+        所有线程共用这个 Core 的 session，同一个OJ同时进行的请求数不超过 get_concurrency(oj_name)
+
+        :param pids: 题号，可以是生成器，不会一次性全部读入
+        :param account: 爬虫账号，可以为空
+        :param max_workers: 线程数，默认等于OJ的并发上限
+        """
+        for problem, _ in self._iter_refreshed(pids, account, max_workers):
+            yield problem
+
+    def iter_changes(self, pids, account=None, max_workers=None):
+        """
+        和 iter_problems 相同，同时返回题目相对于仓库的变化，需要在构造的时候传入 store。
+        返回 (Problem, 变化)，变化为 CHANGE_ADDED, CHANGE_MODIFIED, CHANGE_REMOVED, CHANGE_UNCHANGED，
+        源OJ出错时返回仓库中的题目，变化为 CHANGE_STALE，仓库中也没有的时候为空。
+        CHANGE_REMOVED 的题目仍然留在仓库中，确认之后调用 forget_problem 删除
+        """
+        if self._store is None:
+            raise ValueError('iter_changes requires a ProblemStore')
+        return self._iter_refreshed(pids, account, max_workers)
+
+    def forget_problem(self, pid):
+        if self._store is not None:
+            self._store.delete(self._remote_oj, pid)
+
+    def _iter_refreshed(self, pids, account, max_workers):
+        if not self._oj:
+            for pid in pids:
+                yield _error_problem(self._remote_oj, pid), None
+            return
+        if account:
+            self._oj.set_cookies(account.cookies)
+        max_workers = max_workers or get_concurrency(self._remote_oj)
+        pids = iter(pids)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = set()
+            while True:
+                for pid in pids:
+                    running.add(executor.submit(self._refresh_limited, pid))
+                    if len(running) >= max_workers * 2:
+                        break
+                if not running:
+                    return
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    @operation('get_problem')
+    @profiled
+    def _refresh_limited(self, pid):
+        change = None
+        with _oj_semaphore(self._remote_oj):
+            try:
+                if self._store is not None:
+                    problem, change = self._refresh_from_store(pid)
+                else:
+                    problem = Core.strip_problem(self._oj.get_problem(pid=pid))
+            except Exception as e:
+                logger.exception(e)
+                return _error_problem(self._remote_oj, pid), None
+        # 下载图片和附件不占用OJ的并发名额
+        try:
+            return Core.mirror_problem(self._mirror, problem), change
+        except Exception as e:
+            logger.exception(e)
+            return problem, change
+
+    # 题面没有变化的时候直接返回仓库中的对象，不再解析
+    def _get_problem_from_store(self, pid):
+        return self._refresh_from_store(pid)[0]
+
+    def _refresh_from_store(self, pid):
+        stored = self._store.get(self._remote_oj, pid)
+        response = self._oj.fetch_problem(pid, headers=stored.conditional_headers() if stored else None)
+        return _refresh_stored(self._oj, self._store, self._remote_oj, pid, stored, response)
+
+    # 提交代码，整个过程记录为一个 spider.tracing.SubmissionTrace
     def submit_code(self, account, pid, language, code):
+        trace = tracer.start(self._remote_oj, pid, account.username)
+        with activate(trace):
+            result = self.submit(account, pid, language, code)
+            if result.status == Result.Status.STATUS_SUBMIT_SUCCESS:
+                time.sleep(self.get_result_delay())
+                # submit 拿到了源OJ的运行id时按运行id查询，不会查到同一个账号的其他提交
+                if result.unique_key:
+                    result = self.get_result_by_rid_and_pid(result.unique_key, pid)
+                else:
+                    result = self.get_result(account=account, pid=pid)
+        tracer.finish(trace, result)
+        return result
+
+    # 只提交代码，不等待结果
+    @operation('submit')
+    @profiled
+    @stage('submit')
+    def submit(self, account, pid, language, code):
         if not self._oj:
             return Result(Result.Status.STATUS_SYSTEM_ERROR)
         self._oj.set_cookies(account.cookies)
-        if self._oj.submit_code(account, pid, language, code):
-            time.sleep(2)
-            return self.get_result(account=account, pid=pid)
-        else:
-            return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        result = self._oj.submit_code(account, pid, language, code)
+        return mark_submitted(result or Result(Result.Status.STATUS_SUBMIT_ERROR))
+
+    # 提交代码，立即返回 spider.poller.SubmissionHandle，最终结果由后台的 VerdictPoller 获取
+    def submit_code_async(self, account, pid, language, code, poller=None):
+        return (poller or get_poller()).submit(self, account, pid, language, code)
+
+    # 提交之后最少等待多少秒源OJ才能查到这次提交
+    def get_result_delay(self):
+        if not self._oj:
+            return 0
+        return self._oj.result_delay
 
     # 获取结果
+    @operation('get_result')
+    @profiled
+    @stage('poll')
     def get_result(self, account, pid):
 
         if not self._oj:
@@ -99,21 +341,12 @@ class Core(object):
             result = self._oj.get_result(account=account, pid=pid)
         except:
             pass
-        if result is not None:
-            if self._oj.is_accepted(result.verdict_info):
-                result.verdict = Result.Verdict.VERDICT_AC
-            elif self._oj.is_running(result.verdict_info):
-                result.verdict = Result.Verdict.VERDICT_RUNNING
-            elif self._oj.is_compile_error(result.verdict_info):
-                result.verdict = Result.Verdict.VERDICT_CE
-            else:
-                result.verdict = Result.Verdict.VERDICT_WA
-            result.execute_time = Core.strip_blank(result.execute_time)
-            result.execute_memory = Core.strip_blank(result.execute_memory)
-            return result
-        return Result(Result.Status.STATUS_RESULT_ERROR)
+        return observe(Core.judge_result(self._oj, result))
 
     # 通过运行id获取结果
+    @operation('get_result')
+    @profiled
+    @stage('poll')
     def get_result_by_rid_and_pid(self, rid, pid):
         if not self._oj:
             return Result(Result.Status.STATUS_SYSTEM_ERROR)
@@ -122,21 +355,61 @@ class Core(object):
             result = self._oj.get_result_by_rid_and_pid(rid, pid)
         except:
             pass
-        if result is not None:
-            if self._oj.is_accepted(result.verdict_info):
-                result.verdict = Result.Verdict.VERDICT_AC
-            elif self._oj.is_running(result.verdict_info):
-                result.verdict = Result.Verdict.VERDICT_RUNNING
-            elif self._oj.is_compile_error(result.verdict_info):
-                result.verdict = Result.Verdict.VERDICT_CE
-            else:
-                result.verdict = Result.Verdict.VERDICT_WA
-            result.execute_time = Core.strip_blank(result.execute_time)
-            result.execute_memory = Core.strip_blank(result.execute_memory)
-            return result
-        return Result(Result.Status.STATUS_RESULT_ERROR)
+        return observe(Core.judge_result(self._oj, result))
+
+    @operation('get_results')
+    @profiled
+    def get_results_by_rids(self, rids, pid=None):
+        """
+        批量获取多个运行id的结果。源OJ的状态页支持按运行id翻页时，从最大的运行id开始请求，
+        一页中包含的所有运行id都可以一次得到结果，不支持的时候逐个调用 get_result_by_rid_and_pid。
+        状态页请求失败的时候这一批剩下的运行id都返回 STATUS_RESULT_ERROR，不是数字的运行id逐个查询
+
+        :param rids: 运行id列表
+        :param pid: 题号，只有不支持翻页的平台需要
+        :return: {rid: Result}
+        """
+        results = {}
+        pending, others = Core._split_rids(rids)
+        if not (self._oj and self._oj.status_page_size):
+            pending, others = [], pending + others
+        for rid in others:
+            results[rid] = self.get_result_by_rid_and_pid(rid, pid)
+        while pending:
+            page = None
+            try:
+                page = self._oj.get_result_page(pending[0])
+            except Exception as e:
+                logger.exception(e)
+            Core._collect_page(self._oj, page, pending, results)
+            pending = [item for item in pending if item not in results]
+        return results
+
+    # 返回 (按运行id从大到小排好的数字运行id, 其他运行id)，其他的不能按状态页翻页，只能逐个查询
+    @staticmethod
+    def _split_rids(rids):
+        rids = {str(rid).strip() for rid in rids}
+        numeric = sorted((rid for rid in rids if rid.isdigit()), key=int, reverse=True)
+        return numeric, sorted(rids.difference(numeric))
+
+    # 把一页状态中等待的运行id的结果放到 results，最大的运行id不在页中时标记为失败，保证每次至少处理一个。
+    # page 为 None 表示请求失败或者源OJ返回了错误页，这时剩下的运行id都标记为失败，不再一页一页地重试
+    @staticmethod
+    def _collect_page(oj, page, pending, results):
+        if page is None:
+            for rid in pending:
+                results[rid] = Result(Result.Status.STATUS_RESULT_ERROR)
+            return
+        rows = {str(row.unique_key).strip(): row for row in page if row.unique_key is not None}
+        for rid in pending:
+            if rid in rows:
+                results[rid] = Core.judge_result(oj, rows[rid])
+        if pending[0] not in results:
+            results[pending[0]] = Result(Result.Status.STATUS_RESULT_ERROR)
 
     # 获取源OJ语言
+    @operation('find_language')
+    @profiled
     def find_language(self, account):
         if not self._oj:
             return None
@@ -144,6 +417,8 @@ class Core(object):
         return self._oj.find_language(account=account)
 
     # 判断源OJ的网络连接是否良好
+    @operation('is_working')
+    @profiled
     def is_working(self):
         if not self._oj:
             return None
@@ -168,7 +443,237 @@ class Core(object):
         return self._oj.is_compile_error(verdict)
 
     # 判断爬虫账号是否可以正常登陆
+    @operation('login')
+    @profiled
     def is_account_valid(self, account):
         if self._oj and account and self._oj.login_website(account=account):
             return True
         return False
+
+
+class AsyncCore(object):
+    """
+    Core 的 asyncio 版本，网络相关的方法都需要 await，解析逻辑和返回的对象与 Core 完全一致
+    用完之后需要 await close() 或者使用 async with 释放连接
+    asyncio 在用到的时候才导入，只用 Core 的进程不需要加载它
+    """
+
+    def __init__(self, oj_name, proxies=None, timeout=None, store=None, mirror=None):
+        self._remote_oj = oj_name
+        self._oj = OJBuilder.build_async_oj(oj_name, proxies=proxies, timeout=timeout)
+        self._store = store
+        self._mirror = mirror
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self._oj:
+            await self._oj.close()
+
+    @staticmethod
+    def get_supports():
+        return supports
+
+    @staticmethod
+    def is_support(oj_name):
+        return oj_name in supports
+
+    # 刷新的时候在线程中进行，不阻塞事件循环
+    @staticmethod
+    async def get_health(max_age=None):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, health.snapshot, max_age)
+
+    def get_home_page_url(self):
+        if not self._oj:
+            return None
+        return self._oj.home_page_url()
+
+    def get_cookies(self):
+        if not self._oj:
+            return None
+        return self._oj.get_cookies()
+
+    def account_required(self):
+        return self._oj.account_required()
+
+    # 获取题面
+    @operation('get_problem')
+    async def get_problem(self, pid, account):
+        if not self._oj:
+            return _error_problem(self._remote_oj, pid)
+        self._oj.set_cookies(account.cookies)
+        if self._store is not None:
+            return await self._mirror_problem(await self._get_problem_from_store(pid))
+        return await self._mirror_problem(Core.strip_problem(await self._oj.get_problem(pid=pid, account=account)))
+
+    # 批量获取题面，返回的顺序和 pids 一致
+    async def get_problems(self, pids, account=None, limit=None):
+        problems = {}
+        pids = list(pids)
+        async for problem in self.iter_problems(pids, account=account, limit=limit):
+            problems[problem.remote_id] = problem
+        return [problems[pid] for pid in pids]
+
+    async def iter_problems(self, pids, account=None, limit=None):
+        """
+        和 Core.iter_problems 相同，同时进行的请求数不超过 limit，默认为 get_concurrency(oj_name)
+        """
+        import asyncio
+        if not self._oj:
+            for pid in pids:
+                yield _error_problem(self._remote_oj, pid)
+            return
+        if account:
+            self._oj.set_cookies(account.cookies)
+        limit = limit or get_concurrency(self._remote_oj)
+        pids = iter(pids)
+        running = set()
+        while True:
+            for pid in pids:
+                running.add(asyncio.ensure_future(self._get_problem_safely(pid)))
+                if len(running) >= limit:
+                    break
+            if not running:
+                return
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    @operation('get_problem')
+    async def _get_problem_safely(self, pid):
+        try:
+            if self._store is not None:
+                return await self._mirror_problem(await self._get_problem_from_store(pid))
+            return await self._mirror_problem(Core.strip_problem(await self._oj.get_problem(pid=pid)))
+        except Exception as e:
+            logger.exception(e)
+            return _error_problem(self._remote_oj, pid)
+
+    # 镜像使用同步的线程池下载，放到默认的 executor 中执行，不阻塞事件循环
+    async def _mirror_problem(self, problem):
+        import asyncio
+        if self._mirror is None:
+            return problem
+        return await asyncio.get_running_loop().run_in_executor(None, Core.mirror_problem, self._mirror, problem)
+
+    async def _get_problem_from_store(self, pid):
+        stored = self._store.get(self._remote_oj, pid)
+        response = await self._oj.fetch_problem(pid, headers=stored.conditional_headers() if stored else None)
+        return _refresh_stored(self._oj, self._store, self._remote_oj, pid, stored, response)[0]
+
+    # 提交代码
+    async def submit_code(self, account, pid, language, code):
+        import asyncio
+        trace = tracer.start(self._remote_oj, pid, account.username)
+        with activate(trace):
+            result = await self.submit(account, pid, language, code)
+            if result.status == Result.Status.STATUS_SUBMIT_SUCCESS:
+                await asyncio.sleep(self.get_result_delay())
+                if result.unique_key:
+                    result = await self.get_result_by_rid_and_pid(result.unique_key, pid)
+                else:
+                    result = await self.get_result(account=account, pid=pid)
+        tracer.finish(trace, result)
+        return result
+
+    # 只提交代码，不等待结果
+    @operation('submit')
+    @stage('submit')
+    async def submit(self, account, pid, language, code):
+        if not self._oj:
+            return Result(Result.Status.STATUS_SYSTEM_ERROR)
+        self._oj.set_cookies(account.cookies)
+        result = await self._oj.submit_code(account, pid, language, code)
+        return mark_submitted(result or Result(Result.Status.STATUS_SUBMIT_ERROR))
+
+    def get_result_delay(self):
+        if not self._oj:
+            return 0
+        return self._oj.result_delay
+
+    # 获取结果
+    @operation('get_result')
+    @stage('poll')
+    async def get_result(self, account, pid):
+        if not self._oj:
+            return Result(Result.Status.STATUS_SYSTEM_ERROR)
+        self._oj.set_cookies(account.cookies)
+        result = None
+        try:
+            result = await self._oj.get_result(account=account, pid=pid)
+        except:
+            pass
+        return observe(Core.judge_result(self._oj, result))
+
+    # 通过运行id获取结果
+    @operation('get_result')
+    @stage('poll')
+    async def get_result_by_rid_and_pid(self, rid, pid):
+        if not self._oj:
+            return Result(Result.Status.STATUS_SYSTEM_ERROR)
+        result = None
+        try:
+            result = await self._oj.get_result_by_rid_and_pid(rid, pid)
+        except:
+            pass
+        return observe(Core.judge_result(self._oj, result))
+
+    @operation('get_results')
+    async def get_results_by_rids(self, rids, pid=None):
+        results = {}
+        pending, others = Core._split_rids(rids)
+        if not (self._oj and self._oj.status_page_size):
+            pending, others = [], pending + others
+        for rid in others:
+            results[rid] = await self.get_result_by_rid_and_pid(rid, pid)
+        while pending:
+            page = None
+            try:
+                page = await self._oj.get_result_page(pending[0])
+            except Exception as e:
+                logger.exception(e)
+            Core._collect_page(self._oj, page, pending, results)
+            pending = [item for item in pending if item not in results]
+        return results
+
+    # 获取源OJ语言
+    @operation('find_language')
+    async def find_language(self, account):
+        if not self._oj:
+            return None
+        self._oj.set_cookies(account.cookies)
+        return await self._oj.find_language(account=account)
+
+    # 判断源OJ的网络连接是否良好
+    @operation('is_working')
+    async def is_working(self):
+        if not self._oj:
+            return None
+        return await self._oj.is_working()
+
+    def is_accepted(self, verdict):
+        if not self._oj:
+            return None
+        return self._oj.is_accepted(verdict)
+
+    def is_running(self, verdict):
+        if not self._oj:
+            return None
+        return self._oj.is_running(verdict)
+
+    def is_compile_error(self, verdict):
+        if not self._oj:
+            return None
+        return self._oj.is_compile_error(verdict)
+
+    # 判断爬虫账号是否可以正常登陆
+    @operation('login')
+    async def is_account_valid(self, account):
+        if self._oj and account and await self._oj.login_website(account=account):
+            return True
+        return False
@@ -0,0 +1,280 @@
+"""
+整个题库的抓取：按题号范围或者题号列表并发抓取，每个题目一行 JSON (Problem.to_dict()) 追加到输出文件，
+进度保存在检查点文件中，进程被杀掉之后用同样的参数再运行一次会从中断的地方继续。
+第一遍中 STATUS_RETRYABLE 的题目不写入输出，第一遍结束之后单独重试，最后一遍仍然失败的照原样写入
+
+    python -m spider.crawler HDU 1000-7000 -o hdu.jsonl
+    python -m spider.crawler ZOJ @zoj-ids.txt -o zoj.jsonl -j 2 --retries 3 --retry-delay 60
+
+增量刷新 (--changelog) 需要题目仓库，原始响应和题面区域的指纹都没有变化的题目不再解析，
+输出文件中只写新增和修改的题目，变化记录 {"remote_oj", "remote_id", "change", "time"} 逐行写入 changelog，
+源OJ上已经不存在的题目记为 removed 并从仓库中删除
+
+    python -m spider.crawler HDU 1000-7000 -o hdu-changed.jsonl --store problems.sqlite --changelog hdu-changes.jsonl
+
+在代码中使用:
+
+    crawler = Crawler(Core('POJ'), 'poj.jsonl', checkpoint='poj.jsonl.checkpoint')
+    crawler.run(id_range(1000, 4000))
+"""
+import json
+import os
+import time
+from collections import deque
+
+from spider.config import Problem
+from spider.core import CHANGE_ADDED, CHANGE_MODIFIED, CHANGE_REMOVED, Core
+from spider.log import logger
+
+CHECKPOINT_EVERY = 50
+
+
+def id_range(start, stop, step=1):
+    """
+    [start, stop] 之间的题号，包括 stop
+    """
+    for pid in range(int(start), int(stop) + 1, step):
+        yield str(pid)
+
+
+def read_ids(path):
+    """
+    逐行读取题号，忽略空行和 # 开始的行
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def parse_ids(spec):
+    """
+    1000-7000 表示范围，@file 表示从文件中逐行读取，其余按逗号分隔
+    """
+    if spec.startswith('@'):
+        return read_ids(spec[1:])
+    start, sep, stop = spec.partition('-')
+    if sep and start.isdigit() and stop.isdigit():
+        return id_range(start, stop)
+    return [pid.strip() for pid in spec.split(',') if pid.strip()]
+
+
+class CrawlState(object):
+    """
+    抓取进度。每一遍按顺序给题号编号，编号小于 position 的全部完成，done 是大于 position 的已完成编号，
+    最多是同时进行的题目数。offset 是输出文件中已经确认的长度，恢复的时候截断到这里，
+    最后一个检查点之后写入的行会重新抓取，不会重复
+    """
+
+    def __init__(self, remote_oj=None, attempt=0, position=0, done=(), offset=0, pending=(), again=(),
+                 stats=None, finished=False, changelog_offset=0):
+        self.remote_oj = remote_oj
+        self.attempt = attempt
+        self.position = position
+        self.done = set(done)
+        self.offset = offset
+        self.changelog_offset = changelog_offset
+        # 这一遍重试的题号
+        self.pending = list(pending)
+        # 下一遍需要重试的题号
+        self.again = list(again)
+        self.stats = dict(stats or {})
+        self.finished = finished
+
+    def complete(self, position):
+        self.done.add(position)
+        while self.position in self.done:
+            self.done.remove(self.position)
+            self.position += 1
+
+    def is_done(self, position):
+        return position < self.position or position in self.done
+
+    def next_pass(self):
+        self.attempt += 1
+        self.position = 0
+        self.done = set()
+        self.pending, self.again = self.again, []
+        self.finished = not self.pending
+
+    def to_dict(self):
+        return {'remote_oj': self.remote_oj, 'attempt': self.attempt, 'position': self.position,
+                'done': sorted(self.done), 'offset': self.offset, 'changelog_offset': self.changelog_offset,
+                'pending': self.pending, 'again': self.again, 'stats': self.stats, 'finished': self.finished}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class Crawler(object):
+    """
+    :param core: spider.core.Core，可以带上 store 和 mirror
+    :param output: 输出的 JSONL 文件
+    :param checkpoint: 检查点文件，为空的时候不能恢复，每次都重新写输出文件
+    :param account: 爬虫账号，可以为空
+    :param max_workers: 并发数，默认等于OJ的并发上限
+    :param retries: STATUS_RETRYABLE 的题目额外重试的遍数
+    :param retry_delay: 每一遍重试之前等待的秒数
+    :param checkpoint_every: 每完成多少个题目保存一次检查点
+    :param changelog: 增量刷新的变化记录文件，为空的时候不是增量刷新，所有题目都写入输出
+    """
+
+    def __init__(self, core, output, checkpoint=None, account=None, max_workers=None, retries=2, retry_delay=0,
+                 checkpoint_every=CHECKPOINT_EVERY, changelog=None):
+        self.core = core
+        self.output = output
+        self.changelog = changelog
+        self.checkpoint = checkpoint
+        self.account = account
+        self.max_workers = max_workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.checkpoint_every = checkpoint_every
+        self.state = None
+
+    def _load(self):
+        remote_oj = self.core.get_remote_oj()
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding='utf-8') as f:
+                state = CrawlState.from_dict(json.load(f))
+            if state.remote_oj != remote_oj:
+                raise ValueError(f'checkpoint {self.checkpoint} belongs to {state.remote_oj}, not {remote_oj}')
+            return state
+        return CrawlState(remote_oj)
+
+    # 先把输出文件刷到磁盘再写检查点，检查点用改名的方式替换，不会读到写了一半的文件
+    def _save(self, f, log=None):
+        for stream in (f, log):
+            if stream is not None:
+                stream.flush()
+                os.fsync(stream.fileno())
+        self.state.offset = f.tell()
+        if log is not None:
+            self.state.changelog_offset = log.tell()
+        if not self.checkpoint:
+            return
+        temp = self.checkpoint + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as checkpoint:
+            json.dump(self.state.to_dict(), checkpoint)
+        os.replace(temp, self.checkpoint)
+
+    def run(self, pids):
+        """
+        :param pids: 题号，可以是生成器，恢复的时候需要和上一次的顺序一致
+        :return: {状态名: 题目数}
+        """
+        self.state = state = self._load()
+        log = self._open(self.changelog, state.changelog_offset) if self.changelog else None
+        try:
+            with self._open(self.output, state.offset) as f:
+                while not state.finished:
+                    if state.attempt == 0:
+                        self._pass(f, log, pids)
+                    else:
+                        if self.retry_delay and state.position == 0 and not state.done:
+                            time.sleep(self.retry_delay)
+                        self._pass(f, log, list(state.pending))
+                    state.next_pass()
+                    self._save(f, log)
+        finally:
+            if log is not None:
+                log.close()
+        return state.stats
+
+    # 截断到检查点记录的长度，丢掉最后一个检查点之后写入的行
+    @staticmethod
+    def _open(path, offset):
+        f = open(path, 'a+b')
+        f.truncate(offset)
+        f.seek(0, os.SEEK_END)
+        return f
+
+    def _pass(self, f, log, pids):
+        state = self.state
+        final = state.attempt >= self.retries
+        running = {}
+
+        def source():
+            for position, pid in enumerate(pids):
+                if state.is_done(position):
+                    continue
+                pid = str(pid)
+                running.setdefault(pid, deque()).append(position)
+                yield pid
+
+        if self.changelog:
+            results = self.core.iter_changes(source(), account=self.account, max_workers=self.max_workers)
+        else:
+            results = ((problem, None) for problem in
+                       self.core.iter_problems(source(), account=self.account, max_workers=self.max_workers))
+        count = 0
+        for problem, change in results:
+            pid = str(problem.remote_id)
+            positions = running[pid]
+            position = positions.popleft()
+            if not positions:
+                del running[pid]
+            if problem.status == Problem.Status.STATUS_RETRYABLE and not final:
+                state.again.append(pid)
+                self._count('retried')
+            elif log is None:
+                self._write(f, problem.to_dict())
+                self._count(problem.status.name)
+            else:
+                self._write_change(f, log, problem, change)
+            state.complete(position)
+            count += 1
+            if count % self.checkpoint_every == 0:
+                self._save(f, log)
+        logger.info(f'crawl {state.remote_oj} pass {state.attempt}: {count} problems, '
+                    f'{len(state.again)} to retry')
+
+    @staticmethod
+    def _write(f, data):
+        f.write(json.dumps(data, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def _write_change(self, f, log, problem, change):
+        if change == CHANGE_REMOVED:
+            self.core.forget_problem(problem.remote_id)
+        if change in (CHANGE_ADDED, CHANGE_MODIFIED):
+            self._write(f, problem.to_dict())
+        if change in (CHANGE_ADDED, CHANGE_MODIFIED, CHANGE_REMOVED):
+            self._write(log, {'remote_oj': problem.remote_oj, 'remote_id': problem.remote_id, 'change': change,
+                              'time': time.time()})
+        self._count(change or problem.status.name)
+
+    def _count(self, name):
+        self.state.stats[name] = self.state.stats.get(name, 0) + 1
+
+
+def main():
+    import argparse
+    from spider.store import ProblemStore
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('oj', help='平台名，比如 HDU')
+    parser.add_argument('ids', help='1000-7000、1000,1001,1002 或者 @题号文件')
+    parser.add_argument('-o', '--output', required=True, help='输出的 JSONL 文件')
+    parser.add_argument('--checkpoint', help='检查点文件，默认为 <output>.checkpoint')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='并发数，默认等于OJ的并发上限')
+    parser.add_argument('--retries', type=int, default=2, help='STATUS_RETRYABLE 的题目额外重试的遍数')
+    parser.add_argument('--retry-delay', type=float, default=30, help='每一遍重试之前等待的秒数')
+    parser.add_argument('--store', help='spider.store.ProblemStore 的 sqlite 文件，题面没有变化的时候不再解析')
+    parser.add_argument('--changelog', help='增量刷新，变化记录写入这个文件，需要 --store')
+    parser.add_argument('--proxies', help='代理')
+    args = parser.parse_args()
+
+    core = Core(args.oj, proxies=args.proxies, store=ProblemStore(args.store) if args.store else None)
+    if args.changelog and not args.store:
+        parser.error('--changelog requires --store')
+    crawler = Crawler(core, args.output, checkpoint=args.checkpoint or args.output + '.checkpoint',
+                      max_workers=args.jobs, retries=args.retries, retry_delay=args.retry_delay,
+                      changelog=args.changelog)
+    stats = crawler.run(parse_ids(args.ids))
+    for name, count in sorted(stats.items()):
+        print(f'{name:<20}{count:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+# 各平台使用的域名，用于按平台配置限速
+platform_hosts = {
+    'Aizu': ['judgeapi.u-aizu.ac.jp'],
+    'HDU': ['acm.hdu.edu.cn'],
+    'POJ': ['poj.org'],
+    'WUST': ['acm.wust.edu.cn'],
+    'ZOJ': ['acm.zju.edu.cn'],
+    'Codeforces': ['codeforces.com'],
+}
+
+# 默认限速 (每秒请求数, 突发请求数)，没有配置的域名不限速
+default_limits = {
+    'judgeapi.u-aizu.ac.jp': (10, 20),
+    'acm.hdu.edu.cn': (5, 10),
+    'poj.org': (5, 10),
+    'acm.wust.edu.cn': (5, 10),
+    'acm.zju.edu.cn': (5, 10),
+    'codeforces.com': (2, 5),
+}
+
+
+class TokenBucket(object):
+    """
+    令牌桶，rate 为每秒补充的令牌数，burst 为桶的容量。
+    reserve 预定一个令牌并返回需要等待的秒数，令牌允许透支，所以同步和异步调用都可以直接 sleep 对应的时间。
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            return max(0.0, -self._tokens / self.rate)
+
+
+class SqliteTokenBucket(object):
+    """
+    保存在 sqlite 文件中的令牌桶，同一台机器上的多个进程共享同一个限速
+    """
+
+    def __init__(self, path, host, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._host = host
+        self._path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def _connect(self):
+        if getattr(self._local, 'conn', None) is None:
+            import sqlite3
+            self._local.conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+        return self._local.conn
+
+    def reserve(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE host = ?', (self._host,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (self._host, tokens, now))
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        return max(0.0, -tokens / self.rate)
+
+
+class HostStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.waited = 0
+        self.wait_time = 0.0
+
+
+class RateLimiter(object):
+    """
+    按域名限速，进程内所有 HttpUtil 共享。
+    设置 backend 为 sqlite 文件路径之后，限速在多个进程之间共享。
+    """
+
+    def __init__(self, limits=None, backend=None):
+        self._limits = dict(default_limits if limits is None else limits)
+        self._backend = backend
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, host, rate, burst=None):
+        """
+        :param host: 域名
+        :param rate: 每秒请求数，为空的时候取消限速
+        :param burst: 突发请求数，默认等于 rate
+        """
+        with self._lock:
+            if rate is None:
+                self._limits.pop(host, None)
+            else:
+                self._limits[host] = (rate, burst or rate)
+            self._buckets.pop(host, None)
+
+    def set_platform_limit(self, oj_name, rate, burst=None):
+        for host in platform_hosts.get(oj_name, []):
+            self.set_limit(host, rate, burst)
+
+    def set_backend(self, backend):
+        with self._lock:
+            self._backend = backend
+            self._buckets.clear()
+
+    def _bucket(self, host):
+        with self._lock:
+            if host not in self._stats:
+                self._stats[host] = HostStats()
+            if host not in self._buckets and host in self._limits:
+                rate, burst = self._limits[host]
+                if self._backend:
+                    self._buckets[host] = SqliteTokenBucket(self._backend, host, rate, burst)
+                else:
+                    self._buckets[host] = TokenBucket(rate, burst)
+            return self._buckets.get(host), self._stats[host]
+
+    # 预定一次请求，返回需要等待的秒数
+    def reserve(self, url):
+        host = urlsplit(url).hostname or ''
+        bucket, stats = self._bucket(host)
+        delay = bucket.reserve() if bucket else 0.0
+        with self._lock:
+            stats.requests += 1
+            if delay > 0:
+                stats.waited += 1
+                stats.wait_time += delay
+        return delay
+
+    def acquire(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def stats(self):
+        with self._lock:
+            return {host: dict(stats.__dict__) for host, stats in self._stats.items()}
+
+
+limiter = RateLimiter(backend=os.getenv('VJ_RATE_LIMIT_DB'))
@@ -0,0 +1,57 @@
+import logging
+import os
+import threading
+import traceback
+
+LOG_BASE = '/log' if os.getenv('VJ_ENV') == 'production' else 'log'
+LOG_LEVEL = logging.WARNING if os.getenv('VJ_ENV') == 'production' else logging.INFO
+SPIDER_LOG_PATH = os.path.join(LOG_BASE, 'spider.log')
+
+
+class DeferredHandler(logging.Handler):
+    """
+    第一次输出日志的时候才创建真正的 handler，导入模块没有副作用，生产环境下这时才创建日志目录
+    """
+
+    def __init__(self, factory, formatter=None):
+        super().__init__()
+        self._factory = factory
+        self._formatter = formatter
+        self._target = None
+        self._target_lock = threading.Lock()
+
+    @property
+    def target(self):
+        if self._target is None:
+            with self._target_lock:
+                if self._target is None:
+                    target = self._factory()
+                    if self._formatter is not None:
+                        target.setFormatter(self._formatter)
+                    self._target = target
+        return self._target
+
+    def emit(self, record):
+        self.target.handle(record)
+
+    def close(self):
+        if self._target is not None:
+            self._target.close()
+        super().close()
+
+
+def _create_handler():
+    if os.getenv('VJ_ENV') != 'production':
+        return logging.StreamHandler()
+    try:
+        os.makedirs(LOG_BASE, exist_ok=True)
+    except:
+        traceback.print_exc()
+    return logging.FileHandler(SPIDER_LOG_PATH)
+
+
+# 沿用原来在 spider.utils 中的 logger 名字，外部对它的日志配置仍然有效
+logger = logging.getLogger('spider.utils')
+handler = DeferredHandler(_create_handler, logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
@@ -0,0 +1,283 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import os
+import threading
+from urllib.parse import urlsplit
+
+from spider.limiter import platform_hosts
+
+# 默认的耗时分桶 (秒) 和响应大小分桶 (字节)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_hosts = {host: oj_name for oj_name, hosts in platform_hosts.items() for host in hosts}
+# 不属于任何平台的域名 (比如 spider.mirror 下载的图片) 共用这个标签，标签的取值不会随着访问的域名无限增加
+OTHER_PLATFORM = 'other'
+_operation = contextvars.ContextVar('spider_operation', default='')
+
+
+def platform_of(url):
+    """
+    根据域名判断请求属于哪个平台，未知的域名返回 OTHER_PLATFORM
+    """
+    return _hosts.get(urlsplit(url).hostname or '', OTHER_PLATFORM)
+
+
+def current_operation():
+    return _operation.get()
+
+
+class operation(object):
+    """
+    标记当前正在进行的操作，期间发出的请求和解析都带上这个标签。
+    可以当作 with 语句使用，也可以装饰普通函数和 async 函数:
+
+        @operation('submit')
+        def submit(self, ...):
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_operation.set(self.name))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _operation.reset(self._tokens.pop())
+
+    def __call__(self, func):
+        name = self.name
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                token = _operation.set(name)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _operation.reset(token)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                token = _operation.set(name)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    _operation.reset(token)
+        return wrapper
+
+
+class RequestSpan(object):
+    """
+    一次 HTTP 请求的记录，时间单位为秒
+
+    connect: 建立连接的时间，复用连接的时候为 0
+    ttfb: 从发出请求到收到响应头的时间
+    total: 从发出请求到读完响应体的时间
+    """
+
+    def __init__(self, method, url, platform=None, operation=None):
+        self.method = method
+        self.url = url
+        self.platform = platform if platform is not None else platform_of(url)
+        self.operation = operation if operation is not None else current_operation()
+        self.status = 0
+        self.connect = 0.0
+        self.ttfb = 0.0
+        self.total = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.error = None
+
+
+class Histogram(object):
+    """
+    累计分桶的直方图，和 Prometheus 的 histogram 一致，最后一个桶是 +Inf
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        按桶内线性分布估算分位数，落在 +Inf 桶里的时候返回最后一个桶的上界
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index >= len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class MetricsSink(object):
+    """
+    指标的接收者，Metrics 把每次请求和解析转发给所有 sink
+    """
+
+    def record_request(self, span):
+        pass
+
+    def record_parse(self, platform, operation, seconds):
+        pass
+
+
+class MemorySink(MetricsSink):
+    """
+    把指标汇总在内存中的直方图和计数器里，to_prometheus 输出 Prometheus 的文本格式
+    """
+    # 名字: (类型, 说明, 分桶)
+    families = {
+        'spider_http_connect_seconds': ('histogram', 'Time spent establishing connections.', LATENCY_BUCKETS),
+        'spider_http_ttfb_seconds': ('histogram', 'Time to first response byte.', LATENCY_BUCKETS),
+        'spider_http_request_seconds': ('histogram', 'Total request time including the body.', LATENCY_BUCKETS),
+        'spider_http_response_bytes': ('histogram', 'Response body size.', SIZE_BUCKETS),
+        'spider_parse_seconds': ('histogram', 'Time spent decoding and parsing responses.', LATENCY_BUCKETS),
+        'spider_http_requests_total': ('counter', 'Requests by response status.', None),
+        'spider_http_retries_total': ('counter', 'Retries made by the transport.', None),
+        'spider_http_errors_total': ('counter', 'Requests that failed without a response.', None),
+    }
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, name, labels, value):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.families[name][2])
+        histogram.observe(value)
+
+    def _increase(self, name, labels, value=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_request(self, span):
+        labels = (('platform', span.platform), ('operation', span.operation))
+        with self._lock:
+            if span.error is not None:
+                self._increase('spider_http_errors_total', labels + (('error', span.error),))
+                return
+            self._observe('spider_http_connect_seconds', labels, span.connect)
+            self._observe('spider_http_ttfb_seconds', labels, span.ttfb)
+            self._observe('spider_http_request_seconds', labels, span.total)
+            self._observe('spider_http_response_bytes', labels, span.bytes)
+            self._increase('spider_http_requests_total', labels + (('status', str(span.status)),))
+            if span.retries:
+                self._increase('spider_http_retries_total', labels, span.retries)
+
+    def record_parse(self, platform, operation, seconds):
+        with self._lock:
+            self._observe('spider_parse_seconds', (('platform', platform), ('operation', operation)), seconds)
+
+    def histogram(self, name, **labels):
+        """
+        返回标签完全匹配的直方图，没有记录的时候返回 None
+        """
+        with self._lock:
+            for (key, items), histogram in self._histograms.items():
+                if key == name and dict(items) == labels:
+                    return histogram
+        return None
+
+    def counter(self, name, **labels):
+        """
+        返回标签包含 labels 的所有计数之和
+        """
+        with self._lock:
+            return sum(value for (key, items), value in self._counters.items()
+                       if key == name and labels.items() <= dict(items).items())
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, (kind, description, _) in self.families.items():
+                if kind == 'histogram':
+                    items = sorted((labels, histogram) for (key, labels), histogram in self._histograms.items()
+                                   if key == name)
+                else:
+                    items = sorted((labels, value) for (key, labels), value in self._counters.items() if key == name)
+                if not items:
+                    continue
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, item in items:
+                    if kind == 'counter':
+                        lines.append(f'{name}{_labels(labels)} {_number(item)}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(item.buckets + ('+Inf',), item.counts):
+                        cumulative += count
+                        bound = bound if bound == '+Inf' else _number(bound)
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(item.sum)}')
+                    lines.append(f'{name}_count{_labels(labels)} {item.count}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Metrics(object):
+    """
+    进程内所有 HttpUtil 和 Parser 共享，把指标转发给注册的 sink。
+    设置环境变量 VJ_METRICS=off 之后不记录任何指标
+    """
+
+    def __init__(self, sinks=None, enabled=True):
+        self._sinks = list(sinks or [])
+        self.enabled = enabled
+
+    def add_sink(self, sink):
+        self._sinks = self._sinks + [sink]
+
+    def remove_sink(self, sink):
+        self._sinks = [item for item in self._sinks if item is not sink]
+
+    @property
+    def active(self):
+        return self.enabled and bool(self._sinks)
+
+    def record_request(self, span):
+        for sink in self._sinks:
+            sink.record_request(span)
+
+    def record_parse(self, platform, operation, seconds):
+        for sink in self._sinks:
+            sink.record_parse(platform, operation, seconds)
+
+
+memory_sink = MemorySink()
+metrics = Metrics([memory_sink], enabled=os.getenv('VJ_METRICS', 'on') != 'off')
@@ -0,0 +1,296 @@
+"""
+题面图片和附件的本地镜像。HtmlTag.update_tag 已经把题面中的 <img src> 和 <a href> 补全成源OJ的绝对地址，
+这里把它们并发下载到按内容 hash 寻址的目录中，再把 Problem.html 中的地址改写成镜像的地址:
+
+    mirror = AssetMirror(AssetStore('assets'), 'https://static.example.com/assets')
+    core = Core('HDU', mirror=mirror)
+
+文件保存为 <root>/<sha256 前两位>/<sha256><扩展名>，内容相同的文件只保存一份，
+把 root 目录原样发布到 base_url 下即可。已经下载过的地址不再请求，
+设置了 refresh_after 的时候，超过这个秒数的地址带上 If-None-Match / If-Modified-Since 重新校验
+"""
+import hashlib
+import html as htmllib
+import mimetypes
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from spider import config
+from spider.log import logger
+from spider.metrics import operation
+
+MAX_ASSET_SIZE = int(os.getenv('VJ_MIRROR_MAX_SIZE', 20 * 1024 * 1024))
+
+# <a href> 指向这些扩展名的时候才当作附件下载，其余的是普通链接
+ATTACHMENT_EXTENSIONS = frozenset((
+    '.pdf', '.zip', '.rar', '.7z', '.gz', '.tgz', '.tar', '.txt', '.in', '.out', '.ans', '.doc', '.docx',
+    '.ppt', '.pptx', '.xls', '.xlsx', '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.webp',
+))
+
+# update_tag 输出的属性都用双引号包围，只替换属性值，不重新序列化整个题面
+_asset_pattern = re.compile(r'(<(img|a)\b[^>]*?\s(?:src|href)=")([^"]*)(")', re.I)
+_extension_pattern = re.compile(r'\.[a-z0-9]{1,5}$')
+
+
+def content_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def normalize_url(url):
+    """
+    去掉路径中的 . 和 ..，不是 http 或 https 的地址返回 None
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        return None
+    path = urlsplit(urljoin(f'{parts.scheme}://{parts.netloc}/', parts.path or '/')).path
+    return urlunsplit((parts.scheme, parts.netloc, path, parts.query, ''))
+
+
+def guess_extension(url, content_type=None):
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if _extension_pattern.match(extension):
+        return extension
+    if content_type:
+        extension = mimetypes.guess_extension(content_type.split(';')[0].strip())
+        if extension:
+            return extension
+    return ''
+
+
+class StoredAsset(object):
+    """
+    镜像中的一条记录：源地址对应的文件 hash 和源站返回的校验信息
+    """
+
+    def __init__(self, url, digest, extension='', content_type=None, size=0, etag=None, last_modified=None,
+                 checked_at=None):
+        self.url = url
+        self.digest = digest
+        self.extension = extension or ''
+        self.content_type = content_type
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = checked_at
+
+    # 相对于仓库根目录和 base_url 的路径
+    @property
+    def name(self):
+        return f'{self.digest[:2]}/{self.digest}{self.extension}'
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers or None
+
+    def is_stale(self, refresh_after):
+        return refresh_after is not None and time.time() - (self.checked_at or 0) >= refresh_after
+
+
+class AssetStore(object):
+    """
+    按内容寻址的文件仓库，源地址到文件的索引保存在 <root>/index.sqlite 中，可以在多个进程之间共享
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS assets ('
+                               'url TEXT PRIMARY KEY, digest TEXT NOT NULL, extension TEXT, content_type TEXT, '
+                               'size INTEGER, etag TEXT, last_modified TEXT, checked_at REAL)')
+
+    def path(self, asset):
+        return os.path.join(self.root, *asset.name.split('/'))
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute('SELECT url, digest, extension, content_type, size, etag, last_modified, '
+                                     'checked_at FROM assets WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        asset = StoredAsset(*row)
+        # 索引还在但文件被删掉了，当作没有下载过
+        return asset if os.path.exists(self.path(asset)) else None
+
+    def put(self, url, response):
+        content_type = response.headers.get('Content-Type')
+        asset = StoredAsset(url, content_digest(response.content), guess_extension(url, content_type),
+                            content_type, len(response.content), response.headers.get('ETag'),
+                            response.headers.get('Last-Modified'), time.time())
+        path = self.path(asset)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再改名，并发写同一个文件的时候不会读到写了一半的内容
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(response.content)
+            os.replace(temp, path)
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (asset.url, asset.digest, asset.extension, asset.content_type, asset.size,
+                                asset.etag, asset.last_modified, asset.checked_at))
+        return asset
+
+    # 源站返回 304 的时候只更新校验信息和检查时间
+    def touch(self, asset, response):
+        asset.etag = response.headers.get('ETag') or asset.etag
+        asset.last_modified = response.headers.get('Last-Modified') or asset.last_modified
+        asset.checked_at = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE assets SET etag = ?, last_modified = ?, checked_at = ? WHERE url = ?',
+                               (asset.etag, asset.last_modified, asset.checked_at, asset.url))
+        return asset
+
+    def delete(self, url):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM assets WHERE url = ?', (url,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AssetMirror(object):
+    """
+    :param store: AssetStore
+    :param base_url: 发布 store.root 的地址，题面中的地址改写成 base_url/ab/abcdef...png
+    :param max_workers: 下载线程数，同一个域名的请求速率仍然受 spider.limiter 限制
+    :param refresh_after: 已经下载的文件超过这个秒数之后重新校验，为空的时候不再请求
+    :param max_size: 超过这个字节数的文件不镜像，保留原来的地址
+    :param proxies: 下载使用的代理
+    """
+
+    def __init__(self, store, base_url, max_workers=8, refresh_after=None, max_size=MAX_ASSET_SIZE, proxies=None):
+        self.store = store
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.refresh_after = refresh_after
+        self.max_size = max_size
+        self.proxies = proxies
+        self._req = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._running = {}
+        self.stats = {'downloaded': 0, 'reused': 0, 'revalidated': 0, 'failed': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                from spider.utils import HttpUtil
+                self._req = HttpUtil(headers=config.default_headers, proxies=self.proxies)
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='spider-mirror')
+            return self._executor
+
+    def url_of(self, asset):
+        return f'{self.base_url}/{asset.name}'
+
+    @staticmethod
+    def find_assets(html):
+        """
+        返回题面中需要镜像的地址 [(属性中的原始值, 规范化之后的地址)]，图片全部镜像，链接只镜像附件
+        """
+        found = []
+        for match in _asset_pattern.finditer(html or ''):
+            url = normalize_url(htmllib.unescape(match.group(3)))
+            if url is None:
+                continue
+            if match.group(2).lower() == 'a' and \
+                    os.path.splitext(urlsplit(url).path)[1].lower() not in ATTACHMENT_EXTENSIONS:
+                continue
+            found.append((match.group(3), url))
+        return found
+
+    def fetch(self, url):
+        """
+        返回 url 对应的 StoredAsset，下载失败的时候返回之前保存的记录或者 None
+        """
+        stored, future = self._lookup(url)
+        return stored if future is None else future.result()
+
+    # 不需要请求的时候 future 为空，同一个地址同时只下载一次
+    def _lookup(self, url):
+        stored = self.store.get(url)
+        if stored is not None and not stored.is_stale(self.refresh_after):
+            self._count('reused')
+            return stored, None
+        executor = self._get_executor()
+        with self._lock:
+            future = self._running.get(url)
+            if future is None:
+                future = self._running[url] = executor.submit(self._fetch, url, stored)
+                future.add_done_callback(lambda _: self._forget(url))
+        return stored, future
+
+    def _forget(self, url):
+        with self._lock:
+            self._running.pop(url, None)
+
+    @operation('mirror_asset')
+    def _fetch(self, url, stored):
+        try:
+            response = self._req.get(url, headers=stored.conditional_headers() if stored else None)
+            if response is not None and response.status_code == 304 and stored is not None:
+                self._count('revalidated')
+                return self.store.touch(stored, response)
+            if response is None or response.status_code != 200 or len(response.content) > self.max_size:
+                self._count('failed')
+                return stored
+            asset = self.store.put(url, response)
+            self._count('revalidated' if stored is not None and stored.digest == asset.digest else 'downloaded')
+            return asset
+        except Exception as e:
+            logger.exception(e)
+            self._count('failed')
+            return stored
+
+    def mirror_html(self, html):
+        """
+        并发下载 html 中的图片和附件，返回改写之后的 html，下载失败的地址保持不变
+        """
+        found = self.find_assets(html)
+        if not found:
+            return html
+        pending = {url: self._lookup(url) for url in dict.fromkeys(url for _, url in found)}
+        assets = {url: stored if future is None else future.result() for url, (stored, future) in pending.items()}
+        raw = {value: assets[url] for value, url in found}
+
+        def replace(match):
+            asset = raw.get(match.group(3))
+            if asset is None:
+                return match.group(0)
+            return match.group(1) + self.url_of(asset) + match.group(4)
+
+        return _asset_pattern.sub(replace, html)
+
+    def mirror(self, problem):
+        """
+        改写 problem.html 中的图片和附件地址，返回同一个 problem
+        """
+        if problem is not None and problem.html:
+            problem.html = self.mirror_html(problem.html)
+        return problem
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
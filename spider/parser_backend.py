@@ -0,0 +1,283 @@
+"""
+解析后端。默认使用 bs4，设置环境变量 VJ_PARSER_BACKEND=lxml 或者调用 set_default_backend('lxml')
+之后，各平台的 Parser 直接使用 lxml 和预编译的 XPath 解析页面，输出和 bs4 完全一致。
+单个 Parser 也可以通过 backend 属性单独指定。
+"""
+import os
+import re
+
+from lxml import etree
+
+from spider.utils import HtmlTag, HttpUtil
+
+BACKEND_BS4 = 'bs4'
+BACKEND_LXML = 'lxml'
+backends = (BACKEND_BS4, BACKEND_LXML)
+
+_default_backend = os.getenv('VJ_PARSER_BACKEND', BACKEND_BS4)
+
+# 以下规则和 bs4 输出 html 时保持一致
+_empty_element_tags = {'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image',
+                       'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source',
+                       'spacer', 'track', 'wbr'}
+_cdata_list_attributes = {
+    '*': {'class', 'accesskey', 'dropzone'},
+    'a': {'rel', 'rev'},
+    'link': {'rel', 'rev'},
+    'td': {'headers'},
+    'th': {'headers'},
+    'form': {'accept-charset'},
+    'object': {'archive'},
+    'area': {'rel'},
+    'icon': {'sizes'},
+    'iframe': {'sandbox'},
+    'output': {'for'},
+}
+_charset_re = re.compile(r'((^|;)\s*charset=)([^;]*)', re.M)
+# 除了这些标签里面，只有空白的文本会被合并成一个空格或者换行
+_preserve_whitespace_tags = {'pre', 'textarea'}
+_ascii_spaces = ' \n\t\x0c\r'
+# 这些标签里的文本原样输出
+_raw_text_tags = {'script', 'style'}
+# 这些标签里的文本属于单独的类型，get_text 只返回和调用节点同一类型的文本
+_special_string_tags = {'script', 'style', 'template', 'rt', 'rp'}
+
+
+def set_default_backend(name):
+    global _default_backend
+    if name not in backends:
+        raise ValueError(f'unknown parser backend {name}, expected one of {backends}')
+    _default_backend = name
+
+
+def get_default_backend():
+    return _default_backend
+
+
+def has_class(*names):
+    """
+    XPath 条件：class 中包含 names 中的任意一个
+    """
+    return ' or '.join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in names)
+
+
+def _parse(text, encoding=None):
+    # 和 bs4 一样通过 target 接口建树，没有值的布尔属性 (比如 <hr noshade>) 得到的是空字符串
+    parser = etree.HTMLParser(target=etree.TreeBuilder(), encoding=encoding)
+    parser.feed(text)
+    return parser.close()
+
+
+def html_tree(text):
+    """
+    把页面解析成 lxml 的根节点，空页面返回一个空的 html 节点
+    """
+    root = None
+    if text:
+        try:
+            root = _parse(text)
+        except ValueError:
+            # 带有编码声明的字符串需要转成 bytes
+            root = _parse(text.encode('utf-8'), encoding='utf-8')
+        except etree.LxmlError:
+            root = None
+    return root if root is not None else etree.Element('html')
+
+
+def is_element(node):
+    return isinstance(node.tag, str)
+
+
+def _data(text, preserve):
+    if preserve or text.strip(_ascii_spaces):
+        return text
+    return '\n' if '\n' in text else ' '
+
+
+def _preserved(node):
+    return any(ancestor.tag in _preserve_whitespace_tags for ancestor in node.iterancestors())
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _quote(value):
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', '&quot;') + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+
+def _attributes(node):
+    # bs4 输出时按属性名排序，并且把 meta 中声明的编码改成 utf-8
+    attributes = sorted(node.items())
+    if node.tag == 'meta':
+        if node.get('charset') is not None:
+            attributes = [(key, 'utf-8' if key == 'charset' else value) for key, value in attributes]
+        elif node.get('content') is not None and (node.get('http-equiv') or '').lower() == 'content-type':
+            attributes = [(key, _charset_re.sub(r'\g<1>utf-8', value) if key == 'content' else value)
+                          for key, value in attributes]
+    return attributes
+
+
+def _serialize(node, parts, preserve):
+    if node.tag is etree.Comment:
+        parts.append('<!--' + _data(node.text or '', preserve) + '-->')
+        return
+    if node.tag is etree.ProcessingInstruction:
+        parts.append('<?' + node.target + (' ' + node.text if node.text else '') + '>')
+        return
+    tag = node.tag
+    parts.append('<' + tag)
+    for key, value in _attributes(node):
+        if key in _cdata_list_attributes['*'] or key in _cdata_list_attributes.get(tag, ()):
+            value = ' '.join(value.split())
+        parts.append(' ' + key + '=' + _quote(_escape(value)))
+    if tag in _empty_element_tags and node.text is None and not len(node):
+        parts.append('/>')
+        return
+    parts.append('>')
+    raw = tag in _raw_text_tags
+    preserve = preserve or tag in _preserve_whitespace_tags
+    if node.text:
+        text = _data(node.text, preserve)
+        parts.append(text if raw else _escape(text))
+    for child in node:
+        _serialize(child, parts, preserve)
+        if child.tail:
+            text = _data(child.tail, preserve)
+            parts.append(text if raw else _escape(text))
+    parts.append('</' + tag + '>')
+
+
+def to_html(node):
+    """
+    输出和 str(bs4 Tag) 一致的 html，不包括节点后面的 tail
+    """
+    parts = []
+    _serialize(node, parts, _preserved(node))
+    return ''.join(parts)
+
+
+def node_string(node):
+    """
+    和 bs4 Tag.string 一致：只有一个子节点的时候返回其中的文本，否则返回 None
+    """
+    preserve = _preserved(node)
+    while True:
+        preserve = preserve or node.tag in _preserve_whitespace_tags
+        children = list(node)
+        count = (1 if node.text else 0) + len(children) + sum(1 for child in children if child.tail)
+        if count != 1:
+            return None
+        if node.text:
+            return _data(node.text, preserve)
+        node = children[0]
+        if not is_element(node):
+            return _data(node.text or '', preserve)
+
+
+def _strings(node, wanted, container, preserve):
+    if node.tag in _special_string_tags:
+        container = node.tag
+    preserve = preserve or node.tag in _preserve_whitespace_tags
+    if node.text and container == wanted:
+        yield _data(node.text, preserve)
+    for child in node:
+        if is_element(child):
+            yield from _strings(child, wanted, container, preserve)
+        if child.tail and container == wanted:
+            yield _data(child.tail, preserve)
+
+
+def _all_strings(node):
+    wanted = node.tag if node.tag in _special_string_tags else None
+    container = next((ancestor.tag for ancestor in node.iterancestors() if ancestor.tag in _special_string_tags), None)
+    return _strings(node, wanted, container, _preserved(node))
+
+
+def node_text(node):
+    """
+    和 bs4 Tag.get_text() 一致
+    """
+    return ''.join(_all_strings(node))
+
+
+def stripped_strings(node):
+    for text in _all_strings(node):
+        text = text.strip()
+        if text:
+            yield text
+
+
+def child_nodes(node):
+    """
+    和 bs4 Tag.children 一致，依次返回文本和子节点，文本是 str
+    """
+    preserve = _preserved(node) or node.tag in _preserve_whitespace_tags
+    if node.text:
+        yield _data(node.text, preserve)
+    for child in node:
+        yield child
+        if child.tail:
+            yield _data(child.tail, preserve)
+
+
+def add_class(node, name):
+    node.set('class', ' '.join((node.get('class') or '').split() + [name]))
+
+
+def remove(node):
+    """
+    和 bs4 Tag.decompose 一致，删除节点但是保留它后面的文本
+    """
+    parent = node.getparent()
+    if node.tail:
+        previous = node.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + node.tail
+        else:
+            parent.text = (parent.text or '') + node.tail
+    parent.remove(node)
+
+
+def update_element(node, oj_prefix, update_style=None):
+    """
+    和 HtmlTag.update_tag 一致，补全链接和图片的地址
+    """
+    for child in node.iterdescendants():
+        if not is_element(child):
+            continue
+        if update_style:
+            child.set('style', update_style)
+        if child.tag == 'a' and child.get('href'):
+            add_class(child, HtmlTag.TagDesc.ANCHOR.value)
+            child.set('target', '_blank _parent')
+            child.set('href', HttpUtil.abs_url(child.get('href'), oj_prefix=oj_prefix)[-1])
+        if child.tag == 'img' and child.get('src'):
+            add_class(child, HtmlTag.TagDesc.IMAGE.value)
+            child.set('src', HttpUtil.abs_url(child.get('src'), oj_prefix=oj_prefix)[-1])
+    return node
+
+
+class Node(object):
+    """
+    包装 lxml 节点，提供 _line_parse 用到的 bs4 Tag 接口，两个后端可以共用同一套解析代码
+    """
+    __slots__ = ('element',)
+
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def string(self):
+        return node_string(self.element)
+
+    @property
+    def stripped_strings(self):
+        return stripped_strings(self.element)
+
+    def get_text(self):
+        return node_text(self.element)
@@ -0,0 +1,96 @@
+"""
+平台注册表。平台类在第一次用到的时候才导入对应的模块，之后直接从缓存中取，
+导入 spider.core 的时候不会导入 requests, bs4, lxml 和各个平台的模块。
+
+第三方平台可以通过 entry point 注册，不需要修改这里:
+
+    [options.entry_points]
+    spider.platforms =
+        LOJ = mypackage.loj            # 模块中的 LOJ 和 AsyncLOJ
+        UOJ = mypackage.uoj:UniversalOJ  # 模块中的 UniversalOJ 和 AsyncUniversalOJ
+"""
+import importlib
+import threading
+
+ENTRY_POINT_GROUP = 'spider.platforms'
+
+# 内置平台: 平台名 -> 模块，同步版本的类名为平台名，异步版本为 Async + 平台名
+builtin = {
+    'Aizu': 'spider.platforms.aizu',
+    'Codeforces': 'spider.platforms.codeforces',
+    'HDU': 'spider.platforms.hdu',
+    'POJ': 'spider.platforms.poj',
+    'WUST': 'spider.platforms.wust',
+    'ZOJ': 'spider.platforms.zoj',
+}
+
+
+class PlatformRegistry(object):
+    """
+    :param modules: {平台名: 模块路径 或 '模块路径:类名'}
+    :param group: entry point 的分组，为空表示不查找 entry point
+    """
+
+    def __init__(self, modules=None, group=ENTRY_POINT_GROUP):
+        self._modules = dict(modules or {})
+        self._group = group
+        self._discovered = group is None
+        self._classes = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, target):
+        """
+        注册一个平台，target 可以是模块路径、'模块路径:类名' 或者平台类本身
+        """
+        with self._lock:
+            self._modules[name] = target
+            self._classes.pop((name, False), None)
+            self._classes.pop((name, True), None)
+
+    # 只在第一次需要的时候扫描 entry point，已经注册的名字优先
+    def _discover(self):
+        if self._discovered:
+            return
+        from importlib.metadata import entry_points
+        try:
+            found = entry_points(group=self._group)
+        except TypeError:
+            found = entry_points().get(self._group, [])
+        for entry_point in found:
+            self._modules.setdefault(entry_point.name, entry_point.value)
+        self._discovered = True
+
+    def names(self):
+        with self._lock:
+            self._discover()
+            return sorted(self._modules)
+
+    def get(self, name, asynchronous=False):
+        """
+        返回平台类，没有注册的名字按原来的规则导入 spider.platforms.<小写的平台名>。
+        模块不存在的时候抛出 ModuleNotFoundError，模块中没有这个类的时候返回 None
+        """
+        key = (name, asynchronous)
+        cls = self._classes.get(key)
+        if cls is not None:
+            return cls
+        with self._lock:
+            if key not in self._classes:
+                if name not in self._modules:
+                    self._discover()
+                self._classes[key] = self._load(name, self._modules.get(name), asynchronous)
+            return self._classes[key]
+
+    @staticmethod
+    def _load(name, target, asynchronous):
+        if isinstance(target, type):
+            if asynchronous:
+                return getattr(importlib.import_module(target.__module__), f'Async{target.__name__}', None)
+            return target
+        module_name, _, class_name = (target or f'spider.platforms.{str(name).lower()}').partition(':')
+        class_name = class_name or name
+        module = importlib.import_module(module_name)
+        return getattr(module, f'Async{class_name}' if asynchronous else class_name, None)
+
+
+registry = PlatformRegistry(builtin)
@@ -4,13 +4,19 @@ import time
 
 from bs4 import BeautifulSoup
 from bs4 import element
+from lxml import etree
 
-from spider.platforms.base import Base, BaseParser
+from spider.parser_backend import add_class, html_tree, node_text, to_html, update_element
+from spider.platforms.base import AsyncBase, Base, BaseParser
 from spider.config import Problem, Result
-from spider.utils import HtmlTag, HttpUtil
+from spider.utils import AsyncHttpUtil, HtmlTag, HttpUtil
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
+# lxml 后端用到的 XPath
+_problem_title = etree.XPath('(//h1)[1]')
+_problem_body = etree.XPath('/html/body')
+
 
 class AizuParser(BaseParser):
 
@@ -53,14 +59,22 @@ class AizuParser(BaseParser):
             problem.status = Problem.Status.STATUS_RETRYABLE
             return problem
         site_data = json.loads(website_data)
-        soup = BeautifulSoup(site_data.get('html'), 'lxml')
-        problem.title = str(soup.find('h1').get_text())
         problem.time_limit = str(site_data.get('time_limit')) + ' sec'
         problem.memory_limit = str(site_data.get('memory_limit')) + ' KB'
         problem.special_judge = False
 
-        problem.html = ''
+        if self.use_lxml():
+            problem.title, problem.html = self._lxml_problem_html(site_data.get('html'))
+        else:
+            problem.title, problem.html = self._problem_html(site_data.get('html'))
+        problem.html += self._script
+        problem.status = Problem.Status.STATUS_SUCCESS
+        return problem
 
+    def _problem_html(self, description):
+        html = ''
+        soup = BeautifulSoup(description, 'lxml')
+        title = str(soup.find('h1').get_text())
         for tag in soup.body:
             if type(tag) == element.Tag and tag.name in ['p', 'h2', 'pre', 'center']:
                 if not tag.get('class'):
@@ -71,10 +85,25 @@ class AizuParser(BaseParser):
                 else:
                     tag['style'] = HtmlTag.TagStyle.CONTENT.value
                     tag['class'] += (HtmlTag.TagDesc.CONTENT.value,)
-                problem.html += str(HtmlTag.update_tag(tag, self._static_prefix))
-        problem.html += self._script
-        problem.status = Problem.Status.STATUS_SUCCESS
-        return problem
+                html += str(HtmlTag.update_tag(tag, self._static_prefix))
+        return title, html
+
+    def _lxml_problem_html(self, description):
+        html = ''
+        root = html_tree(description)
+        title = _problem_title(root)
+        title = node_text(title[0]) if title else None
+        body = _problem_body(root)
+        for tag in body[0] if body else []:
+            if tag.tag in ['p', 'h2', 'pre', 'center']:
+                if tag.tag == 'h2':
+                    tag.set('style', HtmlTag.TagStyle.TITLE.value)
+                    add_class(tag, HtmlTag.TagDesc.TITLE.value)
+                else:
+                    tag.set('style', HtmlTag.TagStyle.CONTENT.value)
+                    add_class(tag, HtmlTag.TagDesc.CONTENT.value)
+                html += to_html(update_element(tag, self._static_prefix))
+        return title, html
 
     def result_parse(self, response):
         result = Result()
@@ -95,6 +124,14 @@ class AizuParser(BaseParser):
 
 
 class Aizu(Base):
+    # 提交记录要过几秒才会出现在 submission_records 里
+    result_delay = 5
+    # 本机和源OJ的时钟允许相差的秒数，见 recent_run_id
+    clock_skew = 2
+    volatile_patterns = (r'"server_time": *\d+',)
+    parser_class = AizuParser
+    login_check_url = 'https://judgeapi.u-aizu.ac.jp/self'
+    working_url = 'https://judgeapi.u-aizu.ac.jp/categories'
 
     def __init__(self, *args, **kwargs):
         self._headers = {'Content-Type': 'application/json'}
@@ -120,66 +157,78 @@ class Aizu(Base):
             self._req.cookies.update(account.cookies)
         if self.is_login():
             return True
-        login_link_url = 'https://judgeapi.u-aizu.ac.jp/session'
+        self._req.post(**self.login_request(account))
+        return self.is_login()
+
+    @staticmethod
+    def login_request(account):
         post_data = {
             'id': account.username,
             'password': account.password
         }
-        self._req.post(url=login_link_url, json=post_data)
-        return self.is_login()
-
-    # 检查登录状态
-    def is_login(self):
-        url = 'https://judgeapi.u-aizu.ac.jp/self'
-        res = self._req.get(url)
-        if res and res.status_code == 200:
-            return True
-        return False
+        return {'url': 'https://judgeapi.u-aizu.ac.jp/session', 'json': post_data}
 
     def account_required(self):
         return False
 
-    # 获取题目
-    def get_problem(self, pid, account=None):
-        url = f'https://judgeapi.u-aizu.ac.jp/resources/descriptions/en/{pid}'
-        show_url = f'http://judge.u-aizu.ac.jp/onlinejudge/description.jsp?id={pid}'
-        res = self._req.get(url)
-        return AizuParser().problem_parse(res, pid, show_url)
+    @staticmethod
+    def problem_url(pid):
+        return f'http://judge.u-aizu.ac.jp/onlinejudge/description.jsp?id={pid}'
+
+    def problem_source_url(self, pid):
+        return f'https://judgeapi.u-aizu.ac.jp/resources/descriptions/en/{pid}'
 
     # 提交代码
     def submit_code(self, account, pid, language, code):
         if not self.login_website(account):
             return Result(Result.Status.STATUS_SPIDER_ERROR)
-        url = 'https://judgeapi.u-aizu.ac.jp/submissions'
-
-        res = self._req.post(url, json={'problemId': str(pid), 'language': str(language),
-                                        'sourceCode': str(code)})
+        since = time.time()
+        res = self._req.post(**self.submit_request(pid, language, code))
         if res and res.status_code == 200:
-            return Result(Result.Status.STATUS_SUBMIT_SUCCESS)
+            result = Result(Result.Status.STATUS_SUBMIT_SUCCESS)
+            result.unique_key = self.recent_run_id(self._req.get(self.result_url(account, pid)), since)
+            return result
         return Result(Result.Status.STATUS_SUBMIT_ERROR)
 
+    @staticmethod
+    def submit_request(pid, language, code):
+        return {'url': 'https://judgeapi.u-aizu.ac.jp/submissions',
+                'json': {'problemId': str(pid), 'language': str(language), 'sourceCode': str(code)}}
+
     # 获取当然运行结果
     def get_result(self, account, pid):
-        url = 'https://judgeapi.u-aizu.ac.jp/submission_records/users/' + str(account.username) + '/problems/' + pid
-
-        time.sleep(3)
-        res = self._req.get(url)
-        if res is None or res.status_code != 200:
+        url = self.latest_verdict_url(self._req.get(self.result_url(account, pid)))
+        if url is None:
             return Result(Result.Status.STATUS_RESULT_ERROR)
-
-        recent_list = json.loads(res.text)
-        url = 'https://judgeapi.u-aizu.ac.jp/verdicts/' + str(recent_list[0].get('judgeId'))
         return self.get_result_by_url(url)
 
-    # 根据源OJ的运行id获取结构
-    def get_result_by_rid_and_pid(self, rid, pid):
-        url = 'https://judgeapi.u-aizu.ac.jp/verdicts/' + str(rid)
-        return self.get_result_by_url(url)
+    def result_url(self, account, pid):
+        return 'https://judgeapi.u-aizu.ac.jp/submission_records/users/' + str(account.username) + '/problems/' + pid
 
-    # 根据源OJ的url获取结果
-    def get_result_by_url(self, url):
-        res = self._req.get(url)
-        return AizuParser().result_parse(res)
+    # submission_records 中最新一条提交的结果地址，请求失败或者还没有提交记录的时候返回 None
+    def latest_verdict_url(self, response):
+        if response is None or response.status_code != 200:
+            return None
+        recent_list = json.loads(response.text)
+        if not recent_list:
+            return None
+        return self.rid_url(recent_list[0].get('judgeId'), None)
+
+    def rid_url(self, rid, pid):
+        return 'https://judgeapi.u-aizu.ac.jp/verdicts/' + str(rid)
+
+    # 提交接口只返回 token，没有运行id。提交之后查询一次 submission_records，最新一条的提交时间不早于这次提交
+    # (允许 clock_skew 秒的时钟误差) 才是这次提交；记录还没有出现、查询失败的时候返回 None，仍然按 账号 + 题号 查询
+    def recent_run_id(self, response, since):
+        if response is None or response.status_code != 200:
+            return None
+        try:
+            records = json.loads(response.text)
+        except ValueError:
+            return None
+        if not records or records[0].get('submissionDate', 0) / 1000 < since - self.clock_skew:
+            return None
+        return str(records[0].get('judgeId'))
 
     # 获取源OJ支持的语言类型
     def find_language(self, account):
@@ -187,15 +236,6 @@ class Aizu(Base):
                'Scala', 'Haskell', 'OCaml', 'PHP', 'Kotlin']
         return {item: item for item in vec}
 
-    # 检查源OJ是否运行正常
-
-    def is_working(self):
-        url = 'https://judgeapi.u-aizu.ac.jp/categories'
-        res = self._req.get(url)
-        if res and res.status_code == 200:
-            return True
-        return False
-
     @staticmethod
     def is_accepted(verdict):
         return verdict == 'Accepted'
@@ -209,6 +249,42 @@ class Aizu(Base):
         return verdict == 'Compile Error'
 
 
+class AsyncAizu(AsyncBase, Aizu):
+
+    def __init__(self, *args, **kwargs):
+        self._headers = {'Content-Type': 'application/json'}
+
+        self._req = AsyncHttpUtil(headers=self._headers, *args, **kwargs)
+
+    async def login_website(self, account):
+        if account and account.cookies:
+            self._req.cookies.update(account.cookies)
+        if await self.is_login():
+            return True
+        await self._req.post(**self.login_request(account))
+        return await self.is_login()
+
+    async def submit_code(self, account, pid, language, code):
+        if not await self.login_website(account):
+            return Result(Result.Status.STATUS_SPIDER_ERROR)
+        since = time.time()
+        res = await self._req.post(**self.submit_request(pid, language, code))
+        if res and res.status_code == 200:
+            result = Result(Result.Status.STATUS_SUBMIT_SUCCESS)
+            result.unique_key = self.recent_run_id(await self._req.get(self.result_url(account, pid)), since)
+            return result
+        return Result(Result.Status.STATUS_SUBMIT_ERROR)
+
+    async def get_result(self, account, pid):
+        url = self.latest_verdict_url(await self._req.get(self.result_url(account, pid)))
+        if url is None:
+            return Result(Result.Status.STATUS_RESULT_ERROR)
+        return await self.get_result_by_url(url)
+
+    async def find_language(self, account):
+        return Aizu.find_language(self, account)
+
+
 """
 # values of submission status
 STATE_COMPILEERROR = 0
@@ -1,12 +1,109 @@
+import functools
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from spider.log import logger
+from spider.metrics import metrics
+from spider.parser_backend import BACKEND_LXML, get_default_backend
+from spider.session import shared_login
+from spider.tracing import stage
+
+
+def _timed(platform, name, func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not metrics.active:
+            return func(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            metrics.record_parse(platform, name, time.perf_counter() - start)
+
+    return wrapper
+
+
 class BaseParser(object):
+    # 解析时只构建这些节点，跳过导航栏、脚本等无关部分，为空表示构建整个页面
+    problem_strainer = None
+    result_strainer = None
+    # 解析后端，'bs4' 或者 'lxml'，为空的时候使用 spider.parser_backend 中的全局设置
+    backend = None
+    # 状态页中 (运行id, 用户名, 题号) 所在的列，为空表示不支持 submitted_run_id
+    run_id_columns = None
+
+    # 子类的解析方法自动记录耗时，包括把响应解码成文本的时间，平台名为类名去掉 Parser
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        platform = cls.__name__[:-len('Parser')] if cls.__name__.endswith('Parser') else cls.__name__
+        for name in ('problem_parse', 'result_parse', 'result_list_parse'):
+            if name in cls.__dict__:
+                setattr(cls, name, _timed(platform, name, cls.__dict__[name]))
+
+    def use_lxml(self):
+        return (self.backend or get_default_backend()) == BACKEND_LXML
+
     def problem_parse(self, response, pid, url):
         pass
 
     def result_parse(self, response):
         pass
 
+    # 解析状态页中的每一行，返回 Result 列表，请求失败或者不是状态页的时候返回 None
+    def result_list_parse(self, response):
+        pass
+
+    # 状态页中每一行的单元格，请求失败或者不是状态页的时候返回 None
+    def status_lines(self, response):
+        pass
+
+    def submitted_run_id(self, response, username, pid):
+        """
+        状态页 (最新的在最前面) 中这个账号在这道题上最靠前的一行的运行id，没有的时候返回 None
+        """
+        if self.run_id_columns is None:
+            return None
+        rid, user, problem = self.run_id_columns
+        for line in self.status_lines(response) or ():
+            if len(line) > max(self.run_id_columns) and line[user].get_text().strip() == username \
+                    and line[problem].get_text().strip() == str(pid):
+                return line[rid].get_text().strip()
+        return None
+
 
 class Base(object):
+    # 提交之后至少等待多少秒才能在源OJ查到这次提交
+    result_delay = 2
+    # 状态页每页显示的提交数，为空表示不支持 get_result_page
+    status_page_size = None
+    # 题面所在区域的正则，第一个分组用来计算题面指纹 (spider.store.statement_hash)，为空的时候使用整个页面
+    statement_pattern = None
+    # 题面区域中每次请求都可能变化的部分，比如提交数、服务器时间，计算指纹之前去掉
+    volatile_patterns = ()
+
+    # 下面的地址、正则和解析器由同步版本和 Async 版本共用，Base 和 AsyncBase 中的默认实现只负责发请求，
+    # 平台只需要覆盖登录、提交这类多步的流程
+    parser_class = BaseParser
+    # is_login 请求的页面和其中表示已经登录的正则，正则为空的时候只检查状态码
+    login_check_url = None
+    login_check_pattern = None
+    # is_working 请求的页面和其中表示源OJ正常的正则
+    working_url = None
+    working_pattern = None
+    # find_language 请求的页面和语言下拉框的 name
+    language_url = None
+    language_field = 'language'
+
+    # 提交的 trace 中把登录检查单独记录为 login，开启了 spider.session 的时候多个进程共用同一次登录，
+    # 平台名为类名去掉 Async
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'login_website' in cls.__dict__:
+            platform = cls.__name__[len('Async'):] if cls.__name__.startswith('Async') else cls.__name__
+            cls.login_website = stage('login')(shared_login(platform, cls.__dict__['login_website']))
+
     # 主页链接
     @staticmethod
     def home_page_url():
@@ -24,42 +121,113 @@ class Base(object):
 
     # 检查登录状态
     def is_login(self):
+        if self._req.login_state.is_fresh():
+            return True
+        return self.check_login(self._req.get(self.login_check_url))
+
+    def check_login(self, response):
+        if not self._page_matches(response, self.login_check_pattern):
+            return False
+        self._req.login_state.mark()
+        return True
+
+    @staticmethod
+    def _page_matches(response, pattern):
+        if response is None or response.status_code != 200:
+            return False
+        return pattern is None or re.search(pattern, response.text) is not None
+
+    # 题目的链接
+    @staticmethod
+    def problem_url(pid):
         pass
 
+    # 下载题面时请求的地址，默认和 problem_url 相同，为空表示题号无效
+    def problem_source_url(self, pid):
+        return self.problem_url(pid)
+
     # 获取题目
-    def get_problem(self, pid, account):
-        pass
+    def get_problem(self, pid, account=None):
+        return self.parse_problem(self.fetch_problem(pid), pid)
+
+    # 下载题面，headers 用于附加条件请求的头部
+    def fetch_problem(self, pid, headers=None):
+        url = self.problem_source_url(pid)
+        return self._req.get(url, headers=headers) if url else None
+
+    # 解析 fetch_problem 得到的响应
+    def parse_problem(self, response, pid):
+        return self.parser_class().problem_parse(response, pid, self.problem_url(pid))
 
     # 提交代码
     def submit_code(self, account, pid, language, code):
         pass
 
+    # 提交之后取这次提交的运行id，记在 unique_key 中，之后直接用 get_result_by_rid_and_pid 查询。
+    # HDU、POJ、ZOJ、WUST 提交成功之后跳转到状态页 (最新的在最前面)，这个账号在这道题上最靠前的一行就是这次提交，
+    # 不需要再请求。没有跳转 (提交被拒绝，停在原来的页面)、这一行已经被挤出第一页或者不是状态页的时候 unique_key 保持为空，
+    # 仍然按 账号 + 题号 查询。同一个账号同时提交同一道题的时候会认错，见 spider.pool.AccountPool
+    def capture_run_id(self, result, response, account, pid):
+        if response is None or not response.history:
+            return result
+        try:
+            result.unique_key = self.parser_class().submitted_run_id(response, account.username, pid)
+        except Exception as e:
+            logger.exception(e)
+        return result
+
     # 抓取题目是否需要登录账号
     def account_required(self):
         pass
 
+    # 按 账号 + 题号 查询的状态页，最新的一条在最前面
+    def result_url(self, account, pid):
+        pass
+
+    # 只包含这个运行id的结果的页面
+    def rid_url(self, rid, pid):
+        pass
+
+    # 运行id不大于 rid 的一页状态
+    def page_url(self, rid):
+        pass
+
     # 获取当然运行结果
     def get_result(self, account, pid):
-        pass
+        return self.get_result_by_url(self.result_url(account, pid))
 
     # 根据源OJ的运行id获取结构
     def get_result_by_rid_and_pid(self, rid, pid):
-        pass
+        return self.get_result_by_url(self.rid_url(rid, pid))
 
     # 根据源OJ的url获取结果
     def get_result_by_url(self, url):
-        pass
+        return self.parser_class().result_parse(self._req.get(url))
+
+    # 一次获取状态页中运行id不大于 rid 的一页结果，请求失败的时候返回 None
+    def get_result_page(self, rid):
+        return self.parser_class().result_list_parse(self._req.get(self.page_url(rid)))
 
     # 获取源OJ支持的语言类型
     def find_language(self, account):
-        pass
+        if self.login_website(account) is False:
+            return {}
+        return self.parse_languages(self._req.get(self.language_url))
 
-    # 检查源OJ是否运行正常
+    def parse_languages(self, response):
+        languages = {}
+        if response is None:
+            return languages
+        select = BeautifulSoup(response.text, 'lxml').find('select', attrs={'name': self.language_field})
+        for option in select.find_all('option') if select else ():
+            languages[option.get('value')] = option.string
+        return languages
 
+    # 检查源OJ是否运行正常
     def is_working(self):
-        pass
+        return self._page_matches(self._req.get(self.working_url), self.working_pattern)
 
-    #  判断结果是否正确
+    #  判断结果是否正确
     @staticmethod
     def is_accepted(verdict):
         pass
@@ -73,3 +241,45 @@ class Base(object):
     @staticmethod
     def is_running(verdict):
         pass
+
+
+class AsyncBase(Base):
+    """
+    异步版本的默认实现，和 Base 中的同名方法一一对应，只是请求换成了 AsyncHttpUtil。
+    异步的平台类写成 class AsyncHDU(AsyncBase, HDU)，地址、表单和解析直接用同步类中的
+    """
+
+    async def close(self):
+        await self._req.close()
+
+    async def is_login(self):
+        if self._req.login_state.is_fresh():
+            return True
+        return self.check_login(await self._req.get(self.login_check_url))
+
+    async def get_problem(self, pid, account=None):
+        return self.parse_problem(await self.fetch_problem(pid), pid)
+
+    async def fetch_problem(self, pid, headers=None):
+        url = self.problem_source_url(pid)
+        return await self._req.get(url, headers=headers) if url else None
+
+    async def get_result(self, account, pid):
+        return await self.get_result_by_url(self.result_url(account, pid))
+
+    async def get_result_by_rid_and_pid(self, rid, pid):
+        return await self.get_result_by_url(self.rid_url(rid, pid))
+
+    async def get_result_by_url(self, url):
+        return self.parser_class().result_parse(await self._req.get(url))
+
+    async def get_result_page(self, rid):
+        return self.parser_class().result_list_parse(await self._req.get(self.page_url(rid)))
+
+    async def find_language(self, account):
+        if await self.login_website(account) is False:
+            return {}
+        return self.parse_languages(await self._req.get(self.language_url))
+
+    async def is_working(self):
+        return self._page_matches(await self._req.get(self.working_url), self.working_pattern)
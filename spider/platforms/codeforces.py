@@ -1,14 +1,33 @@
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4 import element
+from lxml import etree
 
 from spider.config import Problem, Result
-from spider.platforms.base import Base, BaseParser
-from spider.utils import HtmlTag, HttpUtil, logger
+from spider.parser_backend import (Node, add_class, child_nodes, has_class, html_tree, is_element, node_string,
+                                   to_html, update_element)
+from spider.platforms.base import AsyncBase, Base, BaseParser
+from spider.tracing import stage
+from spider.utils import AsyncHttpUtil, HtmlTag, HttpUtil, logger
+
+_statement = has_class('problem-statement')
+# lxml 后端用到的 XPath
+_problem_statement = etree.XPath(f'(//div[{_statement}])[1]')
+_problem_title = etree.XPath(f"(//div[{_statement}]/descendant-or-self::div[{has_class('title')}])[1]")
+_problem_time_limit = etree.XPath(f"(//div[{_statement}]/descendant-or-self::div[{has_class('time-limit')}])[1]")
+_problem_memory_limit = etree.XPath(
+    f"(//div[{_statement}]/descendant-or-self::div[{has_class('memory-limit')}])[1]")
+_submission_rows = etree.XPath('(//table)[1]//tr')
+_cells = etree.XPath('.//td')
+# 提交之后跳转到的 /problemset/status?my=on 中的一行
+_status_row = re.compile(r'<tr[^>]*\sdata-submission-id="(\d+)"[\s\S]*?</tr>')
 
 
 class CodeforcesParser(BaseParser):
+    problem_strainer = SoupStrainer('div', attrs={'class': 'problem-statement'})
+    result_strainer = SoupStrainer('table')
+
     def __init__(self):
         self._static_prefix = 'http://codeforces.com/'
         self._script = """
@@ -50,7 +69,16 @@ MathJax.Hub.Config({
             problem.status = Problem.Status.STATUS_RETRYABLE
             return problem
         website = response.text
-        soup = BeautifulSoup(website, 'lxml')
+        if self.use_lxml():
+            self._lxml_statement_parse(problem, website)
+        else:
+            self._statement_parse(problem, website)
+        problem.html = '<html>' + problem.html + self._script + '</html>'
+        problem.status = Problem.Status.STATUS_SUCCESS
+        return problem
+
+    def _statement_parse(self, problem, website):
+        soup = BeautifulSoup(website, 'lxml', parse_only=self.problem_strainer)
         match_groups = soup.find('div', attrs={'class': 'title'})
         if match_groups:
             problem.title = match_groups.string
@@ -82,37 +110,89 @@ MathJax.Hub.Config({
                     problem.html += str(HtmlTag.update_tag(child, self._static_prefix))
                 else:
                     problem.html += str(HtmlTag.update_tag(child, self._static_prefix))
-        problem.html = '<html>' + problem.html + self._script + '</html>'
-        problem.status = Problem.Status.STATUS_SUCCESS
-        return problem
+
+    @staticmethod
+    def _last_child(node):
+        children = list(child_nodes(node))
+        if not children:
+            return None
+        if isinstance(children[-1], str):
+            return children[-1]
+        return to_html(children[-1]) if is_element(children[-1]) else children[-1].text
+
+    def _lxml_statement_parse(self, problem, website):
+        root = html_tree(website)
+        match_groups = _problem_title(root)
+        if match_groups:
+            problem.title = str(node_string(match_groups[0]))[2:]
+        match_groups = _problem_time_limit(root)
+        if match_groups:
+            problem.time_limit = self._last_child(match_groups[0])
+        match_groups = _problem_memory_limit(root)
+        if match_groups:
+            problem.memory_limit = self._last_child(match_groups[0])
+        match_groups = _problem_statement(root)
+        problem.html = ''
+        if not match_groups:
+            return
+        for child in child_nodes(match_groups[0]):
+            if isinstance(child, str):
+                problem.html += child
+            elif not is_element(child):
+                problem.html += child.text or ''
+            elif 'header' not in (child.get('class') or '').split():
+                for tag in child:
+                    if not is_element(tag):
+                        continue
+                    if 'section-title' in (tag.get('class') or '').split():
+                        add_class(tag, HtmlTag.TagDesc.TITLE.value)
+                        tag.set('style', HtmlTag.TagStyle.TITLE.value)
+                    else:
+                        add_class(tag, HtmlTag.TagDesc.CONTENT.value)
+                        tag.set('style', HtmlTag.TagStyle.CONTENT.value)
+                problem.html += to_html(update_element(child, self._static_prefix))
 
     def result_parse(self, response):
         if response is None or response.status_code != 200 or response.text is None:
             return Result(Result.Status.STATUS_RESULT_ERROR)
-        soup = BeautifulSoup(response.text, 'lxml')
-        table = soup.find('table')
-        tag = None
-        if table:
-            tag = table.find_all('tr')
-        if tag:
-            children_tag = tag[-1].find_all('td')
-            if len(children_tag) > 9:
-                result = Result()
-                result.unique_key = children_tag[0].string
-                result.verdict_info = ''
-                for item in children_tag[4].stripped_strings:
-                    result.verdict_info += str(item) + ' '
-                result.verdict_info = result.verdict_info.strip(' ')
-                result.execute_time = children_tag[5].string
-                result.execute_memory = children_tag[6].string
-                result.status = Result.Status.STATUS_RESULT_SUCCESS
-                return result
+        children_tag = []
+        if self.use_lxml():
+            tag = _submission_rows(html_tree(response.text))
+            if tag:
+                children_tag = [Node(td) for td in _cells(tag[-1])]
+        else:
+            soup = BeautifulSoup(response.text, 'lxml', parse_only=self.result_strainer)
+            table = soup.find('table')
+            tag = None
+            if table:
+                tag = table.find_all('tr')
+            if tag:
+                children_tag = tag[-1].find_all('td')
+        if len(children_tag) > 9:
+            result = Result()
+            result.unique_key = children_tag[0].string
+            result.verdict_info = ''
+            for item in children_tag[4].stripped_strings:
+                result.verdict_info += str(item) + ' '
+            result.verdict_info = result.verdict_info.strip(' ')
+            result.execute_time = children_tag[5].string
+            result.execute_memory = children_tag[6].string
+            result.status = Result.Status.STATUS_RESULT_SUCCESS
+            return result
         return Result(Result.Status.STATUS_RESULT_ERROR)
 
 
 class Codeforces(Base):
+    statement_pattern = r'(<div class="problem-statement">[\s\S]*?)<div id="footer">'
+    parser_class = CodeforcesParser
+    login_check_url = 'http://codeforces.com'
+    login_check_pattern = r'logout">Logout</a>'
+    working_url = 'http://codeforces.com'
+    language_url = 'http://codeforces.com/problemset/submit'
+    language_field = 'programTypeId'
+
     def __init__(self, *args, **kwargs):
-        self._req = HttpUtil(*args, **kwargs)
+        self._req = HttpUtil(login_pattern=r'codeforces\.com/enter', *args, **kwargs)
 
     # 主页链接
     @staticmethod
@@ -132,55 +212,70 @@ class Codeforces(Base):
             return True
         try:
             res = self._req.get('http://codeforces.com/enter?back=%2F')
-
-            soup = BeautifulSoup(res.text, 'lxml')
-            csrf_token = soup.find(attrs={'name': 'X-Csrf-Token'}).get('content')
-            post_data = {
-                'csrf_token': csrf_token,
-                'action': 'enter',
-                'ftaa': '',
-                'bfaa': '',
-                'handleOrEmail': account.username,
-                'password': account.password,
-                'remember': []
-            }
-            self._req.post(url='http://codeforces.com/enter', data=post_data)
+            self._req.post(**self.login_request(res, account))
         except Exception as e:
             logger.exception(e)
         return self.is_login()
 
-    # 检查登录状态
-    def is_login(self):
-        res = self._req.get('http://codeforces.com')
-        if res and re.search(r'logout">Logout</a>', res.text):
-            return True
-        return False
+    @staticmethod
+    def csrf_token(response):
+        soup = BeautifulSoup(response.text, 'lxml')
+        return soup.find(attrs={'name': 'X-Csrf-Token'}).get('content')
+
+    @classmethod
+    def login_request(cls, enter_page, account):
+        post_data = {
+            'csrf_token': cls.csrf_token(enter_page),
+            'action': 'enter',
+            'ftaa': '',
+            'bfaa': '',
+            'handleOrEmail': account.username,
+            'password': account.password,
+            'remember': []
+        }
+        return {'url': 'http://codeforces.com/enter', 'data': post_data}
 
     def account_required(self):
         return False
 
-    # 获取题目
-    def get_problem(self, pid, account=None):
+    @staticmethod
+    def problem_url(pid):
+        return 'http://codeforces.com/contest/' + str(pid)[:-1] + '/problem/' + str(pid)[-1]
+
+    # 题号由比赛编号和一个字母组成，比如 1000A
+    @staticmethod
+    def is_valid_pid(pid):
+        return not (len(str(pid)) < 2 or str(pid)[-1].isalpha() is False or str(pid)[:-1].isnumeric() is False)
 
-        if len(str(pid)) < 2 or str(pid)[-1].isalpha() is False or str(pid)[:-1].isnumeric() is False:
+    def problem_source_url(self, pid):
+        return self.problem_url(pid) if Codeforces.is_valid_pid(pid) else None
+
+    def parse_problem(self, response, pid):
+        if not Codeforces.is_valid_pid(pid):
             problem = Problem()
             problem.remote_oj = Codeforces.__name__
             problem.remote_id = pid
             problem.status = Problem.Status.STATUS_ERROR
             return problem
-        p_url = 'http://codeforces.com/contest/' + str(pid)[:-1] + '/problem/' + str(pid)[-1]
-        res = self._req.get(url=p_url)
-        return CodeforcesParser().problem_parse(res, pid, p_url)
+        return CodeforcesParser().problem_parse(response, pid, self.problem_url(pid))
 
     # 提交代码
     def submit_code(self, account, pid, language, code):
         if not self.login_website(account):
             return Result(Result.Status.STATUS_SPIDER_ERROR)
-        res = self._req.get('http://codeforces.com/problemset/submit')
-        if res is None:
-            return Result(Result.Status.STATUS_SPIDER_ERROR)
-        soup = BeautifulSoup(res.text, 'lxml')
-        csrf_token = soup.find(attrs={'name': 'X-Csrf-Token'}).get('content')
+        with stage('form'):
+            res = self._req.get('http://codeforces.com/problemset/submit')
+            if res is None:
+                return Result(Result.Status.STATUS_SPIDER_ERROR)
+            request = self.submit_request(res, pid, language, code)
+        res = self._req.post(**request)
+        if res and res.status_code == 200:
+            return self.attach_run_id_from_status(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res.text, pid)
+        return Result(Result.Status.STATUS_SUBMIT_ERROR)
+
+    @classmethod
+    def submit_request(cls, submit_page, pid, language, code):
+        csrf_token = cls.csrf_token(submit_page)
         post_data = {
             'csrf_token': csrf_token,
             'ftaa': '',
@@ -192,58 +287,47 @@ class Codeforces(Base):
             'tabSize': 0,
             'sourceFile': '',
         }
-        res = self._req.post('http://codeforces.com/problemset/submit?csrf_token=' + csrf_token, data=post_data)
-        if res and res.status_code == 200:
-            return Result(Result.Status.STATUS_SUBMIT_SUCCESS)
-        return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        return {'url': 'http://codeforces.com/problemset/submit?csrf_token=' + csrf_token, 'data': post_data}
+
+    # 提交成功之后跳转到自己的提交列表，最新的一条是这个题目的提交就取它的运行id，不需要再请求一次
+    @staticmethod
+    def attach_run_id_from_status(result, text, pid):
+        pid = str(pid)
+        contest, index = pid[:-1], pid[-1:]
+        links = (f'/contest/{contest}/problem/{index}"', f'/problemset/problem/{contest}/{index}"')
+        match = _status_row.search(text or '')
+        if match and any(link in match.group(0) for link in links):
+            result.unique_key = match.group(1)
+        return result
 
     # 获取当然运行结果
     def get_result(self, account, pid):
         if self.login_website(account) is False:
             return Result(Result.Status.STATUS_RESULT_ERROR)
-        request_url = 'http://codeforces.com/problemset/status?friends=on'
-        res = self._req.get(request_url)
-        website_data = res.text
-        if website_data:
-            soup = BeautifulSoup(website_data, 'lxml')
-            tag = soup.find('table', attrs={'class': 'status-frame-datatable'})
-            if tag:
-                list_tr = tag.find_all('tr')
-                for tr in list_tr:
-                    if isinstance(tr, element.Tag) and tr.get('data-submission-id'):
-                        return self.get_result_by_url(
-                            'http://codeforces.com/contest/' + pid[:-1] + '/submission/' + tr.get('data-submission-id'))
-        return Result(Result.Status.STATUS_RESULT_ERROR)
+        url = self.latest_submission_url(self._req.get(self.result_url(account, pid)), pid)
+        if url is None:
+            return Result(Result.Status.STATUS_RESULT_ERROR)
+        return self.get_result_by_url(url)
 
-    # 根据源OJ的运行id获取结构
-    def get_result_by_rid_and_pid(self, rid, pid):
-        return self.get_result_by_url('http://codeforces.com/contest/' + str(pid)[:-1] + '/submission/' + str(rid))
+    def result_url(self, account, pid):
+        return 'http://codeforces.com/problemset/status?friends=on'
 
-    # 根据源OJ的url获取结果
-    def get_result_by_url(self, url):
-        res = self._req.get(url=url)
-        return CodeforcesParser().result_parse(response=res)
+    # 状态页中第一条提交的结果地址
+    def latest_submission_url(self, response, pid):
+        if response is None or not response.text:
+            return None
+        soup = BeautifulSoup(response.text, 'lxml')
+        tag = soup.find('table', attrs={'class': 'status-frame-datatable'})
+        for tr in tag.find_all('tr') if tag else ():
+            if isinstance(tr, element.Tag) and tr.get('data-submission-id'):
+                return self.rid_url(tr.get('data-submission-id'), pid)
+        return None
 
-    # 获取源OJ支持的语言类型
-    def find_language(self, account):
-        if self.login_website(account) is False:
-            return {}
-        res = self._req.get('http://codeforces.com/problemset/submit')
-        website_data = res.text
-        languages = {}
-        if website_data:
-            soup = BeautifulSoup(website_data, 'lxml')
-            tags = soup.find('select', attrs={'name': 'programTypeId'})
-            if tags:
-                for child in tags.find_all('option'):
-                    languages[child.get('value')] = child.string
-        return languages
-
-    # 检查源OJ是否运行正常
-    def is_working(self):
-        return self._req.get('http://codeforces.com').status_code == 200
-
-    #  判断结果是否正确
+    # 根据源OJ的运行id获取结构
+    def rid_url(self, rid, pid):
+        return 'http://codeforces.com/contest/' + str(pid)[:-1] + '/submission/' + str(rid)
+
+    #  判断结果是否正确
     @staticmethod
     def is_accepted(verdict):
         return verdict in ['Accepted', 'Happy New Year!']
@@ -257,3 +341,39 @@ class Codeforces(Base):
     @staticmethod
     def is_running(verdict):
         return str(verdict).startswith('Running on test') or verdict == 'In queue'
+
+
+class AsyncCodeforces(AsyncBase, Codeforces):
+    def __init__(self, *args, **kwargs):
+        self._req = AsyncHttpUtil(login_pattern=r'codeforces\.com/enter', *args, **kwargs)
+
+    async def login_website(self, account):
+        if await self.is_login():
+            return True
+        try:
+            res = await self._req.get('http://codeforces.com/enter?back=%2F')
+            await self._req.post(**self.login_request(res, account))
+        except Exception as e:
+            logger.exception(e)
+        return await self.is_login()
+
+    async def submit_code(self, account, pid, language, code):
+        if not await self.login_website(account):
+            return Result(Result.Status.STATUS_SPIDER_ERROR)
+        with stage('form'):
+            res = await self._req.get('http://codeforces.com/problemset/submit')
+            if res is None:
+                return Result(Result.Status.STATUS_SPIDER_ERROR)
+            request = self.submit_request(res, pid, language, code)
+        res = await self._req.post(**request)
+        if res and res.status_code == 200:
+            return self.attach_run_id_from_status(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res.text, pid)
+        return Result(Result.Status.STATUS_SUBMIT_ERROR)
+
+    async def get_result(self, account, pid):
+        if await self.login_website(account) is False:
+            return Result(Result.Status.STATUS_RESULT_ERROR)
+        url = self.latest_submission_url(await self._req.get(self.result_url(account, pid)), pid)
+        if url is None:
+            return Result(Result.Status.STATUS_RESULT_ERROR)
+        return await self.get_result_by_url(url)
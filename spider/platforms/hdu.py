@@ -1,15 +1,30 @@
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4 import element
+from lxml import etree
 
 from spider import config
 from spider.config import Problem, Result
-from spider.platforms.base import Base, BaseParser
-from spider.utils import HttpUtil, HtmlTag
+from spider.parser_backend import Node, add_class, has_class, html_tree, to_html, update_element
+from spider.platforms.base import AsyncBase, Base, BaseParser
+from spider.utils import AsyncHttpUtil, HttpUtil, HtmlTag
+
+_panel = has_class('panel_title', 'panel_content', 'panel_bottom')
+# lxml 后端用到的 XPath
+# 题面是标题所在容器的直接子节点，侧栏、公告中的 panel 不算
+_problem_panels = etree.XPath(f'(//h1)[1]/../*[{_panel}]')
+_status_table = etree.XPath(f"(//table[{has_class('table_text')}])[1]")
+_status_rows = etree.XPath(".//tr[@align='center']")
+_cells = etree.XPath('.//td')
 
 
 class HDUParser(BaseParser):
+    # 页面是一个布局表格，题面在标题所在的 td 中，只构建 td 子树，跳过 head 和表格之外的部分
+    problem_strainer = SoupStrainer('td')
+    result_strainer = SoupStrainer('table', attrs={'class': 'table_text'})
+    run_id_columns = (0, 8, 3)
+
     def __init__(self, *args, **kwargs):
         self._static_prefix = 'http://acm.hdu.edu.cn/'
         self._script = """<script type="text/x-mathjax-config">
@@ -50,7 +65,6 @@ class HDUParser(BaseParser):
         if re.search('No such problem', website_data):
             problem.status = Problem.Status.STATUS_RETRYABLE
             return problem
-        soup = BeautifulSoup(website_data, 'lxml')
 
         match_groups = re.search(r'color:#1A5CC8\'>([\s\S]*?)</h1>', website_data)
         if match_groups:
@@ -63,7 +77,17 @@ class HDUParser(BaseParser):
             problem.memory_limit = match_groups.group(1)
         problem.special_judge = re.search(r'color=red>Special Judge</font>', website_data) is not None
 
-        problem.html = ''
+        if self.use_lxml():
+            problem.html = self._lxml_problem_html(website_data)
+        else:
+            problem.html = self._problem_html(website_data)
+        problem.html += self._script
+        problem.status = Problem.Status.STATUS_SUCCESS
+        return problem
+
+    def _problem_html(self, website_data):
+        html = ''
+        soup = BeautifulSoup(website_data, 'lxml', parse_only=self.problem_strainer)
         for tag in soup.find('h1').parent.children:
             if type(tag) == element.Tag and tag.get('class') and set(tag['class']).intersection({'panel_title',
                                                                                                  'panel_content',
@@ -74,10 +98,20 @@ class HDUParser(BaseParser):
                 else:
                     tag['class'] += (HtmlTag.TagDesc.CONTENT.value,)
                     tag['style'] = HtmlTag.TagStyle.CONTENT.value
-                problem.html += str(HtmlTag.update_tag(tag, self._static_prefix))
-        problem.html += self._script
-        problem.status = Problem.Status.STATUS_SUCCESS
-        return problem
+                html += str(HtmlTag.update_tag(tag, self._static_prefix))
+        return html
+
+    def _lxml_problem_html(self, website_data):
+        html = ''
+        for tag in _problem_panels(html_tree(website_data)):
+            if 'panel_title' in tag.get('class').split():
+                add_class(tag, HtmlTag.TagDesc.TITLE.value)
+                tag.set('style', HtmlTag.TagStyle.TITLE.value)
+            else:
+                add_class(tag, HtmlTag.TagDesc.CONTENT.value)
+                tag.set('style', HtmlTag.TagStyle.CONTENT.value)
+            html += to_html(update_element(tag, self._static_prefix))
+        return html
 
     def result_parse(self, response):
         result = Result()
@@ -86,24 +120,73 @@ class HDUParser(BaseParser):
             result.status = Result.Status.STATUS_RESULT_ERROR
             return result
         website_data = response.text
-        soup = BeautifulSoup(website_data, 'lxml')
-        line = soup.find('table', attrs={'class': 'table_text'}).find('tr', attrs={'align': 'center'}).find_all('td')
+        if self.use_lxml():
+            lines = self._lxml_lines(website_data)
+            line = lines[0] if lines else None
+        else:
+            soup = BeautifulSoup(website_data, 'lxml', parse_only=self.result_strainer)
+            line = soup.find('table', attrs={'class': 'table_text'}).find('tr', attrs={'align': 'center'}).find_all(
+                'td')
         if line:
-            result.unique_key = line[0].string
-            result.verdict_info = line[2].get_text()
-            result.execute_time = line[4].string
-            result.execute_memory = line[5].string
-            result.status = Result.Status.STATUS_RESULT_SUCCESS
+            return self._line_parse(line)
+        result.status = Result.Status.STATUS_RESULT_ERROR
+        return result
+
+    # 请求失败或者页面中没有状态表格 (源OJ返回了错误页) 的时候返回 None，状态表格为空的时候返回 []
+    def result_list_parse(self, response):
+        lines = self.status_lines(response)
+        if lines is None:
+            return None
+        return [self._line_parse(line) for line in lines]
+
+    def status_lines(self, response):
+        if response is None or response.status_code != 200:
+            return None
+        if self.use_lxml():
+            lines = self._lxml_lines(response.text)
+            if lines is None:
+                return None
         else:
-            result.status = Result.Status.STATUS_RESULT_ERROR
+            soup = BeautifulSoup(response.text, 'lxml', parse_only=self.result_strainer)
+            table = soup.find('table', attrs={'class': 'table_text'})
+            if table is None:
+                return None
+            lines = [tr.find_all('td') for tr in table.find_all('tr', attrs={'align': 'center'})]
+        return [line for line in lines if len(line) > 5]
+
+    @staticmethod
+    def _lxml_lines(website_data):
+        table = _status_table(html_tree(website_data))
+        if not table:
+            return None
+        return [[Node(td) for td in _cells(tr)] for tr in _status_rows(table[0])]
+
+    @staticmethod
+    def _line_parse(line):
+        result = Result()
+        result.unique_key = line[0].string
+        result.verdict_info = line[2].get_text()
+        result.execute_time = line[4].string
+        result.execute_memory = line[5].string
+        result.status = Result.Status.STATUS_RESULT_SUCCESS
         return result
 
 
 class HDU(Base):
+    status_page_size = 15
+    statement_pattern = r"(<h1 style='color:#1A5CC8'>[\s\S]*?)<center>"
+    volatile_patterns = (r'Submission\(s\): \d+',)
+    parser_class = HDUParser
+    login_check_url = 'http://acm.hdu.edu.cn/'
+    login_check_pattern = r'userloginex\.php\?action=logout'
+    working_url = 'http://acm.hdu.edu.cn/'
+    working_pattern = r'<H1>Welcome to HDU Online Judge System</H1>'
+    language_url = 'http://acm.hdu.edu.cn/submit.php'
+
     def __init__(self, *args, **kwargs):
         self._code_type = 'gb18030'
         self._req = HttpUtil(headers=config.default_headers, code_type=self._code_type,
-                             *args, **kwargs)
+                             login_pattern=r'userloginex\.php', *args, **kwargs)
 
     @staticmethod
     def home_page_url():
@@ -117,78 +200,50 @@ class HDU(Base):
         if isinstance(cookies, dict):
             self._req.cookies.update(cookies)
 
-    def is_login(self):
-        url = 'http://acm.hdu.edu.cn/'
-        res = self._req.get(url)
-        if res and re.search(r'userloginex\.php\?action=logout', res.text) is not None:
-            return True
-        return False
-
     def login_website(self, account):
         if account and account.cookies:
             self._req.cookies.update(account.cookies)
         if self.is_login():
             return True
-        login_link_url = 'http://acm.hdu.edu.cn/userloginex.php'
+        self._req.post(**self.login_request(account))
+        return self.is_login()
+
+    @staticmethod
+    def login_request(account):
         post_data = {'username': account.username,
                      'userpass': account.password,
                      'login': 'Sign In'
                      }
-        self._req.post(url=login_link_url, data=post_data,
-                       params={'action': 'login'})
-        return self.is_login()
+        return {'url': 'http://acm.hdu.edu.cn/userloginex.php', 'data': post_data, 'params': {'action': 'login'}}
 
     def account_required(self):
         return False
 
-    def get_problem(self, pid, account=None):
-
-        url = 'http://acm.hdu.edu.cn/showproblem.php?pid=' + pid
-        res = self._req.get(url)
-        return HDUParser().problem_parse(res, pid, url)
+    @staticmethod
+    def problem_url(pid):
+        return 'http://acm.hdu.edu.cn/showproblem.php?pid=' + str(pid)
 
     def submit_code(self, account, pid, language, code):
         if not self.login_website(account):
             return Result(Result.Status.STATUS_SUBMIT_ERROR)
-        url = 'http://acm.hdu.edu.cn/submit.php'
-        post_data = {'check': '0', 'language': language, 'problemid': pid, 'usercode': code}
-        res = self._req.post(url=url, data=post_data, params={'action': 'submit'})
+        res = self._req.post(**self.submit_request(pid, language, code))
         if res and res.status_code == 200:
-            return Result(Result.Status.STATUS_SUBMIT_SUCCESS)
+            return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
         return Result(Result.Status.STATUS_SUBMIT_ERROR)
 
-    def find_language(self, account):
-        if self.login_website(account) is False:
-            return None
-        url = 'http://acm.hdu.edu.cn/submit.php'
-        languages = {}
-        res = self._req.get(url)
-        if res is None:
-            return languages
-        soup = BeautifulSoup(res.text, 'lxml')
-        options = soup.find('select', attrs={'name': 'language'}).find_all('option')
-        for option in options:
-            languages[option.get('value')] = option.string
-        return languages
-
-    def get_result(self, account, pid):
-        url = f'http://acm.hdu.edu.cn/status.php?first=&pid=${pid}&user={account.username}&lang=0&status=0'
-        return self.get_result_by_url(url=url)
-
-    def get_result_by_rid_and_pid(self, rid, pid):
-        url = f'http://acm.hdu.edu.cn/status.php?first=${rid}&pid=&user=&lang=0&status=0'
-        return self.get_result_by_url(url=url)
-
-    def get_result_by_url(self, url):
-        res = self._req.get(url)
-        return HDUParser().result_parse(res)
-
-    def is_working(self):
-        url = 'http://acm.hdu.edu.cn/'
-        res = self._req.get(url)
-        if res and re.search(r'<H1>Welcome to HDU Online Judge System</H1>', res.text):
-            return True
-        return False
+    @staticmethod
+    def submit_request(pid, language, code):
+        post_data = {'check': '0', 'language': language, 'problemid': pid, 'usercode': code}
+        return {'url': 'http://acm.hdu.edu.cn/submit.php', 'data': post_data, 'params': {'action': 'submit'}}
+
+    def result_url(self, account, pid):
+        return f'http://acm.hdu.edu.cn/status.php?first=&pid={pid}&user={account.username}&lang=0&status=0'
+
+    def rid_url(self, rid, pid):
+        return self.page_url(rid)
+
+    def page_url(self, rid):
+        return f'http://acm.hdu.edu.cn/status.php?first={rid}&pid=&user=&lang=0&status=0'
 
     @staticmethod
     def is_accepted(verdict):
@@ -201,3 +256,26 @@ class HDU(Base):
     @staticmethod
     def is_running(verdict):
         return verdict in ['Queuing', 'Compiling', 'Running']
+
+
+class AsyncHDU(AsyncBase, HDU):
+    def __init__(self, *args, **kwargs):
+        self._code_type = 'gb18030'
+        self._req = AsyncHttpUtil(headers=config.default_headers, code_type=self._code_type,
+                                  login_pattern=r'userloginex\.php', *args, **kwargs)
+
+    async def login_website(self, account):
+        if account and account.cookies:
+            self._req.cookies.update(account.cookies)
+        if await self.is_login():
+            return True
+        await self._req.post(**self.login_request(account))
+        return await self.is_login()
+
+    async def submit_code(self, account, pid, language, code):
+        if not await self.login_website(account):
+            return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        res = await self._req.post(**self.submit_request(pid, language, code))
+        if res and res.status_code == 200:
+            return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
+        return Result(Result.Status.STATUS_SUBMIT_ERROR)
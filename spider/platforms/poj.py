@@ -1,16 +1,30 @@
 import base64
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4.element import Tag
+from lxml import etree
 
 from spider import config
-from spider.platforms.base import Base, BaseParser
+from spider.parser_backend import Node, add_class, has_class, html_tree, to_html, update_element
+from spider.platforms.base import AsyncBase, Base, BaseParser
 from spider.config import Problem, Result
-from spider.utils import HttpUtil, HtmlTag
+from spider.utils import AsyncHttpUtil, HttpUtil, HtmlTag
+
+_section = has_class('ptt', 'ptx', 'pst', 'sio')
+# lxml 后端用到的 XPath
+_problem_sections = etree.XPath(f'//*[{_section}][not(ancestor::*[{_section}])]')
+_problem_title = etree.XPath(f"(//div[{has_class('ptt')}])[1]")
+_status_table = etree.XPath(f"(//table[{has_class('a')}])[1]")
+_status_rows = etree.XPath(".//tr[@align='center']")
+_cells = etree.XPath('.//td')
 
 
 class POJParser(BaseParser):
+    problem_strainer = SoupStrainer(class_=['ptt', 'ptx', 'pst', 'sio'])
+    result_strainer = SoupStrainer('table', attrs={'class': 'a'})
+    run_id_columns = (0, 1, 2)
+
     def __init__(self, *args, **kwargs):
         self._static_prefix = 'http://poj.org/'
 
@@ -31,7 +45,6 @@ class POJParser(BaseParser):
         if re.search('Can not find problem', website_data):
             problem.status = Problem.Status.STATUS_RETRYABLE
             return problem
-        soup = BeautifulSoup(website_data, 'lxml')
 
         match_groups = re.search(r'ptt" lang="en-US">([\s\S]*?)</div>', website_data)
         if match_groups:
@@ -43,7 +56,16 @@ class POJParser(BaseParser):
         if match_groups:
             problem.memory_limit = match_groups.group(1)
         problem.special_judge = re.search(r'red;">Special Judge</td>', website_data) is not None
-        problem.html = ''
+        if self.use_lxml():
+            problem.html = self._lxml_problem_html(website_data)
+        else:
+            problem.html = self._problem_html(website_data)
+        problem.status = Problem.Status.STATUS_SUCCESS
+        return problem
+
+    def _problem_html(self, website_data):
+        html = ''
+        soup = BeautifulSoup(website_data, 'lxml', parse_only=self.problem_strainer)
         for tag in soup.find('div', attrs={'class': 'ptt'}).next_siblings:
             if type(tag) == Tag and set(tag.get('class')).intersection({'ptx', 'pst', 'sio'}):
                 if set(tag['class']).intersection({'pst', }):
@@ -53,36 +75,107 @@ class POJParser(BaseParser):
                 else:
                     tag['style'] = HtmlTag.TagStyle.CONTENT.value
                     tag['class'] += (HtmlTag.TagDesc.CONTENT.value,)
-                problem.html += str(HtmlTag.update_tag(tag, self._static_prefix))
-        problem.status = Problem.Status.STATUS_SUCCESS
-        return problem
+                html += str(HtmlTag.update_tag(tag, self._static_prefix))
+        return html
+
+    def _lxml_problem_html(self, website_data):
+        html = ''
+        root = html_tree(website_data)
+        title = _problem_title(root)
+        if not title:
+            return html
+        sections = _problem_sections(root)
+        if title[0] in sections:
+            siblings = sections[sections.index(title[0]) + 1:]
+        else:
+            siblings = title[0].itersiblings()
+        for tag in siblings:
+            classes = set((tag.get('class') or '').split())
+            if classes.intersection({'ptx', 'pst', 'sio'}):
+                if 'pst' in classes:
+                    tag.set('style', HtmlTag.TagStyle.TITLE.value)
+                    add_class(tag, HtmlTag.TagDesc.TITLE.value)
+                else:
+                    tag.set('style', HtmlTag.TagStyle.CONTENT.value)
+                    add_class(tag, HtmlTag.TagDesc.CONTENT.value)
+                html += to_html(update_element(tag, self._static_prefix))
+        return html
 
     def result_parse(self, response):
         result = Result()
         if response is None or response.status_code != 200:
             result.status = Result.Status.STATUS_RESULT_ERROR
             return result
-        soup = BeautifulSoup(response.text, 'lxml')
-        line = soup.find('table', attrs={'class': 'a'}).find('tr', attrs={'align': 'center'}).find_all('td')
+        if self.use_lxml():
+            lines = self._lxml_lines(response.text)
+            line = lines[0] if lines else None
+        else:
+            soup = BeautifulSoup(response.text, 'lxml', parse_only=self.result_strainer)
+            line = soup.find('table', attrs={'class': 'a'}).find('tr', attrs={'align': 'center'}).find_all('td')
         if line is not None:
-            result.unique_key = line[0].string
-            result.verdict_info = line[3].string
-            result.execute_time = line[5].string
-            result.execute_memory = line[4].string
-            result.status = Result.Status.STATUS_RESULT_SUCCESS
+            return self._line_parse(line)
+        result.status = Result.Status.STATUS_RESULT_ERROR
+        return result
+
+    # 请求失败或者页面中没有状态表格 (源OJ返回了错误页) 的时候返回 None，状态表格为空的时候返回 []
+    def result_list_parse(self, response):
+        lines = self.status_lines(response)
+        if lines is None:
+            return None
+        return [self._line_parse(line) for line in lines]
+
+    def status_lines(self, response):
+        if response is None or response.status_code != 200:
+            return None
+        if self.use_lxml():
+            lines = self._lxml_lines(response.text)
+            if lines is None:
+                return None
         else:
-            result.status = Result.Status.STATUS_RESULT_ERROR
+            soup = BeautifulSoup(response.text, 'lxml', parse_only=self.result_strainer)
+            table = soup.find('table', attrs={'class': 'a'})
+            if table is None:
+                return None
+            lines = [tr.find_all('td') for tr in table.find_all('tr', attrs={'align': 'center'})]
+        return [line for line in lines if len(line) > 5]
+
+    @staticmethod
+    def _lxml_lines(website_data):
+        table = _status_table(html_tree(website_data))
+        if not table:
+            return None
+        return [[Node(td) for td in _cells(tr)] for tr in _status_rows(table[0])]
+
+    @staticmethod
+    def _line_parse(line):
+        result = Result()
+        result.unique_key = line[0].string
+        result.verdict_info = line[3].string
+        result.execute_time = line[5].string
+        result.execute_memory = line[4].string
+        result.status = Result.Status.STATUS_RESULT_SUCCESS
         return result
 
 
 class POJ(Base):
+    status_page_size = 20
+    statement_pattern = r'(<div class="ptt"[\s\S]*?)<font color="#333399" size="3"><center>'
+    volatile_patterns = (r'<b>(?:Total Submissions|Accepted):</b> \d+',)
+    parser_class = POJParser
+    login_check_url = 'http://poj.org/'
+    login_check_pattern = r'action=logout&'
+    working_url = 'http://poj.org/'
+    working_pattern = r'color=blue>Welcome To PKU JudgeOnline</font>'
+    language_url = 'http://poj.org/submit'
+
     def __init__(self, *args, **kwargs):
         self.code_type = 'utf-8'
         self._headers = config.default_headers
         self._headers['Referer'] = 'http://poj.org/'
         self._headers['Content-Type'] = 'application/x-www-form-urlencoded'
 
-        self._req = HttpUtil(headers=self._headers, code_type=self.code_type, *args, **kwargs)
+        self._req = HttpUtil(headers=self._headers, code_type=self.code_type, login_pattern=r'poj\.org/login',
+                             *args, **kwargs)
 
     @staticmethod
     def home_page_url():
@@ -102,38 +195,36 @@ class POJ(Base):
             self._req.cookies.update(account.cookies)
         if self.is_login():
             return True
-        login_page_url = 'http://poj.org/'
-        login_link_url = 'http://poj.org/login'
+        self._req.get(url='http://poj.org/')
+        self._req.post(**self.login_request(account))
+        return self.is_login()
+
+    @staticmethod
+    def login_request(account):
         post_data = {'user_id1': account.username,
                      'password1': account.password,
                      'B1': 'login',
                      'url': '/'}
-        self._req.get(url=login_page_url)
-        self._req.post(url=login_link_url, data=post_data)
-        return self.is_login()
-
-    # 检查登录状态
-    def is_login(self):
-        url = 'http://poj.org/'
-        res = self._req.get(url=url)
-        if res and re.search(r'action=logout&', res.text):
-            return True
-        return False
+        return {'url': 'http://poj.org/login', 'data': post_data}
 
     def account_required(self):
         return False
 
-    # 获取题目
-    def get_problem(self, pid, account=None):
-        url = f'http://poj.org/problem?id={pid}'
-        res = self._req.get(url=url)
-        return POJParser().problem_parse(res, pid, url)
+    @staticmethod
+    def problem_url(pid):
+        return f'http://poj.org/problem?id={pid}'
 
     # 提交代码
     def submit_code(self, account, pid, language, code):
         if not self.login_website(account):
             return Result(Result.Status.STATUS_SPIDER_ERROR)
-        url = 'http://poj.org/submit'
+        res = self._req.post(**self.submit_request(pid, language, code))
+        if res and res.status_code == 200:
+            return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
+        return Result(Result.Status.STATUS_SUBMIT_ERROR)
+
+    @staticmethod
+    def submit_request(pid, language, code):
         if type(code) is str:
             code = bytes(code, encoding='utf-8')
         post_data = {'problem_id': pid,
@@ -141,47 +232,18 @@ class POJ(Base):
                      'source': base64.b64encode(code),
                      'submit': 'Submit',
                      'encoded': '1'}
-        res = self._req.post(url=url, data=post_data)
-        if res and res.status_code == 200:
-            return Result(Result.Status.STATUS_SUBMIT_SUCCESS)
-        return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        return {'url': 'http://poj.org/submit', 'data': post_data}
 
-    # 获取当前运行结果
-    def get_result(self, account, pid):
-        url = f'http://poj.org/status?problem_id=f{pid}&result=&language=&top=&user_id={account.username}'
-        return self.get_result_by_url(url=url)
+    # 当前运行结果的页面
+    def result_url(self, account, pid):
+        return f'http://poj.org/status?problem_id={pid}&result=&language=&top=&user_id={account.username}'
 
     # 根据源OJ的运行id获取结果
-    def get_result_by_rid_and_pid(self, rid, pid):
-        url = 'http://poj.org/status?problem_id=&result=&language=&top=' + str(int(rid) + 1)
-        return self.get_result_by_url(url=url)
-
-    # 根据源OJ的url获取结果
-    def get_result_by_url(self, url):
-        res = self._req.get(url=url)
-        return POJParser().result_parse(res)
-
-    # 获取源OJ支持的语言类型
-    def find_language(self, account):
-        if self.login_website(account) is False:
-            return None
-        url = 'http://poj.org/submit'
-        language = {}
-        res = self._req.get(url=url)
-        if res:
-            soup = BeautifulSoup(res.text, 'lxml')
-            options = soup.find('select', attrs={'name': 'language'}).find_all('option')
-            for option in options:
-                language[option.get('value')] = option.string
-        return language
-
-    # 检查源OJ是否运行正常
-    def is_working(self):
-        url = "http://poj.org/"
-        res = self._req.get(url)
-        if res and re.search(r'color=blue>Welcome To PKU JudgeOnline</font>', res.text):
-            return True
-        return False
+    def rid_url(self, rid, pid):
+        return self.page_url(rid)
+
+    def page_url(self, rid):
+        return 'http://poj.org/status?problem_id=&result=&language=&top=' + str(int(rid) + 1)
 
     @staticmethod
     def is_accepted(verdict):
@@ -194,3 +256,31 @@ class POJ(Base):
     @staticmethod
     def is_compile_error(verdict):
         return verdict == 'Compile Error'
+
+
+class AsyncPOJ(AsyncBase, POJ):
+    def __init__(self, *args, **kwargs):
+        self.code_type = 'utf-8'
+        self._headers = config.default_headers
+        self._headers['Referer'] = 'http://poj.org/'
+        self._headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        self._req = AsyncHttpUtil(headers=self._headers, code_type=self.code_type, login_pattern=r'poj\.org/login',
+                                  *args, **kwargs)
+
+    async def login_website(self, account):
+        if account and account.cookies:
+            self._req.cookies.update(account.cookies)
+        if await self.is_login():
+            return True
+        await self._req.get(url='http://poj.org/')
+        await self._req.post(**self.login_request(account))
+        return await self.is_login()
+
+    async def submit_code(self, account, pid, language, code):
+        if not await self.login_website(account):
+            return Result(Result.Status.STATUS_SPIDER_ERROR)
+        res = await self._req.post(**self.submit_request(pid, language, code))
+        if res and res.status_code == 200:
+            return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
+        return Result(Result.Status.STATUS_SUBMIT_ERROR)
@@ -1,15 +1,29 @@
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4 import element
+from lxml import etree
 
 from spider import config
-from spider.platforms.base import Base, BaseParser
+from spider.parser_backend import Node, add_class, has_class, html_tree, remove, to_html, update_element
+from spider.platforms.base import AsyncBase, Base, BaseParser
+from spider.tracing import stage
 from spider.config import Problem, Result
-from spider.utils import HttpUtil, HtmlTag
+from spider.utils import AsyncHttpUtil, HttpUtil, HtmlTag
+
+# lxml 后端用到的 XPath
+_problem_body = etree.XPath(f"(//div[{has_class('rich_text')}])[1]")
+_status_first_row = etree.XPath(f"((//table[@id='result-tab'])[1]//tr[{has_class('evenrow')}])[1]")
+_status_table = etree.XPath("(//table[@id='result-tab'])[1]")
+_status_rows = etree.XPath(f".//tr[{has_class('evenrow', 'oddrow')}]")
+_cells = etree.XPath('.//td')
 
 
 class WUSTParser(BaseParser):
+    problem_strainer = SoupStrainer('div', attrs={'class': 'rich_text'})
+    result_strainer = SoupStrainer('table', attrs={'id': 'result-tab'})
+    run_id_columns = (0, 1, 2)
+
     def __init__(self, *args, **kwargs):
         self._static_prefix = 'http://acm.wust.edu.cn/'
 
@@ -40,9 +54,17 @@ class WUSTParser(BaseParser):
             problem.memory_limit = match_groups.group(1)
         problem.special_judge = re.search(r'class=red>Special Judge</span>', website_data) is not None
 
-        soup = BeautifulSoup(website_data, 'lxml')
+        if self.use_lxml():
+            problem.html = self._lxml_problem_html(website_data)
+        else:
+            problem.html = self._problem_html(website_data)
+        problem.html = '<body>' + problem.html + '</body>'
+        problem.status = Problem.Status.STATUS_SUCCESS
+        return problem
 
-        problem.html = ''
+    def _problem_html(self, website_data):
+        html = ''
+        soup = BeautifulSoup(website_data, 'lxml', parse_only=self.problem_strainer)
         for tag in soup.find('div', attrs={'class': 'rich_text'}).children:
             if type(tag) == element.Tag:
                 if tag.name in ['h2', 'div']:
@@ -55,18 +77,36 @@ class WUSTParser(BaseParser):
                             tag.img.decompose()
                         tag['style'] = HtmlTag.TagStyle.TITLE.value
                         tag['class'] += (HtmlTag.TagDesc.TITLE.value,)
-                        problem.html += str(
+                        html += str(
                             HtmlTag.update_tag(tag, self._static_prefix, update_style=HtmlTag.TagStyle.TITLE.value))
 
                     else:
                         tag['style'] = HtmlTag.TagStyle.CONTENT.value
                         tag['class'] += (HtmlTag.TagDesc.CONTENT.value,)
-                        problem.html += str(
+                        html += str(
                             HtmlTag.update_tag(tag, self._static_prefix,
                                                update_style=HtmlTag.TagStyle.CONTENT.value))
-        problem.html = '<body>' + problem.html + '</body>'
-        problem.status = Problem.Status.STATUS_SUCCESS
-        return problem
+        return html
+
+    def _lxml_problem_html(self, website_data):
+        html = ''
+        body = _problem_body(html_tree(website_data))
+        if not body:
+            return html
+        for tag in body[0]:
+            if tag.tag == 'h2':
+                for name in ['div', 'img']:
+                    child = tag.find('.//' + name)
+                    if child is not None:
+                        remove(child)
+                tag.set('style', HtmlTag.TagStyle.TITLE.value)
+                add_class(tag, HtmlTag.TagDesc.TITLE.value)
+                html += to_html(update_element(tag, self._static_prefix, update_style=HtmlTag.TagStyle.TITLE.value))
+            elif tag.tag == 'div':
+                tag.set('style', HtmlTag.TagStyle.CONTENT.value)
+                add_class(tag, HtmlTag.TagDesc.CONTENT.value)
+                html += to_html(update_element(tag, self._static_prefix, update_style=HtmlTag.TagStyle.CONTENT.value))
+        return html
 
     def result_parse(self, response):
         result = Result()
@@ -75,26 +115,70 @@ class WUSTParser(BaseParser):
             return result
 
         website_data = response.text
-        soup = BeautifulSoup(website_data, 'lxml')
-        if soup.find('table', attrs={'id': 'result-tab'}).find('tr', attrs={'class': 'evenrow'}) is None:
-            result.status = Result.Status.STATUS_SUBMIT_FAILED
-            return result
-        line = soup.find('table', attrs={'id': 'result-tab'}).find('tr', attrs={'class': 'evenrow'}).find_all('td')
+        if self.use_lxml():
+            row = _status_first_row(html_tree(website_data))
+            if not row:
+                result.status = Result.Status.STATUS_SUBMIT_FAILED
+                return result
+            line = [Node(td) for td in _cells(row[0])]
+        else:
+            soup = BeautifulSoup(website_data, 'lxml', parse_only=self.result_strainer)
+            if soup.find('table', attrs={'id': 'result-tab'}).find('tr', attrs={'class': 'evenrow'}) is None:
+                result.status = Result.Status.STATUS_SUBMIT_FAILED
+                return result
+            line = soup.find('table', attrs={'id': 'result-tab'}).find('tr', attrs={'class': 'evenrow'}).find_all(
+                'td')
         if line:
-            result.unique_key = line[0].string
-            result.verdict_info = line[4].string
-            result.execute_time = line[6].string
-            result.execute_memory = line[5].string
-            result.status = Result.Status.STATUS_RESULT_SUCCESS
+            return self._line_parse(line)
+        result.status = Result.Status.STATUS_RESULT_ERROR
+        return result
+
+    # 请求失败或者页面中没有状态表格 (源OJ返回了错误页) 的时候返回 None，状态表格为空的时候返回 []
+    def result_list_parse(self, response):
+        lines = self.status_lines(response)
+        if lines is None:
+            return None
+        return [self._line_parse(line) for line in lines]
+
+    def status_lines(self, response):
+        if response is None or response.status_code != 200:
+            return None
+        if self.use_lxml():
+            table = _status_table(html_tree(response.text))
+            if not table:
+                return None
+            lines = [[Node(td) for td in _cells(tr)] for tr in _status_rows(table[0])]
         else:
-            result.status = Result.Status.STATUS_RESULT_ERROR
+            soup = BeautifulSoup(response.text, 'lxml', parse_only=self.result_strainer)
+            table = soup.find('table', attrs={'id': 'result-tab'})
+            if table is None:
+                return None
+            lines = [tr.find_all('td') for tr in table.find_all('tr', attrs={'class': ['evenrow', 'oddrow']})]
+        return [line for line in lines if len(line) > 6]
+
+    @staticmethod
+    def _line_parse(line):
+        result = Result()
+        result.unique_key = line[0].string
+        result.verdict_info = line[4].string
+        result.execute_time = line[6].string
+        result.execute_memory = line[5].string
+        result.status = Result.Status.STATUS_RESULT_SUCCESS
         return result
 
 
 class WUST(Base):
+    volatile_patterns = (r'<span>(?:Submit|Solved): \d+</span>',)
+    parser_class = WUSTParser
+    login_check_url = 'http://acm.wust.edu.cn/'
+    login_check_pattern = r'<a href="logout.php">Logout</a>'
+    working_url = 'http://acm.wust.edu.cn/'
+    working_pattern = r'<a href="index.php">WUST Online Judge</a>'
+    language_url = 'http://acm.wust.edu.cn/submitpage.php?id=1000&soj=0'
+
     def __init__(self, *args, **kwargs):
         self._headers = config.default_headers
-        self._req = HttpUtil(self._headers, 'utf-8', *args, **kwargs)
+        self._req = HttpUtil(self._headers, 'utf-8', login_pattern=r'loginpage\.php', *args, **kwargs)
 
     @staticmethod
     def home_page_url():
@@ -108,91 +192,63 @@ class WUST(Base):
         if isinstance(cookies, dict):
             self._req.cookies.update(cookies)
 
-    def is_login(self):
-        url = 'http://acm.wust.edu.cn/'
-        res = self._req.get(url)
-        if res is None:
-            return False
-        if re.search(r'<a href="logout.php">Logout</a>', res.text) is not None:
-            return True
-
     def login_website(self, account):
         if account and account.cookies:
             self._req.cookies.update(account.cookies)
         if self.is_login():
             return True
-        login_page_url = 'http://acm.wust.edu.cn/loginpage.php'
-        login_link_url = 'http://acm.wust.edu.cn/login.php'
+        self._req.get('http://acm.wust.edu.cn/loginpage.php')
+        self._req.post(**self.login_request(account))
+        if self.is_login():
+            return True
+        return False
 
+    @staticmethod
+    def login_request(account):
         post_data = {'user_id': account.username,
                      'password': account.password,
                      'submit': 'Submit'}
-        self._req.get(login_page_url)
-        self._req.post(login_link_url, post_data)
-        if self.is_login():
-            return True
-        return False
+        return {'url': 'http://acm.wust.edu.cn/login.php', 'data': post_data}
 
     def account_required(self):
         return False
 
-    def get_problem(self, pid, account=None):
-        url = f'http://acm.wust.edu.cn/problem.php?id={pid}&soj=0'
-        res = self._req.get(url)
-        return WUSTParser().problem_parse(res, pid, url)
+    @staticmethod
+    def problem_url(pid):
+        return f'http://acm.wust.edu.cn/problem.php?id={pid}&soj=0'
+
+    @staticmethod
+    def submit_page_url(pid):
+        return 'http://acm.wust.edu.cn/submitpage.php?id=' + str(pid) + '&soj=0'
 
     def submit_code(self, account, pid, language, code):
         if not self.login_website(account):
             return Result(Result.Status.STATUS_SPIDER_ERROR)
-        link_page_url = 'http://acm.wust.edu.cn/submitpage.php?id=' + str(pid) + '&soj=0'
-        link_post_url = 'http://acm.wust.edu.cn/submit.php'
-        res = self._req.get(link_page_url)
+        with stage('form'):
+            request = self.submit_request(self._req.get(self.submit_page_url(pid)), pid, language, code)
+            if request is None:
+                return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        res = self._req.post(**request)
         if res is None or res.status_code != 200:
             return Result(Result.Status.STATUS_SUBMIT_ERROR)
-        soup = BeautifulSoup(res.text, 'lxml')
+        return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
+
+    # 提交页面中的 submitkey 要随代码一起提交
+    def submit_request(self, submit_page, pid, language, code):
+        if submit_page is None or submit_page.status_code != 200:
+            return None
+        soup = BeautifulSoup(submit_page.text, 'lxml')
         submitkey = soup.find('input', attrs={'name': 'submitkey'})['value']
         post_data = {'id': str(pid), 'soj': '0', 'language': language, 'source': code, 'submitkey': str(submitkey)}
-        self._headers['Referer'] = link_page_url
-        res = self._req.post(url=link_post_url, data=post_data, headers=self._headers)
-        if res is None or res.status_code != 200:
-            return Result(Result.Status.STATUS_SUBMIT_ERROR)
-        return Result(Result.Status.STATUS_SUBMIT_SUCCESS)
+        self._headers['Referer'] = self.submit_page_url(pid)
+        return {'url': 'http://acm.wust.edu.cn/submit.php', 'data': post_data, 'headers': self._headers}
 
-    def find_language(self, account):
-        if self.login_website(account) is False:
-            return None
-        url = 'http://acm.wust.edu.cn/submitpage.php?id=1000&soj=0'
-        languages = {}
-        res = self._req.get(url)
-        if res is None:
-            return languages
-        soup = BeautifulSoup(res.text, 'lxml')
-        options = soup.find('select', attrs={'name': 'language'}).find_all('option')
-        for option in options:
-            languages[option.get('value')] = option.string
-        return languages
-
-    def get_result(self, account, pid):
-        url = f'http://acm.wust.edu.cn/status.php?soj=-1&' \
+    def result_url(self, account, pid):
+        return f'http://acm.wust.edu.cn/status.php?soj=-1&' \
             f'problem_id={pid}&user_id={account.username}&language=-1&jresult=-1'
 
-        return self.get_result_by_url(url=url)
-
-    def get_result_by_rid_and_pid(self, rid, pid):
-        url = 'http://acm.wust.edu.cn/status.php?top=' + rid
-        return self.get_result_by_url(url=url)
-
-    def get_result_by_url(self, url):
-        res = self._req.get(url)
-
-        return WUSTParser().result_parse(res)
-
-    def is_working(self):
-        url = 'http://acm.wust.edu.cn/'
-        res = self._req.get(url)
-        if res and re.search(r'<a href="index.php">WUST Online Judge</a>', res.text):
-            return True
-        return False
+    def rid_url(self, rid, pid):
+        return 'http://acm.wust.edu.cn/status.php?top=' + rid
 
     @staticmethod
     def is_accepted(verdict):
@@ -205,3 +261,32 @@ class WUST(Base):
     @staticmethod
     def is_compile_error(verdict):
         return verdict == 'Compile Error'
+
+
+class AsyncWUST(AsyncBase, WUST):
+    def __init__(self, *args, **kwargs):
+        self._headers = config.default_headers
+        self._req = AsyncHttpUtil(self._headers, 'utf-8', login_pattern=r'loginpage\.php', *args, **kwargs)
+
+    async def login_website(self, account):
+        if account and account.cookies:
+            self._req.cookies.update(account.cookies)
+        if await self.is_login():
+            return True
+        await self._req.get('http://acm.wust.edu.cn/loginpage.php')
+        await self._req.post(**self.login_request(account))
+        if await self.is_login():
+            return True
+        return False
+
+    async def submit_code(self, account, pid, language, code):
+        if not await self.login_website(account):
+            return Result(Result.Status.STATUS_SPIDER_ERROR)
+        with stage('form'):
+            request = self.submit_request(await self._req.get(self.submit_page_url(pid)), pid, language, code)
+            if request is None:
+                return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        res = await self._req.post(**request)
+        if res is None or res.status_code != 200:
+            return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
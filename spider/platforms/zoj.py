@@ -1,15 +1,31 @@
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4 import element
+from lxml import etree
 
 from spider import config
 from spider.config import Problem, Result
-from spider.platforms.base import Base, BaseParser
-from spider.utils import HtmlTag, HttpUtil
+from spider.parser_backend import (Node, add_class, child_nodes, has_class, html_tree, is_element, node_string,
+                                   node_text, to_html, update_element)
+from spider.platforms.base import AsyncBase, Base, BaseParser
+from spider.tracing import stage
+from spider.utils import AsyncHttpUtil, HtmlTag, HttpUtil
+
+# lxml 后端用到的 XPath
+_problem_body = etree.XPath("(//div[@id='content_body'])[1]")
+_problem_title = etree.XPath(f"(//div[@id='content_body']//span[{has_class('bigProblemTitle')}])[1]")
+_status_table = etree.XPath(f"(//table[{has_class('list')}])[1]")
+_status_first_row = etree.XPath(f"(.//tr[{has_class('rowOdd')}])[1]")
+_status_rows = etree.XPath(f".//tr[{has_class('rowOdd', 'rowEven')}]")
+_cells = etree.XPath('.//td')
 
 
 class ZOJParser(BaseParser):
+    problem_strainer = SoupStrainer('div', attrs={'id': 'content_body'})
+    result_strainer = SoupStrainer('table', attrs={'class': 'list'})
+    run_id_columns = (0, 7, 3)
+
     def __init__(self):
         self._static_prefix = 'http://acm.zju.edu.cn/onlinejudge/'
         self._script = """<style>
@@ -38,8 +54,6 @@ class ZOJParser(BaseParser):
             problem.status = Problem.Status.STATUS_RETRYABLE
             return problem
 
-        soup = BeautifulSoup(website_data, 'lxml')
-        problem.title = str(soup.find('span', attrs={'class': 'bigProblemTitle'}).get_text())
         match_groups = re.search(r'(\d* Second)', website_data)
         if match_groups:
             problem.time_limit = match_groups.group(1)
@@ -48,12 +62,22 @@ class ZOJParser(BaseParser):
             problem.memory_limit = match_groups.group(1)
         problem.special_judge = re.search(r'<font color="blue">Special Judge</font>',
                                           website_data) is not None
-        problem.html = ''
-        problem.html += self._script
+        if self.use_lxml():
+            problem.title, html = self._lxml_problem_html(website_data)
+        else:
+            problem.title, html = self._problem_html(website_data)
+        problem.html = self._script + html
+        problem.status = Problem.Status.STATUS_SUCCESS
+        return problem
+
+    def _problem_html(self, website_data):
+        html = ''
+        soup = BeautifulSoup(website_data, 'lxml', parse_only=self.problem_strainer)
+        title = str(soup.find('span', attrs={'class': 'bigProblemTitle'}).get_text())
         raw_html = soup.find('div', attrs={'id': 'content_body'})
         for tag in raw_html.children:
             if type(tag) == element.NavigableString:
-                problem.html += str(tag)
+                html += str(tag)
             if type(tag) == element.Tag and tag.name not in ['center', 'hr']:
                 if tag.name == 'a' and tag.get('href') == '/onlinejudge/faq.do#sample':
                     continue
@@ -77,9 +101,39 @@ class ZOJParser(BaseParser):
                     else:
                         tag['class'] = (HtmlTag.TagDesc.CONTENT.value,)
                     HtmlTag.update_tag(tag, self._static_prefix)
-                problem.html += str(tag)
-        problem.status = Problem.Status.STATUS_SUCCESS
-        return problem
+                html += str(tag)
+        return title, html
+
+    def _lxml_problem_html(self, website_data):
+        html = ''
+        root = html_tree(website_data)
+        title = _problem_title(root)
+        title = node_text(title[0]) if title else None
+        raw_html = _problem_body(root)
+        if not raw_html:
+            return title, html
+        for tag in child_nodes(raw_html[0]):
+            if isinstance(tag, str):
+                html += tag
+            elif is_element(tag) and tag.tag not in ['center', 'hr']:
+                if tag.tag == 'a' and tag.get('href') == '/onlinejudge/faq.do#sample':
+                    continue
+                bold = tag.find('.//b') if tag.tag == 'p' else None
+                if tag.tag == 'h2':
+                    tag.set('style', HtmlTag.TagStyle.TITLE.value)
+                    add_class(tag, HtmlTag.TagDesc.TITLE.value)
+                elif bold is not None and node_string(bold) in ['Input', 'Output', 'Sample Input', 'Sample Output']:
+                    bold.set('style', HtmlTag.TagStyle.TITLE.value)
+                    if tag.get('class'):
+                        add_class(bold, HtmlTag.TagDesc.TITLE.value)
+                    else:
+                        bold.set('class', HtmlTag.TagDesc.TITLE.value)
+                else:
+                    tag.set('style', HtmlTag.TagStyle.CONTENT.value)
+                    add_class(tag, HtmlTag.TagDesc.CONTENT.value)
+                    update_element(tag, self._static_prefix)
+                html += to_html(tag)
+        return title, html
 
     def result_parse(self, response):
         result = Result()
@@ -88,36 +142,71 @@ class ZOJParser(BaseParser):
             result.status = Result.Status.STATUS_RESULT_ERROR
             return result
         website_data = response.text
-        soup = BeautifulSoup(website_data, 'lxml')
-        line = soup.find('table', attrs={'class': 'list'}).find('tr', attrs={'class': 'rowOdd'}).find_all(
-            'td')
+        if self.use_lxml():
+            table = _status_table(html_tree(website_data))
+            row = _status_first_row(table[0]) if table else None
+            line = [Node(td) for td in _cells(row[0])] if row else None
+        else:
+            soup = BeautifulSoup(website_data, 'lxml', parse_only=self.result_strainer)
+            line = soup.find('table', attrs={'class': 'list'}).find('tr', attrs={'class': 'rowOdd'}).find_all(
+                'td')
         if line:
-            result.unique_key = line[0].string
-            result.verdict_info = line[2].get_text().strip()
-            result.execute_time = line[5].string + "ms"
-            result.execute_memory = line[6].string + "KB"
-            result.status = Result.Status.STATUS_RESULT_SUCCESS
+            return self._line_parse(line)
+        result.status = Result.Status.STATUS_RESULT_ERROR
+        return result
+
+    # 请求失败或者页面中没有状态表格 (源OJ返回了错误页) 的时候返回 None，状态表格为空的时候返回 []
+    def result_list_parse(self, response):
+        lines = self.status_lines(response)
+        if lines is None:
+            return None
+        return [self._line_parse(line) for line in lines]
+
+    def status_lines(self, response):
+        if response is None or response.status_code != 200:
+            return None
+        if self.use_lxml():
+            table = _status_table(html_tree(response.text))
+            if not table:
+                return None
+            lines = [[Node(td) for td in _cells(tr)] for tr in _status_rows(table[0])]
         else:
-            result.status = Result.Status.STATUS_RESULT_ERROR
+            soup = BeautifulSoup(response.text, 'lxml', parse_only=self.result_strainer)
+            table = soup.find('table', attrs={'class': 'list'})
+            if table is None:
+                return None
+            lines = [tr.find_all('td') for tr in table.find_all('tr', attrs={'class': ['rowOdd', 'rowEven']})]
+        return [line for line in lines if len(line) > 6]
+
+    @staticmethod
+    def _line_parse(line):
+        result = Result()
+        result.unique_key = line[0].string
+        result.verdict_info = line[2].get_text().strip()
+        result.execute_time = line[5].string + "ms"
+        result.execute_memory = line[6].string + "KB"
+        result.status = Result.Status.STATUS_RESULT_SUCCESS
         return result
 
 
 class ZOJ(Base):
+    status_page_size = 20
+    parser_class = ZOJParser
+    login_check_url = 'http://acm.zju.edu.cn/onlinejudge/'
+    login_check_pattern = r'/onlinejudge/logout.do">Logout'
+    working_url = 'http://acm.zju.edu.cn/onlinejudge/'
+    working_pattern = r'<div class="welcome_msg">Welcome to ZOJ</div>'
+    language_url = 'http://acm.zju.edu.cn/onlinejudge/submit.do?problemId=1'
+    language_field = 'languageId'
+
     def __init__(self, *args, **kwargs):
-        self._req = HttpUtil(headers=config.default_headers, *args, **kwargs)
+        self._req = HttpUtil(headers=config.default_headers, login_pattern=r'/onlinejudge/login\.do', *args, **kwargs)
 
     @staticmethod
     def home_page_url():
         url = 'http://acm.zju.edu.cn/onlinejudge/'
         return url
 
-    def is_login(self):
-        url = 'http://acm.zju.edu.cn/onlinejudge/'
-        res = self._req.get(url)
-        if res and re.search(r'/onlinejudge/logout.do">Logout', res.text) is not None:
-            return True
-        return False
-
     def get_cookies(self):
         return self._req.cookies.get_dict()
 
@@ -130,71 +219,54 @@ class ZOJ(Base):
             self._req.cookies.update(account.cookies)
         if self.is_login():
             return True
-        login_link_url = 'http://acm.zju.edu.cn/onlinejudge/login.do'
-        post_data = {'handle': account.username, 'password': account.password}
-        self._req.post(url=login_link_url, data=post_data)
+        self._req.post(**self.login_request(account))
         return self.is_login()
 
+    @staticmethod
+    def login_request(account):
+        post_data = {'handle': account.username, 'password': account.password}
+        return {'url': 'http://acm.zju.edu.cn/onlinejudge/login.do', 'data': post_data}
+
     def account_required(self):
         return False
 
-    def get_problem(self, pid, account=None):
-        url = 'http://acm.zju.edu.cn/onlinejudge/showProblem.do?problemCode=' + pid
-        res = self._req.get(url)
-        return ZOJParser().problem_parse(res, pid, url)
+    @staticmethod
+    def problem_url(pid):
+        return 'http://acm.zju.edu.cn/onlinejudge/showProblem.do?problemCode=' + str(pid)
 
     def submit_code(self, account, pid, language, code):
         if not self.login_website(account):
             return Result(Result.Status.STATUS_SPIDER_ERROR)
-        problem_url = 'http://acm.zju.edu.cn/onlinejudge/showProblem.do?problemCode=' + str(pid)
-        res = self._req.get(problem_url)
-        if res is None:
-            return Result(Result.Status.STATUS_SUBMIT_ERROR)
-
-        problem_id = re.search(r'problemId=(\d*)"><font color="blue">Submit</font>', res.text).group(1)
-        url = 'http://acm.zju.edu.cn/onlinejudge/submit.do?problemId=' + str(problem_id)
-        post_data = {'languageId': str(language), 'problemId': str(pid), 'source': code}
-        res = self._req.post(url=url, data=post_data)
+        with stage('form'):
+            request = self.submit_request(self._req.get(self.problem_url(pid)), pid, language, code)
+            if request is None:
+                return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        res = self._req.post(**request)
         if res and res.status_code == 200:
-            return Result(Result.Status.STATUS_SUBMIT_SUCCESS)
+            return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
         return Result(Result.Status.STATUS_SUBMIT_ERROR)
 
-    def find_language(self, account):
-        if self.login_website(account) is False:
+    # 提交地址中的 problemId 是题目页面中 Submit 链接的参数，不是题号
+    @staticmethod
+    def submit_request(problem_page, pid, language, code):
+        if problem_page is None:
             return None
-        url = 'http://acm.zju.edu.cn/onlinejudge/submit.do?problemId=1'
-        languages = {}
-        try:
-            res = self._req.get(url)
-            soup = BeautifulSoup(res.text, 'lxml')
-            options = soup.find('select', attrs={'name': 'languageId'}).find_all('option')
-            for option in options:
-                languages[option.get('value')] = option.string
-        finally:
-            return languages
-
-    def get_result(self, account, pid):
-        url = 'http://acm.zju.edu.cn/onlinejudge/showRuns.do' \
-              '?contestId=1&search=true&firstId=-1&lastId=-1&problemCode=' + \
-              str(pid) + '&handle=' + account.username + '&idStart=&idEnd='
-
-        return self.get_result_by_url(url=url)
-
-    def get_result_by_rid_and_pid(self, rid, pid):
-        url = 'http://acm.zju.edu.cn/onlinejudge/showRuns.do?contestId=1&search=true&fi' \
-              'rstId=-1&lastId=-1&problemCode=&handle=&idStart=' + str(rid) + '&idEnd=' + str(rid)
-        return self.get_result_by_url(url=url)
-
-    def get_result_by_url(self, url):
-        res = self._req.get(url)
-        return ZOJParser().result_parse(res)
-
-    def is_working(self):
-        url = 'http://acm.zju.edu.cn/onlinejudge/'
-        res = self._req.get(url)
-        if res and re.search(r'<div class="welcome_msg">Welcome to ZOJ</div>', res.text):
-            return True
-        return False
+        problem_id = re.search(r'problemId=(\d*)"><font color="blue">Submit</font>', problem_page.text).group(1)
+        post_data = {'languageId': str(language), 'problemId': str(pid), 'source': code}
+        return {'url': 'http://acm.zju.edu.cn/onlinejudge/submit.do?problemId=' + str(problem_id), 'data': post_data}
+
+    def result_url(self, account, pid):
+        return 'http://acm.zju.edu.cn/onlinejudge/showRuns.do' \
+               '?contestId=1&search=true&firstId=-1&lastId=-1&problemCode=' + \
+               str(pid) + '&handle=' + account.username + '&idStart=&idEnd='
+
+    def rid_url(self, rid, pid):
+        return 'http://acm.zju.edu.cn/onlinejudge/showRuns.do?contestId=1&search=true&fi' \
+               'rstId=-1&lastId=-1&problemCode=&handle=&idStart=' + str(rid) + '&idEnd=' + str(rid)
+
+    def page_url(self, rid):
+        return 'http://acm.zju.edu.cn/onlinejudge/showRuns.do?contestId=1&search=true&firstId=-1&lastId=-1' \
+               '&problemCode=&handle=&idStart=' + str(int(rid) - self.status_page_size + 1) + '&idEnd=' + str(rid)
 
     @staticmethod
     def is_accepted(verdict):
@@ -207,3 +279,29 @@ class ZOJ(Base):
     @staticmethod
     def is_compile_error(verdict):
         return verdict == 'Compilation Error'
+
+
+class AsyncZOJ(AsyncBase, ZOJ):
+    def __init__(self, *args, **kwargs):
+        self._req = AsyncHttpUtil(headers=config.default_headers, login_pattern=r'/onlinejudge/login\.do',
+                                  *args, **kwargs)
+
+    async def login_website(self, account):
+        if account and account.cookies:
+            self._req.cookies.update(account.cookies)
+        if await self.is_login():
+            return True
+        await self._req.post(**self.login_request(account))
+        return await self.is_login()
+
+    async def submit_code(self, account, pid, language, code):
+        if not await self.login_website(account):
+            return Result(Result.Status.STATUS_SPIDER_ERROR)
+        with stage('form'):
+            request = self.submit_request(await self._req.get(self.problem_url(pid)), pid, language, code)
+            if request is None:
+                return Result(Result.Status.STATUS_SUBMIT_ERROR)
+        res = await self._req.post(**request)
+        if res and res.status_code == 200:
+            return self.capture_run_id(Result(Result.Status.STATUS_SUBMIT_SUCCESS), res, account, pid)
+        return Result(Result.Status.STATUS_SUBMIT_ERROR)
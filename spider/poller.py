@@ -0,0 +1,243 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from spider.config import Result
+from spider.log import logger
+from spider.tracing import activate, tracer
+
+
+class SubmissionHandle(object):
+    """
+    一次提交的句柄，提交之后立即返回，最终结果由 VerdictPoller 在后台获取
+
+    latest: 最近一次查询到的 Result
+    rid: 源OJ的运行id，submit 拿到了运行id或者第一次查询到结果之后才会有
+    trace: 记录这次提交的 spider.tracing.SubmissionTrace，只有通过 submit 提交并且开启了 tracing 的时候才有
+    """
+
+    def __init__(self, core, account, pid, rid=None):
+        self.core = core
+        self.account = account
+        self.pid = pid
+        self.rid = rid
+        self.latest = None
+        self.polls = 0
+        self.created_at = time.time()
+        self.trace = None
+        self._future = Future()
+
+    def done(self):
+        return self._future.done()
+
+    # 等待最终结果，超时抛出 concurrent.futures.TimeoutError
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+    def add_done_callback(self, fn):
+        self._future.add_done_callback(lambda future: fn(self))
+
+    def _resolve(self, result):
+        self.latest = result
+        if not self._future.done():
+            tracer.finish(self.trace, result)
+            self._future.set_result(result)
+
+
+class VerdictPoller(object):
+    """
+    在后台跟踪所有等待结果的提交。刚提交的时候查询得比较频繁，源OJ一直在运行中的时候逐渐放慢，
+    拿到最终结果或者超过 timeout 秒之后结束。
+
+    :param max_workers: 同时进行查询的线程数
+    :param initial_delay: 第一次查询和提交之间的最小间隔，实际取它和平台 result_delay 中较大的一个
+    :param factor: 每次查询之后间隔乘以这个系数
+    :param max_delay: 查询间隔的上限
+    :param timeout: 超过这个秒数还没有最终结果，就用最后一次查询到的结果结束
+    :param coalesce: 同一个OJ在这个秒数之内需要查询的提交合并成一次状态页请求
+    """
+
+    def __init__(self, max_workers=8, initial_delay=1.0, factor=1.5, max_delay=15.0, timeout=600, coalesce=1.0):
+        self._coalesce = coalesce
+        self._initial_delay = initial_delay
+        self._factor = factor
+        self._max_delay = max_delay
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='verdict-poller', daemon=True)
+                self._thread.start()
+
+    def submit(self, core, account, pid, language, code):
+        """
+        在后台提交代码并跟踪结果，立即返回 SubmissionHandle
+        """
+        handle = SubmissionHandle(core, account, pid)
+        handle.trace = tracer.start(core.get_remote_oj(), pid, account.username)
+        with self._cond:
+            if not self._stopped:
+                self._ensure_started()
+                self._executor.submit(self._submit, handle, language, code)
+                return handle
+        # 已经停止的 poller 不再提交
+        handle._resolve(Result(Result.Status.STATUS_SUBMIT_ERROR))
+        return handle
+
+    def track(self, core, account, pid, rid=None):
+        """
+        跟踪一个已经提交的代码，rid 为空的时候取这个账号在这道题上最新的一次提交
+        """
+        handle = SubmissionHandle(core, account, pid, rid)
+        if not self._stopped:
+            self._ensure_started()
+        self._schedule(handle, 0)
+        return handle
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def stop(self):
+        """
+        停止后台查询，还在等待的提交用最后一次查询到的结果结束，之后才完成的提交或者查询也立即结束。
+        停止之后的 submit 按提交失败结束，track 按查询失败结束
+        """
+        with self._cond:
+            self._stopped = True
+            handles = [item[2] for item in self._heap]
+            self._heap = []
+            self._cond.notify_all()
+        for handle in handles:
+            self._abandon(handle)
+        self._executor.shutdown(wait=False)
+
+    # 没有查询到过结果的提交按查询失败结束
+    @staticmethod
+    def _abandon(handle):
+        handle._resolve(handle.latest or Result(Result.Status.STATUS_RESULT_ERROR))
+
+    def _delay(self, handle):
+        return min(self._max_delay, self._initial_delay * self._factor ** handle.polls)
+
+    def _schedule(self, handle, delay):
+        with self._cond:
+            if not self._stopped:
+                heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), handle))
+                self._cond.notify()
+                return
+        self._abandon(handle)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                handle = heapq.heappop(self._heap)[2]
+                batch = self._pop_batch(handle)
+            if batch:
+                self._executor.submit(self._poll_batch, [handle] + batch)
+            else:
+                self._executor.submit(self._poll, handle)
+
+    # 取出和 handle 同一个OJ、马上也要查询的提交，调用时需要持有 self._cond
+    def _pop_batch(self, handle):
+        if handle.rid is None or not handle.core.supports_result_page():
+            return []
+        deadline = time.monotonic() + self._coalesce
+        oj_name = handle.core.get_remote_oj()
+        batch = [item[2] for item in self._heap
+                 if item[0] <= deadline and item[2].rid is not None and item[2].core.get_remote_oj() == oj_name]
+        if batch:
+            self._heap = [item for item in self._heap if item[2] not in batch]
+            heapq.heapify(self._heap)
+        return batch
+
+    def _submit(self, handle, language, code):
+        try:
+            with activate(handle.trace):
+                result = handle.core.submit(handle.account, handle.pid, language, code)
+        except Exception as e:
+            logger.exception(e)
+            result = Result(Result.Status.STATUS_SUBMIT_ERROR)
+        if result.status != Result.Status.STATUS_SUBMIT_SUCCESS:
+            handle._resolve(result)
+            return
+        handle.latest = result
+        if result.unique_key:
+            handle.rid = result.unique_key
+        self._schedule(handle, max(self._initial_delay, handle.core.get_result_delay()))
+
+    def _poll(self, handle):
+        try:
+            with activate(handle.trace):
+                if handle.rid is None:
+                    result = handle.core.get_result(account=handle.account, pid=handle.pid)
+                else:
+                    result = handle.core.get_result_by_rid_and_pid(rid=handle.rid, pid=handle.pid)
+        except Exception as e:
+            logger.exception(e)
+            result = Result(Result.Status.STATUS_RESULT_ERROR)
+        self._update(handle, result)
+
+    # 一次请求状态页，更新这一批提交的结果，这次请求在每个提交的 trace 中都记录为一次 poll
+    def _poll_batch(self, handles):
+        start = time.time()
+        try:
+            results = handles[0].core.get_results_by_rids([handle.rid for handle in handles])
+        except Exception as e:
+            logger.exception(e)
+            results = {}
+        end = time.time()
+        for handle in handles:
+            result = results.get(str(handle.rid).strip(), Result(Result.Status.STATUS_RESULT_ERROR))
+            if handle.trace is not None:
+                handle.trace.observe(result, handle.trace.add_span('poll', start=start, end=end, batch=len(handles)))
+            self._update(handle, result)
+
+    def _update(self, handle, result):
+        handle.polls += 1
+        if result.status == Result.Status.STATUS_RESULT_SUCCESS:
+            handle.latest = result
+            if result.unique_key is not None:
+                handle.rid = str(result.unique_key).strip()
+            if result.verdict != Result.Verdict.VERDICT_RUNNING:
+                handle._resolve(result)
+                return
+        elif handle.latest is None or handle.latest.status != Result.Status.STATUS_RESULT_SUCCESS:
+            handle.latest = result
+        if time.time() - handle.created_at > self._timeout:
+            handle._resolve(handle.latest)
+            return
+        self._schedule(handle, self._delay(handle))
+
+
+_default_poller = None
+_default_poller_lock = threading.Lock()
+
+
+# 获取进程内共享的 VerdictPoller，共享的 poller 被 stop 之后创建一个新的
+def get_poller():
+    global _default_poller
+    poller = _default_poller
+    if poller is None or poller.stopped:
+        with _default_poller_lock:
+            if _default_poller is None or _default_poller.stopped:
+                _default_poller = VerdictPoller()
+            poller = _default_poller
+    return poller
@@ -0,0 +1,432 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from spider.config import Result
+from spider.core import Core
+from spider.log import logger
+
+
+class PoolExhausted(Exception):
+    """
+    等待超时仍然没有可用的 Core 或者账号
+    """
+    pass
+
+
+class _PoolEntry(object):
+    def __init__(self, key, core):
+        self.key = key
+        self.core = core
+        self.last_used = time.monotonic()
+        self.logged_in = False
+
+
+class CorePool(object):
+    """
+    进程内共享的 Core 池，按照 (OJ, 账号, 代理) 分组复用已经登录的平台实例。
+    每个实例独占一个 requests session，复用之后可以保留 keep-alive 连接和 cookies。
+
+    max_per_key: 每个 (OJ, 账号, 代理) 最多同时存在的实例数
+    max_total: 整个池子最多同时存在的实例数，超出时优先淘汰最久未使用的空闲实例
+    idle_timeout: 空闲超过这个秒数的实例会被回收
+    timeout: 传给 Core 的请求超时，为空的时候使用 spider.timeouts 的自适应超时
+    """
+
+    def __init__(self, max_per_key=4, max_total=64, idle_timeout=600, timeout=None):
+        self._max_per_key = max_per_key
+        self._max_total = max_total
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._lock = threading.Condition()
+        self._idle = {}
+        self._size = {}
+        self._busy = {}
+
+    @staticmethod
+    def make_key(oj_name, account=None, proxies=None):
+        return str(oj_name), account.username if account else None, proxies
+
+    def _total(self):
+        return sum(self._size.values())
+
+    def _discard(self, entry):
+        self._size[entry.key] -= 1
+        if self._size[entry.key] <= 0:
+            del self._size[entry.key]
+
+    def _evict_idle(self, now):
+        for key in list(self._idle.keys()):
+            entries = self._idle[key]
+            while entries and now - entries[0].last_used > self._idle_timeout:
+                self._discard(entries.popleft())
+            if not entries:
+                del self._idle[key]
+
+    def _evict_oldest(self):
+        oldest = None
+        for entries in self._idle.values():
+            if entries and (oldest is None or entries[0].last_used < oldest.last_used):
+                oldest = entries[0]
+        if oldest is None:
+            return False
+        self._idle[oldest.key].popleft()
+        if not self._idle[oldest.key]:
+            del self._idle[oldest.key]
+        self._discard(oldest)
+        return True
+
+    def _acquire(self, key, wait):
+        deadline = None if wait is None else time.monotonic() + wait
+        with self._lock:
+            while True:
+                self._evict_idle(time.monotonic())
+                entries = self._idle.get(key)
+                if entries:
+                    # 后进先出，尽量使用最近用过的实例，连接还没有被服务器关闭
+                    entry = entries.pop()
+                    if not entries:
+                        del self._idle[key]
+                    break
+                if self._size.get(key, 0) < self._max_per_key and (
+                        self._total() < self._max_total or self._evict_oldest()):
+                    self._size[key] = self._size.get(key, 0) + 1
+                    entry = None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolExhausted(f'no available core for {key}')
+                self._lock.wait(remaining)
+        if entry is None:
+            try:
+                entry = _PoolEntry(key, Core(key[0], proxies=key[2], timeout=self._timeout))
+            except:
+                with self._lock:
+                    self._size[key] -= 1
+                    self._lock.notify_all()
+                raise
+        return entry
+
+    def checkout(self, oj_name, account=None, proxies=None, login=False, wait=None):
+        """
+        取出一个 Core，使用完之后必须调用 checkin 归还
+
+        :param oj_name: 平台名称
+        :param account: 爬虫账号，不同账号的实例互相隔离
+        :param proxies: 代理地址
+        :param login: 为 True 的时候保证返回的实例已经登录
+        :param wait: 没有可用实例时最多等待的秒数，None 表示一直等待
+        :return: Core
+        """
+        key = CorePool.make_key(oj_name, account, proxies)
+        entry = self._acquire(key, wait)
+        with self._lock:
+            self._busy[id(entry.core)] = entry
+        if login and account and not entry.logged_in:
+            try:
+                entry.logged_in = entry.core.is_account_valid(account)
+            except:
+                self.checkin(entry.core, discard=True)
+                raise
+        return entry.core
+
+    def checkin(self, core, discard=False):
+        """
+        归还 Core
+
+        :param core: checkout 得到的 Core
+        :param discard: 为 True 的时候直接丢弃这个实例，比如账号被登出或者连接异常
+        """
+        with self._lock:
+            entry = self._busy.pop(id(core), None)
+            if entry is None:
+                return
+            if discard:
+                self._discard(entry)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.setdefault(entry.key, deque()).append(entry)
+            self._lock.notify_all()
+
+    @contextmanager
+    def core(self, oj_name, account=None, proxies=None, login=False, wait=None):
+        core = self.checkout(oj_name, account=account, proxies=proxies, login=login, wait=wait)
+        try:
+            yield core
+        except:
+            self.checkin(core, discard=True)
+            raise
+        else:
+            self.checkin(core)
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            self._lock.notify_all()
+
+    def clear(self):
+        with self._lock:
+            for entries in self._idle.values():
+                for entry in entries:
+                    self._discard(entry)
+            self._idle.clear()
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'total': self._total(),
+                'busy': len(self._busy),
+                'idle': sum(len(entries) for entries in self._idle.values()),
+            }
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+# 获取进程内共享的 CorePool
+def get_pool():
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = CorePool()
+    return _default_pool
+
+
+# 提交得到这些状态说明账号本身可能有问题 (登录失败、被封禁、提交过于频繁)
+ACCOUNT_FAILURES = (Result.Status.STATUS_SUBMIT_ERROR, Result.Status.STATUS_SPIDER_ERROR)
+
+
+class AccountState(object):
+    """
+    账号池中一个账号的状态
+
+    available_at: 冷却结束的时间 (time.monotonic)
+    failures: 连续失败的次数，成功一次之后清零
+    disabled_until: 连续失败过多之后暂停使用，到这个时间之前不会被租出
+    """
+
+    def __init__(self, account):
+        self.account = account
+        self.leased = False
+        self.available_at = 0.0
+        self.last_used = 0.0
+        self.failures = 0
+        self.disabled_until = 0.0
+        self.submissions = 0
+        self.last_error = None
+
+    def is_available(self, now):
+        return not self.leased and self.available_at <= now and self.disabled_until <= now
+
+    def to_dict(self, now):
+        return {
+            'username': self.account.username,
+            'leased': self.leased,
+            'healthy': self.disabled_until <= now,
+            'cooldown': max(0.0, self.available_at - now),
+            'failures': self.failures,
+            'submissions': self.submissions,
+            'last_error': self.last_error,
+        }
+
+
+class Lease(object):
+    """
+    AccountPool.lease 得到的租约，在 release 之前这个账号不会被其他提交使用
+    """
+
+    def __init__(self, pool, state, core):
+        self.pool = pool
+        self.state = state
+        self.core = core
+        self.released = False
+
+    @property
+    def account(self):
+        return self.state.account
+
+    def release(self, result=None, error=None):
+        self.pool.release(self, result, error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release(error=exc_val)
+
+
+class AccountPool(object):
+    """
+    一个OJ的机器人账号池。源OJ通过 用户名 + 题号 在状态页中找到"我们的"提交，
+    同一个账号同时进行两次提交会拿到彼此的结果，所以每次 提交 -> 拿到最终结果 期间独占一个账号，
+    提交吞吐量随账号数增加。
+
+    每个账号使用 CorePool 中属于它自己的 Core，结束的时候把 Core 的 cookies 保存回 Account，
+    下一次即使换了 Core 也不需要重新登录。提交之后账号冷却 cooldown 秒，
+    连续 max_failures 次提交失败之后暂停 penalty 秒，再失败暂停时间加倍，最多 max_penalty 秒。
+
+    :param oj_name: 平台名称
+    :param accounts: Account 列表
+    :param cooldown: 每次提交之后这个账号至少间隔多少秒才能再次提交
+    :param core_pool: 提供 Core 的 CorePool，默认使用进程内共享的池子
+    :param lease_timeout: submit_code_async 的提交超过这个秒数还没有最终结果的时候按失败归还账号，
+                          默认比 VerdictPoller 的 timeout 长，正常情况下不会触发
+    """
+
+    def __init__(self, oj_name, accounts=(), cooldown=0.0, max_failures=3, penalty=60.0, max_penalty=1800.0,
+                 core_pool=None, proxies=None, lease_timeout=900.0):
+        self.oj_name = oj_name
+        self.cooldown = cooldown
+        self.lease_timeout = lease_timeout
+        self.max_failures = max_failures
+        self.penalty = penalty
+        self.max_penalty = max_penalty
+        self.proxies = proxies
+        self._core_pool = core_pool
+        self._cond = threading.Condition()
+        self._states = {}
+        for account in accounts:
+            self.add(account)
+
+    @property
+    def core_pool(self):
+        return self._core_pool or get_pool()
+
+    def add(self, account):
+        with self._cond:
+            self._states.setdefault(account.username, AccountState(account))
+            self._cond.notify_all()
+
+    # 正在使用的账号在归还之后才会被移除
+    def remove(self, username):
+        with self._cond:
+            self._states.pop(username, None)
+
+    def __len__(self):
+        return len(self._states)
+
+    def _pick(self, now):
+        candidates = [state for state in self._states.values() if state.is_available(now)]
+        if not candidates:
+            return None
+        # 优先使用空闲最久的账号，把提交分散到所有账号上
+        return min(candidates, key=lambda state: state.last_used)
+
+    def _next_ready(self, now):
+        times = [max(state.available_at, state.disabled_until) for state in self._states.values() if not state.leased]
+        return min(times) - now if times else None
+
+    def lease(self, wait=None):
+        """
+        独占一个账号和它的 Core，用完之后调用 Lease.release 或者使用 with
+
+        :param wait: 没有可用账号时最多等待的秒数，None 表示一直等待
+        """
+        deadline = None if wait is None else time.monotonic() + wait
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                state = self._pick(now)
+                if state is not None:
+                    state.leased = True
+                    break
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    raise PoolExhausted(f'no available account for {self.oj_name}')
+                ready = self._next_ready(now)
+                if ready is not None:
+                    remaining = ready if remaining is None else min(ready, remaining)
+                self._cond.wait(remaining)
+        try:
+            core = self.core_pool.checkout(self.oj_name, state.account, proxies=self.proxies)
+        except Exception:
+            with self._cond:
+                state.leased = False
+                self._cond.notify_all()
+            raise
+        return Lease(self, state, core)
+
+    def release(self, lease, result=None, error=None):
+        """
+        归还账号。result 为这次提交的最终结果，error 为过程中出现的异常，二者用来判断账号是否健康
+        """
+        with self._cond:
+            if lease.released:
+                return
+            lease.released = True
+        state = lease.state
+        cookies = None
+        if error is None:
+            try:
+                cookies = lease.core.get_cookies()
+            except Exception as e:
+                logger.exception(e)
+        self.core_pool.checkin(lease.core, discard=error is not None)
+        failed = error is not None or (result is not None and result.status in ACCOUNT_FAILURES)
+        with self._cond:
+            now = time.monotonic()
+            if isinstance(cookies, dict) and cookies:
+                state.account.set_cookies(cookies)
+            state.leased = False
+            state.last_used = now
+            state.available_at = now + self.cooldown
+            if result is not None:
+                state.submissions += 1
+            if failed:
+                state.failures += 1
+                state.last_error = repr(error) if error is not None else result.status.value
+                if state.failures >= self.max_failures:
+                    penalty = self.penalty * 2 ** (state.failures - self.max_failures)
+                    state.disabled_until = now + min(penalty, self.max_penalty)
+                    logger.warning(f'{self.oj_name} account {state.account.username} disabled after '
+                                   f'{state.failures} failures: {state.last_error}')
+            elif result is not None:
+                state.failures = 0
+                state.disabled_until = 0.0
+            self._cond.notify_all()
+
+    def submit_code(self, pid, language, code, wait=None):
+        """
+        租一个账号提交代码并等待最终结果，和 Core.submit_code 相同
+        """
+        with self.lease(wait) as lease:
+            result = lease.core.submit_code(lease.account, pid, language, code)
+            lease.release(result)
+        return result
+
+    def submit_code_async(self, pid, language, code, poller=None, wait=None):
+        """
+        租一个账号提交代码，立即返回 spider.poller.SubmissionHandle，拿到最终结果之后才归还账号
+        """
+        lease = self.lease(wait)
+        try:
+            handle = lease.core.submit_code_async(lease.account, pid, language, code, poller=poller)
+        except Exception as e:
+            lease.release(error=e)
+            raise
+        timer = threading.Timer(self.lease_timeout, self._expire, (lease,))
+        timer.daemon = True
+        timer.start()
+
+        def done(finished):
+            timer.cancel()
+            lease.release(finished.latest)
+
+        handle.add_done_callback(done)
+        return handle
+
+    # 提交一直没有结果，Core 可能还在被 poller 使用，丢弃它并且按失败归还账号
+    def _expire(self, lease):
+        if not lease.released:
+            logger.warning(f'{self.oj_name} account {lease.account.username} lease expired after '
+                           f'{self.lease_timeout}s without a verdict')
+            lease.release(error=TimeoutError('lease expired'))
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            return [state.to_dict(now) for state in self._states.values()]
@@ -0,0 +1,203 @@
+"""
+按比例采样对 Core 的操作做 cProfile 和 tracemalloc 分析，默认关闭:
+
+    VJ_PROFILE=cprofile|tracemalloc|all VJ_PROFILE_RATE=0.01 VJ_PROFILE_DIR=profiles
+
+或者在代码中调用 profiler.enable(...)。结果按 平台/操作 分目录保存，每个目录只保留最新的 keep 个文件:
+
+    profiles/HDU/get_problem/20240101-120000-1234-1-35ms.prof        pstats 格式
+    profiles/HDU/get_problem/20240101-120000-1234-1-35ms.tracemalloc  tracemalloc.Snapshot.dump 格式
+
+汇总一个目录下 (包括子目录) 的所有 .prof 和 .tracemalloc:
+
+    python -m spider.profiling profiles/HDU/get_problem [--sort cumulative] [--limit 30]
+"""
+import functools
+import itertools
+import os
+import random
+import threading
+import time
+
+from spider.log import logger
+from spider.metrics import current_operation
+
+MODE_CPROFILE = 'cprofile'
+MODE_TRACEMALLOC = 'tracemalloc'
+MODE_ALL = 'all'
+MODES = (MODE_CPROFILE, MODE_TRACEMALLOC, MODE_ALL)
+
+
+class Profiler(object):
+    """
+    :param mode: cprofile, tracemalloc 或者 all，为空表示关闭
+    :param rate: 被分析的调用比例，0 到 1
+    :param directory: 输出目录
+    :param keep: 每个 平台/操作 目录最多保留的文件数
+    :param frames: tracemalloc 记录的调用栈深度
+    """
+
+    def __init__(self, mode=None, rate=0.01, directory='profiles', keep=100, frames=1):
+        self.mode = None
+        self.rate = rate
+        self.directory = directory
+        self.keep = keep
+        self.frames = frames
+        self.written = 0
+        self.skipped = 0
+        # 同一时间只分析一个调用: tracemalloc 是全局的，内层的操作也不会重复分析
+        self._busy = threading.Lock()
+        self._counter = itertools.count(1)
+        self._random = random.Random()
+        self.enable(mode)
+
+    def enable(self, mode=MODE_ALL, rate=None, directory=None, keep=None):
+        if mode is not None and mode not in MODES:
+            raise ValueError(f'unknown profile mode {mode!r}, expected one of {MODES}')
+        self.mode = mode
+        if rate is not None:
+            self.rate = rate
+        if directory is not None:
+            self.directory = directory
+        if keep is not None:
+            self.keep = keep
+
+    def disable(self):
+        self.mode = None
+
+    @property
+    def enabled(self):
+        return self.mode is not None and self.rate > 0
+
+    def _sampled(self):
+        return self.enabled and (self.rate >= 1 or self._random.random() < self.rate)
+
+    def run(self, platform, name, func, *args, **kwargs):
+        """
+        按采样比例分析一次 func 调用，没有被选中或者已经有调用在分析的时候直接执行
+        """
+        if not self._sampled():
+            return func(*args, **kwargs)
+        if not self._busy.acquire(blocking=False):
+            self.skipped += 1
+            return func(*args, **kwargs)
+        try:
+            return self._profile(platform, name, func, *args, **kwargs)
+        finally:
+            self._busy.release()
+
+    def _profile(self, platform, name, func, *args, **kwargs):
+        # 只有真正开始分析的时候才导入，不开启的进程不需要加载这些模块
+        import cProfile
+        import tracemalloc
+        mode = self.mode
+        profile = cProfile.Profile() if mode in (MODE_CPROFILE, MODE_ALL) else None
+        tracing = mode in (MODE_TRACEMALLOC, MODE_ALL) and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start(self.frames)
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            elapsed = time.perf_counter() - start
+            snapshot = None
+            if tracing:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+            try:
+                self._write(platform, name, elapsed, profile, snapshot)
+            except OSError as e:
+                logger.exception(e)
+
+    def _write(self, platform, name, elapsed, profile, snapshot):
+        directory = os.path.join(self.directory, str(platform or 'unknown'), str(name or 'unknown'))
+        os.makedirs(directory, exist_ok=True)
+        # 文件名中带上耗时 (毫秒)，方便直接找出最慢的几次
+        stem = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{next(self._counter)}-{elapsed * 1000:.0f}ms'
+        if profile is not None:
+            profile.dump_stats(os.path.join(directory, stem + '.prof'))
+        if snapshot is not None:
+            snapshot.dump(os.path.join(directory, stem + '.tracemalloc'))
+        self.written += 1
+        self._rotate(directory)
+
+    def _rotate(self, directory):
+        files = [os.path.join(directory, item) for item in os.listdir(directory)]
+        files.sort(key=lambda path: os.stat(path).st_mtime_ns)
+        for path in files[:max(0, len(files) - self.keep)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def profiled(func):
+    """
+    Core 方法的装饰器，放在 spider.metrics.operation 下面，操作名取 operation 设置的标签，平台取 self._remote_oj
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not profiler.enabled:
+            return func(self, *args, **kwargs)
+        return profiler.run(self._remote_oj, current_operation() or func.__name__, func, self, *args, **kwargs)
+
+    return wrapper
+
+
+def summarize(directory, sort='cumulative', limit=30, stream=None):
+    """
+    合并 directory 下 (包括子目录) 所有 .prof 文件并输出最耗时的 limit 个函数，返回合并的文件数
+    """
+    import glob
+    import pstats
+    files = sorted(glob.glob(os.path.join(directory, '**', '*.prof'), recursive=True))
+    if not files:
+        return 0
+    stats = pstats.Stats(*files, stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return len(files)
+
+
+def top_allocations(directory, limit=20, key_type='lineno'):
+    """
+    合并 directory 下所有 .tracemalloc 快照，返回分配内存最多的 limit 个位置 [(位置, 字节数, 次数)]
+    """
+    import glob
+    import tracemalloc
+    totals = {}
+    for path in glob.glob(os.path.join(directory, '**', '*.tracemalloc'), recursive=True):
+        for stat in tracemalloc.Snapshot.load(path).statistics(key_type):
+            where = str(stat.traceback)
+            size, count = totals.get(where, (0, 0))
+            totals[where] = (size + stat.size, count + stat.count)
+    items = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    return [(where, size, count) for where, (size, count) in items]
+
+
+profiler = Profiler(os.getenv('VJ_PROFILE') or None, rate=float(os.getenv('VJ_PROFILE_RATE', 0.01)),
+                    directory=os.getenv('VJ_PROFILE_DIR', 'profiles'), keep=int(os.getenv('VJ_PROFILE_KEEP', 100)))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', default=os.getenv('VJ_PROFILE_DIR', 'profiles'))
+    parser.add_argument('--sort', default='cumulative', help='pstats 的排序字段，比如 cumulative, tottime, ncalls')
+    parser.add_argument('--limit', type=int, default=30)
+    args = parser.parse_args()
+    if not summarize(args.directory, args.sort, args.limit):
+        print(f'no .prof files under {args.directory}')
+    allocations = top_allocations(args.directory, args.limit)
+    if allocations:
+        print(f'{"size":>12}{"count":>10}  location')
+        for where, size, count in allocations:
+            print(f'{size:>12}{count:>10}  {where}')
+
+
+if __name__ == '__main__':
+    main()
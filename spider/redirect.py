@@ -0,0 +1,43 @@
+import os
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+
+class Redirector(object):
+    """
+    把发往源OJ的请求改写到另一个服务上，测试和压测的时候用 test.mockoj 代替真实的OJ。
+    源OJ的域名变成路径的第一段，比如 base 为 http://127.0.0.1:8800 时，
+    http://acm.hdu.edu.cn/status.php?first=1 会被改写成 http://127.0.0.1:8800/acm.hdu.edu.cn/status.php?first=1
+    """
+
+    def __init__(self, base=None, hosts=None):
+        self._lock = threading.Lock()
+        self._base = None
+        self._hosts = None
+        self.set_base(base, hosts)
+
+    def set_base(self, base, hosts=None):
+        """
+        :param base: 改写的目标地址，为空的时候不改写
+        :param hosts: 只改写这些域名，为空的时候改写所有域名
+        """
+        with self._lock:
+            self._base = urlsplit(base.rstrip('/')) if base else None
+            self._hosts = set(hosts) if hosts else None
+
+    @property
+    def base(self):
+        return urlunsplit(self._base) if self._base else None
+
+    def rewrite(self, url):
+        base, hosts = self._base, self._hosts
+        if base is None:
+            return url
+        parts = urlsplit(url)
+        if not parts.hostname or (hosts is not None and parts.hostname not in hosts):
+            return url
+        path = base.path + '/' + parts.netloc + (parts.path or '/')
+        return urlunsplit((base.scheme, base.netloc, path, parts.query, parts.fragment))
+
+
+redirector = Redirector(os.getenv('VJ_OJ_BASE'))
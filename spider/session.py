@@ -0,0 +1,203 @@
+"""
+跨进程共享的登录会话。每个 (平台, 账号) 的 cookies 保存在一个 sqlite 文件中，同一台机器上的多个进程共用一次登录，
+进程重启之后也不需要重新登录。默认关闭:
+
+    VJ_SESSION_DB=sessions.sqlite VJ_SESSION_TTL=86400
+
+或者在代码中调用 sessions.set_backend('sessions.sqlite')。
+
+Base.login_website 在登录检查之前载入保存的 cookies，检查或者登录期间持有这个账号的登录租约，
+其他进程等租约释放之后直接使用刚保存的 cookies，不会同时登录同一个账号。
+登录之后 HttpUtil 在响应带回新的 cookies 时自动写回
+"""
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+
+SESSION_TTL = float(os.getenv('VJ_SESSION_TTL', 86400))
+# 登录租约的最长时间，持有租约的进程崩溃之后最多等这么久
+LOGIN_LEASE = float(os.getenv('VJ_SESSION_LEASE', 60))
+LOCK_POLL = 0.05
+
+
+def cookie_records(cookies):
+    """
+    cookies 统一成 [{'name', 'value', 'domain', 'path', 'expires'}]，保留 domain 和 path，
+    恢复之后源OJ重新下发的同名 cookie 会覆盖它，而不是并存。也可以传入 {name: value}
+    """
+    if isinstance(cookies, dict):
+        return [{'name': name, 'value': value} for name, value in cookies.items()]
+    return [dict(record) for record in cookies or ()]
+
+
+class SessionStore(object):
+    """
+    :param path: sqlite 文件路径，为空表示关闭
+    :param ttl: 保存的 cookies 的有效秒数，cookies 自己的过期时间更早的时候以 cookies 为准
+    :param lease: 登录租约的秒数
+    """
+
+    def __init__(self, path=None, ttl=SESSION_TTL, lease=LOGIN_LEASE):
+        self.ttl = ttl
+        self.lease = lease
+        self._path = None
+        self._local = threading.local()
+        self.set_backend(path)
+
+    def set_backend(self, path):
+        self._path = path
+        # 每个线程一个连接，切换文件之后旧的连接不再使用
+        self._local = threading.local()
+        if path:
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS sessions (oj TEXT NOT NULL, username TEXT NOT NULL, '
+                             'cookies TEXT NOT NULL, updated_at REAL, expires_at REAL, PRIMARY KEY (oj, username))')
+                conn.execute('CREATE TABLE IF NOT EXISTS leases (oj TEXT NOT NULL, username TEXT NOT NULL, '
+                             'owner TEXT NOT NULL, until REAL, PRIMARY KEY (oj, username))')
+
+    @property
+    def enabled(self):
+        return bool(self._path)
+
+    def _connect(self):
+        if getattr(self._local, 'conn', None) is None:
+            import sqlite3
+            self._local.conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            self._local.conn.execute('PRAGMA journal_mode=WAL')
+        return self._local.conn
+
+    def load(self, oj_name, username):
+        """
+        返回保存的 cookies (见 cookie_records)，没有或者已经过期的时候返回 None
+        """
+        row = self._connect().execute('SELECT cookies FROM sessions WHERE oj = ? AND username = ? AND expires_at > ?',
+                                      (oj_name, username, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, oj_name, username, cookies, expires_at=None):
+        """
+        expires_at 为空的时候取 cookies 中最早的过期时间，都没有过期时间的时候保存 ttl 秒
+        """
+        now = time.time()
+        records = cookie_records(cookies)
+        if expires_at is None:
+            expires_at = min((record['expires'] for record in records if record.get('expires')), default=None)
+        expires_at = min(now + self.ttl, expires_at or now + self.ttl)
+        data = json.dumps(records, sort_keys=True)
+        self._connect().execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)',
+                                (oj_name, username, data, now, expires_at))
+
+    def delete(self, oj_name, username):
+        self._connect().execute('DELETE FROM sessions WHERE oj = ? AND username = ?', (oj_name, username))
+
+    # 删除所有过期的会话，返回删除的条数
+    def purge(self):
+        return self._connect().execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+
+    def try_lock(self, oj_name, username):
+        """
+        尝试取得这个账号的登录租约，成功的时候返回释放用的 token，已经被其他进程或者线程持有的时候返回 None
+        """
+        token = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT until FROM leases WHERE oj = ? AND username = ?',
+                               (oj_name, username)).fetchone()
+            if row is not None and row[0] > now:
+                token = None
+            else:
+                conn.execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)',
+                             (oj_name, username, token, now + self.lease))
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        return token
+
+    def unlock(self, oj_name, username, token):
+        self._connect().execute('DELETE FROM leases WHERE oj = ? AND username = ? AND owner = ?',
+                                (oj_name, username, token))
+
+    @contextlib.contextmanager
+    def lock(self, oj_name, username):
+        token = self.try_lock(oj_name, username)
+        while token is None:
+            time.sleep(LOCK_POLL)
+            token = self.try_lock(oj_name, username)
+        try:
+            yield
+        finally:
+            self.unlock(oj_name, username, token)
+
+    # 异步版本。sqlite 在文件被锁住的时候最多等 30 秒，放到线程池中执行，不阻塞事件循环
+    @staticmethod
+    async def _run(func, *args):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def load_async(self, oj_name, username):
+        return await self._run(self.load, oj_name, username)
+
+    async def save_async(self, oj_name, username, cookies, expires_at=None):
+        await self._run(self.save, oj_name, username, cookies, expires_at)
+
+    @contextlib.asynccontextmanager
+    async def lock_async(self, oj_name, username):
+        import asyncio
+        token = await self._run(self.try_lock, oj_name, username)
+        while token is None:
+            await asyncio.sleep(LOCK_POLL)
+            token = await self._run(self.try_lock, oj_name, username)
+        try:
+            yield
+        finally:
+            await self._run(self.unlock, oj_name, username, token)
+
+
+def shared_login(platform, func):
+    """
+    login_website 的装饰器，由 Base 自动加上。开启了 sessions 并且登录状态缓存已经失效的时候，
+    在这个账号的登录租约中载入保存的 cookies、检查或者登录，成功之后写回
+    """
+
+    def bind(oj, account):
+        req = getattr(oj, '_req', None)
+        if not sessions.enabled or account is None or not hasattr(req, 'bind_session') or req.login_state.peek():
+            return None
+        return req
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(self, account, *args, **kwargs):
+            req = bind(self, account)
+            if req is None:
+                return await func(self, account, *args, **kwargs)
+            async with sessions.lock_async(platform, account.username):
+                await req.bind_session(sessions, platform, account.username)
+                logged_in = await func(self, account, *args, **kwargs)
+                if logged_in:
+                    await req.save_session()
+                return logged_in
+    else:
+        @functools.wraps(func)
+        def wrapper(self, account, *args, **kwargs):
+            req = bind(self, account)
+            if req is None:
+                return func(self, account, *args, **kwargs)
+            with sessions.lock(platform, account.username):
+                req.bind_session(sessions, platform, account.username)
+                logged_in = func(self, account, *args, **kwargs)
+                if logged_in:
+                    req.save_session()
+                return logged_in
+    return wrapper
+
+
+sessions = SessionStore(os.getenv('VJ_SESSION_DB') or None)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+from spider.config import Problem
+
+
+# 计算题面指纹的时候去掉脚本和注释，它们经常带有时间戳、统计代码
+_noise_pattern = re.compile(r'<script\b[\s\S]*?</script>|<!--[\s\S]*?-->', re.I)
+
+
+def content_hash(response):
+    return hashlib.sha1(response.content).hexdigest()
+
+
+def statement_hash(response, pattern=None, volatile_patterns=()):
+    """
+    题面区域的指纹：取 pattern 的第一个分组 (为空或者没有匹配的时候取整个页面)，
+    去掉脚本、注释和 volatile_patterns 匹配的部分，合并空白之后计算 hash。
+    提交数、服务器时间之类的变化不会改变指纹
+    """
+    if response is None or response.status_code != 200:
+        return None
+    text = response.text
+    if pattern:
+        match = re.search(pattern, text)
+        if match:
+            text = match.group(1)
+    text = _noise_pattern.sub('', text)
+    for volatile in volatile_patterns:
+        text = re.sub(volatile, '', text)
+    return hashlib.sha1(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+def _dump_problem(problem):
+    return json.dumps(problem.to_dict())
+
+
+def _load_problem(data):
+    return Problem.from_dict(json.loads(data))
+
+
+class StoredProblem(object):
+    """
+    题目仓库中的一条记录，保存解析好的 Problem 和原始响应的校验信息
+    """
+
+    def __init__(self, problem, etag=None, last_modified=None, content_hash=None, checked_at=None,
+                 statement_hash=None):
+        self.problem = problem
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.checked_at = checked_at
+        self.statement_hash = statement_hash
+
+    # 源OJ支持的时候，带上 If-None-Match 和 If-Modified-Since
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers or None
+
+    # 304 或者响应内容的 hash 没有变化，说明题面没有更新
+    def is_unchanged(self, response):
+        if response is None:
+            return False
+        if response.status_code == 304:
+            return True
+        return response.status_code == 200 and self.content_hash == content_hash(response)
+
+    # 原始响应变了，但是题面区域的指纹没有变化
+    def is_statement_unchanged(self, statement):
+        return statement is not None and self.statement_hash == statement
+
+
+class ProblemStore(object):
+    """
+    以 (remote_oj, remote_id) 为键的题目仓库，保存在 sqlite 文件中，可以在多个进程之间共享
+    """
+
+    def __init__(self, path):
+        import sqlite3
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            if path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS problems ('
+                               'remote_oj TEXT NOT NULL, remote_id TEXT NOT NULL, data TEXT NOT NULL, '
+                               'etag TEXT, last_modified TEXT, content_hash TEXT, checked_at REAL, '
+                               'PRIMARY KEY (remote_oj, remote_id))')
+            columns = [row[1] for row in self._conn.execute('PRAGMA table_info(problems)')]
+            if 'statement_hash' not in columns:
+                self._conn.execute('ALTER TABLE problems ADD COLUMN statement_hash TEXT')
+
+    def get(self, remote_oj, remote_id):
+        with self._lock:
+            row = self._conn.execute('SELECT data, etag, last_modified, content_hash, checked_at, statement_hash '
+                                     'FROM problems WHERE remote_oj = ? AND remote_id = ?',
+                                     (str(remote_oj), str(remote_id))).fetchone()
+        if row is None:
+            return None
+        return StoredProblem(_load_problem(row[0]), *row[1:])
+
+    def put(self, problem, response, statement=None):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO problems VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (str(problem.remote_oj), str(problem.remote_id), _dump_problem(problem),
+                                response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                content_hash(response), time.time(), statement))
+
+    # 题面没有变化的时候只更新校验信息和检查时间，响应内容变了的时候同时更新它的 hash
+    def touch(self, remote_oj, remote_id, response):
+        digest = content_hash(response) if response.status_code == 200 else None
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE problems SET etag = COALESCE(?, etag), '
+                               'last_modified = COALESCE(?, last_modified), content_hash = COALESCE(?, content_hash), '
+                               'checked_at = ? WHERE remote_oj = ? AND remote_id = ?',
+                               (response.headers.get('ETag'), response.headers.get('Last-Modified'), digest,
+                                time.time(), str(remote_oj), str(remote_id)))
+
+    def delete(self, remote_oj, remote_id):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM problems WHERE remote_oj = ? AND remote_id = ?',
+                               (str(remote_oj), str(remote_id)))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,214 @@
+"""
+按 平台/操作 自适应的请求超时。每个 平台/操作 保留最近 window 秒的建立连接时间和首字节时间的滚动直方图，
+(连接超时, 读取超时) 取 p99 × factor，再限制在平台的 TimeoutPolicy 的 floor 和 ceiling 之间。
+这个操作的样本不够的时候用整个平台的直方图，还不够的时候用 policy.default。
+超时的请求按 ceiling 记一个样本，源OJ变慢之后超时跟着变长:
+
+    VJ_ADAPTIVE_TIMEOUT=off VJ_TIMEOUT_FACTOR=3 VJ_TIMEOUT_WINDOW=600
+
+操作是 spider.metrics.operation 设置的标签 (get_problem, submit, get_result ...)。
+Core(oj_name, timeout=5) 或者 timeout=(3, 10) 指定的超时优先，这个 Core 的请求不再自适应，但是仍然记录样本
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from spider.metrics import current_operation, platform_of
+
+# 0.01 秒到 2 分钟左右，每个桶比上一个大 25%
+TIMEOUT_BUCKETS = tuple(round(0.01 * 1.25 ** i, 4) for i in range(43))
+
+FACTOR = float(os.getenv('VJ_TIMEOUT_FACTOR', 3))
+WINDOW = float(os.getenv('VJ_TIMEOUT_WINDOW', 600))
+
+
+def normalize_timeout(timeout):
+    """
+    数字或者 (连接超时, 读取超时) 统一成二元组，为空的时候返回 None
+    """
+    if timeout is None:
+        return None
+    if isinstance(timeout, (int, float)):
+        return float(timeout), float(timeout)
+    connect, read = timeout
+    return float(connect), float(read)
+
+
+class RollingHistogram(object):
+    """
+    最近 window 秒的直方图，分成 slots 段，过期的段整段丢掉
+    """
+
+    def __init__(self, window=WINDOW, slots=10, buckets=TIMEOUT_BUCKETS):
+        self.window = window
+        self.buckets = buckets
+        self._slots = slots
+        self._slot_seconds = window / slots
+        self._counts = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, slot):
+        while self._counts and self._counts[0][0] <= slot - self._slots:
+            self._counts.popleft()
+
+    def observe(self, value):
+        slot = int(time.monotonic() // self._slot_seconds)
+        with self._lock:
+            self._expire(slot)
+            if not self._counts or self._counts[-1][0] != slot:
+                self._counts.append((slot, [0] * (len(self.buckets) + 1)))
+            self._counts[-1][1][bisect_left(self.buckets, value)] += 1
+
+    def _merged(self):
+        with self._lock:
+            self._expire(int(time.monotonic() // self._slot_seconds))
+            merged = [0] * (len(self.buckets) + 1)
+            for _, counts in self._counts:
+                for index, count in enumerate(counts):
+                    merged[index] += count
+            return merged
+
+    def count(self):
+        return sum(self._merged())
+
+    def quantile(self, q):
+        """
+        返回包含第 q 分位样本的桶的上界，没有样本的时候返回 None，超出最后一个桶的时候返回最后一个桶的上界
+        """
+        merged = self._merged()
+        total = sum(merged)
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for index, count in enumerate(merged):
+            seen += count
+            if seen >= target:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+
+class TimeoutPolicy(object):
+    """
+    :param floor: (连接超时, 读取超时) 的下限
+    :param ceiling: (连接超时, 读取超时) 的上限，超时的请求按这个值记样本
+    :param factor: 超时为 quantile 分位的耗时乘以 factor
+    :param quantile: 使用的分位
+    :param min_samples: 直方图中的样本少于这个数的时候不使用
+    :param default: 样本不够的时候使用的超时，默认等于 ceiling
+    """
+
+    def __init__(self, floor=(1.0, 2.0), ceiling=(7.0, 12.0), factor=FACTOR, quantile=0.99, min_samples=20,
+                 default=None):
+        self.floor = normalize_timeout(floor)
+        self.ceiling = normalize_timeout(ceiling)
+        self.factor = factor
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.default = normalize_timeout(default) or self.ceiling
+
+    def clamp(self, index, value):
+        return min(self.ceiling[index], max(self.floor[index], value * self.factor))
+
+
+# 各平台的超时范围，没有配置的平台和不属于任何平台的域名 (other) 使用 DEFAULT_POLICY
+default_policies = {
+    # judgeapi 是 JSON 接口，响应很快
+    'Aizu': TimeoutPolicy(floor=(0.5, 1.0), ceiling=(5.0, 8.0)),
+    # 老的评测系统，高峰期首字节经常要好几秒
+    'POJ': TimeoutPolicy(floor=(2.0, 3.0), ceiling=(10.0, 20.0)),
+    'ZOJ': TimeoutPolicy(floor=(2.0, 3.0), ceiling=(10.0, 20.0)),
+}
+DEFAULT_POLICY = TimeoutPolicy()
+
+
+class AdaptiveTimeouts(object):
+    """
+    :param policies: {平台: TimeoutPolicy}，也可以用 {(平台, 操作): TimeoutPolicy} 单独配置一个操作
+    :param enabled: 为 False 的时候一直使用 policy.default
+    :param window: 滚动直方图的秒数
+    """
+
+    def __init__(self, policies=None, enabled=True, window=WINDOW):
+        self._policies = dict(default_policies if policies is None else policies)
+        self.enabled = enabled
+        self.window = window
+        # (平台, 操作) -> (连接时间, 首字节时间)，操作为空的是整个平台
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def set_policy(self, oj_name, policy, operation=None):
+        with self._lock:
+            key = (oj_name, operation) if operation else oj_name
+            if policy is None:
+                self._policies.pop(key, None)
+            else:
+                self._policies[key] = policy
+
+    def policy(self, platform, operation=None):
+        return self._policies.get((platform, operation)) or self._policies.get(platform) or DEFAULT_POLICY
+
+    def _histogram_pair(self, platform, operation):
+        key = (platform, operation)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = (RollingHistogram(self.window), RollingHistogram(self.window))
+            return self._histograms[key]
+
+    def timeout_for(self, url):
+        """
+        返回这个地址在当前操作中使用的 (连接超时, 读取超时)
+        """
+        return self.timeout(platform_of(url), current_operation())
+
+    def timeout(self, platform, operation=''):
+        policy = self.policy(platform, operation)
+        if not self.enabled:
+            return policy.default
+        timeout = list(policy.default)
+        pairs = [self._histogram_pair(platform, operation)]
+        if operation:
+            pairs.append(self._histogram_pair(platform, ''))
+        for index in (0, 1):
+            for pair in pairs:
+                if pair[index].count() >= policy.min_samples:
+                    timeout[index] = policy.clamp(index, pair[index].quantile(policy.quantile))
+                    break
+        return tuple(timeout)
+
+    def observe(self, url, connect, ttfb):
+        """
+        记录一次成功的请求，connect 为空表示复用了连接或者没有测量
+        """
+        platform, operation = platform_of(url), current_operation()
+        for key in {operation, ''}:
+            pair = self._histogram_pair(platform, key)
+            if connect:
+                pair[0].observe(connect)
+            pair[1].observe(ttfb)
+
+    # 超时的请求按 ceiling 记样本，phase 为 connect 或者 read
+    def observe_timeout(self, url, phase):
+        platform, operation = platform_of(url), current_operation()
+        index = 0 if phase == 'connect' else 1
+        value = self.policy(platform, operation).ceiling[index]
+        for key in {operation, ''}:
+            self._histogram_pair(platform, key)[index].observe(value)
+
+    def stats(self):
+        """
+        {(平台, 操作): {'connect': 样本数, 'read': 样本数, 'timeout': (连接超时, 读取超时)}}
+        """
+        with self._lock:
+            keys = list(self._histograms)
+        stats = {}
+        for platform, operation in keys:
+            connect, read = self._histogram_pair(platform, operation)
+            stats[(platform, operation)] = {'connect': connect.count(), 'read': read.count(),
+                                            'timeout': self.timeout(platform, operation)}
+        return stats
+
+
+timeouts = AdaptiveTimeouts(enabled=os.getenv('VJ_ADAPTIVE_TIMEOUT', 'on') != 'off')
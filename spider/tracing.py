@@ -0,0 +1,422 @@
+import collections
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+from spider.config import Result
+from spider.log import logger
+from spider.metrics import Histogram, MetricsSink, metrics
+
+# 源OJ显示这些状态的时候代码还在排队，其余运行中的状态 (Compiling, Running ...) 认为已经开始评测
+QUEUED_VERDICTS = frozenset(['Queuing', 'Waiting', 'Pending', 'Pending Rejudge', 'In queue'])
+# 排队和评测耗时的分桶 (秒)
+JUDGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+_current = contextvars.ContextVar('spider_trace', default=None)
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+class Span(object):
+    """
+    trace 中的一段，时间为 unix 时间戳 (秒)
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, start=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, end=None):
+        if self.end is None:
+            self.end = time.time() if end is None else end
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class SubmissionTrace(object):
+    """
+    一次提交从调用 submit 到拿到最终结果的全过程
+
+    submitted_at: 源OJ接受提交的时间
+    judging_at: 第一次查询到已经不在排队的时间
+    finished_at: 第一次查询到最终结果的时间
+    queue_time / judge_time 的精度受轮询间隔限制，都是按查询到的时间计算
+    """
+
+    def __init__(self, platform, pid, username=None):
+        self.trace_id = _new_id(16)
+        self.platform = platform
+        self.pid = pid
+        self.root = Span('submission', self.trace_id, attributes={'platform': platform, 'pid': str(pid)})
+        if username is not None:
+            self.root.set('account', username)
+        self.spans = [self.root]
+        self.submitted_at = None
+        self.judging_at = None
+        self.finished_at = None
+        self.polls = 0
+        self.verdict = None
+        self.verdict_info = None
+        self._lock = threading.Lock()
+
+    def add_span(self, name, parent=None, start=None, end=None, **attributes):
+        span = Span(name, self.trace_id, (parent or self.root).span_id, start, attributes)
+        if end is not None:
+            span.finish(end)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def activate(self):
+        return activate(self)
+
+    def mark_submitted(self, result):
+        self.submitted_at = time.time()
+        if result.unique_key is not None:
+            self.root.set('rid', str(result.unique_key))
+
+    def observe(self, result, span=None):
+        """
+        记录一次查询到的结果，span 为这次查询对应的 span
+        """
+        when = time.time()
+        self.polls += 1
+        if span is not None:
+            span.set('status', result.status.value)
+            if result.verdict is not None:
+                span.set('verdict', result.verdict.value)
+                span.set('verdict_info', str(result.verdict_info))
+        if result.status != Result.Status.STATUS_RESULT_SUCCESS or self.finished_at is not None:
+            return
+        if result.verdict == Result.Verdict.VERDICT_RUNNING:
+            if self.judging_at is None and result.verdict_info not in QUEUED_VERDICTS:
+                self.judging_at = when
+            return
+        self.judging_at = self.judging_at or when
+        self.finished_at = when
+        self.verdict = result.verdict
+        self.verdict_info = result.verdict_info
+
+    def finish(self, result=None):
+        if self.root.end is not None:
+            return False
+        if result is not None:
+            self.root.set('status', result.status.value)
+            if result.unique_key is not None:
+                self.root.set('rid', str(result.unique_key))
+        if self.verdict is not None:
+            self.root.set('verdict', self.verdict.value)
+        self.root.set('polls', self.polls)
+        self.root.finish()
+        return True
+
+    @property
+    def queue_time(self):
+        if self.submitted_at is None or self.judging_at is None:
+            return None
+        return max(0.0, self.judging_at - self.submitted_at)
+
+    @property
+    def judge_time(self):
+        if self.judging_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.judging_at
+
+    # 从开始提交到能看到最终结果的时间
+    @property
+    def verdict_latency(self):
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.root.start
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'platform': self.platform,
+            'pid': str(self.pid),
+            'verdict': self.verdict.value if self.verdict is not None else None,
+            'verdict_info': self.verdict_info,
+            'polls': self.polls,
+            'submitted_at': self.submitted_at,
+            'queue_time': self.queue_time,
+            'judge_time': self.judge_time,
+            'verdict_latency': self.verdict_latency,
+            'spans': [span.to_dict() for span in self.spans],
+        }
+
+    def to_otlp(self):
+        """
+        OTLP/JSON 格式 (ExportTraceServiceRequest)，可以直接 POST 到 collector 的 /v1/traces
+        """
+        spans = []
+        for span in self.spans:
+            item = {
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 3 if span.name == 'http' else 1,
+                'startTimeUnixNano': str(int(span.start * 1e9)),
+                'endTimeUnixNano': str(int((span.end or span.start) * 1e9)),
+                'attributes': [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+            }
+            if span.parent_id:
+                item['parentSpanId'] = span.parent_id
+            spans.append(item)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', 'spider')]},
+            'scopeSpans': [{'scope': {'name': 'spider.tracing'}, 'spans': spans}],
+        }]}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class activate(object):
+    """
+    在 with 语句中把 trace 设为当前的 trace，期间的 stage 和 HTTP 请求都记录到它下面，trace 为空的时候什么都不做
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._token = None
+
+    def __enter__(self):
+        if self.trace is not None:
+            self._token = _current.set((self.trace, self.trace.root))
+        return self.trace
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+
+
+class stage(object):
+    """
+    在当前 trace 中记录一段子 span，没有 trace 的时候什么都不做。和 spider.metrics.operation 一样，
+    可以当作 with 语句使用，也可以装饰普通函数和 async 函数
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._tokens = []
+
+    def __enter__(self):
+        current = _current.get()
+        if current is None:
+            self._tokens.append(None)
+            return None
+        trace, parent = current
+        span = trace.add_span(self.name, parent, **self.attributes)
+        self._tokens.append((_current.set((trace, span)), span))
+        return span
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        item = self._tokens.pop()
+        if item is None:
+            return
+        token, span = item
+        if exc_val is not None:
+            span.error = f'{type(exc_val).__name__}: {exc_val}'
+        span.finish()
+        _current.reset(token)
+
+    def __call__(self, func):
+        name, attributes = self.name, self.attributes
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if _current.get() is None:
+                    return await func(*args, **kwargs)
+                with stage(name, **attributes):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if _current.get() is None:
+                    return func(*args, **kwargs)
+                with stage(name, **attributes):
+                    return func(*args, **kwargs)
+        return wrapper
+
+
+def current_trace():
+    current = _current.get()
+    return current[0] if current else None
+
+
+def mark_submitted(result):
+    """
+    Core.submit 成功之后调用，记录源OJ接受提交的时间
+    """
+    current = _current.get()
+    if current and result.status == Result.Status.STATUS_SUBMIT_SUCCESS:
+        current[0].mark_submitted(result)
+    return result
+
+
+def observe(result):
+    """
+    Core 查询到结果之后调用，把结果记录到当前 trace 和当前的 poll span
+    """
+    current = _current.get()
+    if current:
+        current[0].observe(result, current[1])
+    return result
+
+
+class TraceExporter(object):
+    """
+    trace 结束之后的接收者
+    """
+
+    def export(self, trace):
+        pass
+
+
+class MemoryExporter(TraceExporter):
+    """
+    保留最近 maxlen 个 trace，并按平台统计排队时间、评测时间和出结果的总时间
+    """
+
+    def __init__(self, maxlen=1000, buckets=JUDGE_BUCKETS):
+        self.traces = collections.deque(maxlen=maxlen)
+        self._buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        with self._lock:
+            self.traces.append(trace)
+            for name in ('queue_time', 'judge_time', 'verdict_latency'):
+                value = getattr(trace, name)
+                if value is None:
+                    continue
+                key = (trace.platform, name)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(self._buckets)
+                self._histograms[key].observe(value)
+
+    def percentiles(self, quantiles=(0.5, 0.9, 0.99)):
+        """
+        返回 {平台: {'queue_time': {'count': n, 'p50': ..., ...}, 'judge_time': ..., 'verdict_latency': ...}}
+        """
+        summary = {}
+        with self._lock:
+            for (platform, name), histogram in sorted(self._histograms.items()):
+                item = {'count': histogram.count}
+                for q in quantiles:
+                    item[f'p{q * 100:g}'] = histogram.quantile(q)
+                summary.setdefault(platform, {})[name] = item
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self.traces.clear()
+            self._histograms.clear()
+
+
+class JsonLinesExporter(TraceExporter):
+    """
+    每个 trace 追加一行 JSON 到文件，otlp 为真的时候写 OTLP/JSON 格式
+    """
+
+    def __init__(self, path, otlp=False):
+        self.path = path
+        self.otlp = otlp
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_otlp() if self.otlp else trace.to_dict(), ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class Tracer(object):
+    """
+    为每次提交创建 SubmissionTrace，结束之后交给所有 exporter。
+    设置环境变量 VJ_TRACING=off 之后不记录，VJ_TRACE_FILE 指定的时候额外写入 JSON lines 文件
+    """
+
+    def __init__(self, exporters=None, enabled=True):
+        self._exporters = list(exporters or [])
+        self.enabled = enabled
+
+    def add_exporter(self, exporter):
+        self._exporters = self._exporters + [exporter]
+
+    def remove_exporter(self, exporter):
+        self._exporters = [item for item in self._exporters if item is not exporter]
+
+    def start(self, platform, pid, username=None):
+        if not self.enabled or not self._exporters:
+            return None
+        return SubmissionTrace(platform, pid, username)
+
+    def finish(self, trace, result=None):
+        if trace is None or not trace.finish(result):
+            return
+        for exporter in self._exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                logger.exception(e)
+
+
+class _HttpSpans(MetricsSink):
+    # 把 HttpUtil 记录的每次请求作为 http span 挂到当前的 trace 下面
+    def record_request(self, span):
+        current = _current.get()
+        if current is None:
+            return
+        end = time.time()
+        trace, parent = current
+        child = trace.add_span('http', parent, start=end - span.total, end=end, method=span.method, url=span.url,
+                               status=span.status, bytes=span.bytes, connect=span.connect, ttfb=span.ttfb)
+        child.error = span.error
+
+
+memory_exporter = MemoryExporter()
+tracer = Tracer([memory_exporter], enabled=os.getenv('VJ_TRACING', 'on') != 'off')
+if os.getenv('VJ_TRACE_FILE'):
+    tracer.add_exporter(JsonLinesExporter(os.getenv('VJ_TRACE_FILE'), otlp=os.getenv('VJ_TRACE_FORMAT') == 'otlp'))
+metrics.add_sink(_HttpSpans())
@@ -1,38 +1,164 @@
-import logging
+import json as jsonlib
 import os
+import re
+import threading
+import time
+from email.utils import formatdate
 from enum import Enum
+from http.cookiejar import http2time
+from urllib.parse import urlencode
 
 import requests
 from bs4 import element
 from requests import RequestException
-import traceback
-
-LOG_BASE = '/log' if os.getenv('VJ_ENV') == 'production' else 'log'
-LOG_LEVEL = logging.WARNING if os.getenv('VJ_ENV') == 'production' else logging.INFO
-SPIDER_LOG_PATH = os.path.join(LOG_BASE, 'spider.log')
-try:
-    os.makedirs(LOG_BASE)
-except FileExistsError:
-    pass
-except:
-    traceback.print_exc()
-logger = logging.getLogger(__name__)
-handler = logging.FileHandler(SPIDER_LOG_PATH) if os.getenv('VJ_ENV') == 'production' else logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from requests.adapters import HTTPAdapter
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from spider.breaker import breakers
+from spider.limiter import limiter
+from spider.log import LOG_BASE, LOG_LEVEL, SPIDER_LOG_PATH, handler, logger  # noqa: F401
+from spider.metrics import RequestSpan, metrics
+from spider.redirect import redirector
+from spider.timeouts import normalize_timeout, timeouts
+
+
+LOGIN_TTL = float(os.getenv('VJ_LOGIN_TTL', 300))
+
+
+class LoginState(object):
+    """
+    记录一个 session 的登录状态，在 ttl 秒之内认为仍然处于登录状态，不再请求主页检查。
+    如果响应被重定向到登录页面，或者返回 401，立即失效。
+
+    totals() 返回进程内所有 session 的统计:
+        hits: 省掉的 is_login 请求数
+        misses: 实际发出的 is_login 请求数
+        invalidations: 因为登出或者登录跳转导致的失效次数
+    """
+    _totals = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    _totals_lock = threading.Lock()
+
+    def __init__(self, ttl=LOGIN_TTL, login_pattern=None):
+        self._ttl = ttl
+        self._login_pattern = re.compile(login_pattern) if login_pattern else None
+        self._expires = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _count(self, name):
+        setattr(self, name, getattr(self, name) + 1)
+        with LoginState._totals_lock:
+            LoginState._totals[name] += 1
+
+    # 缓存有效的时候返回 True，调用方可以跳过 is_login 的请求
+    def is_fresh(self):
+        if time.monotonic() < self._expires:
+            self._count('hits')
+            return True
+        self._count('misses')
+        return False
+
+    # 和 is_fresh 相同，但不计入统计
+    def peek(self):
+        return time.monotonic() < self._expires
+
+    def mark(self):
+        self._expires = time.monotonic() + self._ttl
+
+    def invalidate(self):
+        if self._expires:
+            self._expires = 0
+            self._count('invalidations')
+
+    # 检查每一个响应，发现登出的迹象时让缓存失效
+    def inspect(self, response):
+        if response is None or not self._expires:
+            return
+        if response.status_code == 401:
+            self.invalidate()
+        elif self._login_pattern and getattr(response, 'history', None) and \
+                self._login_pattern.search(str(response.url)):
+            self.invalidate()
+
+    @staticmethod
+    def totals():
+        with LoginState._totals_lock:
+            return dict(LoginState._totals)
+
+
+class _ConnectTimer(threading.local):
+    value = 0.0
+
+
+# 当前线程的请求中建立连接花费的时间，复用连接的时候不会增加
+_connect_timer = _ConnectTimer()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timer.value += time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timer.value += time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    统计建立连接时间的 HTTPAdapter，使用代理的时候不统计
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+# 熔断期间不发出请求，和请求失败一样返回 None
+def _reject(span):
+    if span is not None:
+        span.error = 'CircuitOpen'
+        metrics.record_request(span)
+    return None
 
 
 class HttpUtil(object):
     def __init__(self, headers=None, code_type=None, cookies=None, *args, **kwargs):
         self._headers = headers
         self._request = requests.session()
+        self._request.mount('http://', TimedHTTPAdapter())
+        self._request.mount('https://', TimedHTTPAdapter())
         self._code_type = code_type
-        self._timeout = (7, 12)
+        # 为空的时候使用 spider.timeouts 中按 平台/操作 自适应的超时
+        self._timeout = normalize_timeout(kwargs.get('timeout'))
         self._response = None
         self._advanced = False
         self._proxies = None
+        self._session_key = None
+        self._saved_cookies = None
+        self.login_state = LoginState(ttl=kwargs.get('login_ttl', LOGIN_TTL),
+                                      login_pattern=kwargs.get('login_pattern'))
         if kwargs.get('proxies'):
             self._proxies = {
                 'http': kwargs.get('proxies'),
@@ -44,22 +170,50 @@ class HttpUtil(object):
             self._request.cookies.update(cookies)
 
     def get(self, url, **kwargs):
-        try:
-            self._response = self._request.get(url, timeout=self._timeout, proxies=self._proxies, **kwargs)
-            if self._code_type and self._response:
-                self._response.encoding = self._code_type
-            return self._response
-        except RequestException as e:
-            logger.exception(e)
-            return None
+        return self._send('GET', url, **kwargs)
 
     def post(self, url, data=None, json=None, **kwargs):
+        return self._send('POST', url, data=data, json=json, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        span = RequestSpan(method, url) if metrics.active else None
+        if not breakers.allow(url):
+            return _reject(span)
+        source, url = url, redirector.rewrite(url)
+        limiter.acquire(url)
         try:
-            self._response = self._request.post(url, data, json, timeout=self._timeout, proxies=self._proxies, **kwargs)
-            if self._code_type and self._response:
-                self._response.encoding = self._code_type
-            return self._response
+            _connect_timer.value = 0.0
+            start = time.perf_counter()
+            # 记录指标的时候先只读响应头，分开统计首字节时间和下载响应体的时间
+            # 多个线程共用一个 HttpUtil 的时候 self._response 会被覆盖，返回局部变量
+            response = self._request.request(method, url, timeout=self._timeout or timeouts.timeout_for(source),
+                                             proxies=self._proxies, stream=span is not None, **kwargs)
+            self._response = response
+            timeouts.observe(source, _connect_timer.value, response.elapsed.total_seconds())
+            if span is not None:
+                span.ttfb = time.perf_counter() - start
+                span.bytes = len(response.content)
+                span.total = time.perf_counter() - start
+                span.connect = _connect_timer.value
+                span.status = response.status_code
+                retries = getattr(response.raw, 'retries', None)
+                span.retries = len(retries.history) if retries else 0
+                metrics.record_request(span)
+            if self._code_type and response:
+                response.encoding = self._code_type
+            breakers.record(source, response.status_code >= 500)
+            self.login_state.inspect(response)
+            if self._session_key is not None and (response.cookies or any(item.cookies for item in response.history)):
+                self.save_session(changed_only=True)
+            return response
         except RequestException as e:
+            if span is not None:
+                span.total = time.perf_counter() - start
+                span.error = type(e).__name__
+                metrics.record_request(span)
+            if isinstance(e, (ConnectTimeout, ReadTimeout)):
+                timeouts.observe_timeout(source, 'connect' if isinstance(e, ConnectTimeout) else 'read')
+            breakers.record(source, True)
             logger.exception(e)
             return None
 
@@ -71,6 +225,29 @@ class HttpUtil(object):
     def cookies(self):
         return self._request.cookies
 
+    def bind_session(self, store, oj_name, username):
+        """
+        绑定到 spider.session.SessionStore 中的一个会话，载入保存的 cookies，之后响应带回新的 cookies 时自动写回
+        """
+        self._session_key = (store, oj_name, username)
+        records = store.load(oj_name, username)
+        for record in records or ():
+            self._request.cookies.set(record['name'], record['value'], domain=record.get('domain') or '',
+                                      path=record.get('path') or '/', expires=record.get('expires'))
+        self._saved_cookies = records
+        return records
+
+    def save_session(self, changed_only=False):
+        if self._session_key is None:
+            return
+        records = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                    'expires': cookie.expires} for cookie in self._request.cookies]
+        if changed_only and records == self._saved_cookies:
+            return
+        store, oj_name, username = self._session_key
+        store.save(oj_name, username, records)
+        self._saved_cookies = records
+
     @staticmethod
     def abs_url(remote_path, oj_prefix):
         """
@@ -85,6 +262,241 @@ class HttpUtil(object):
         return file_name, remote_path
 
 
+class AsyncResponse(object):
+    """
+    异步请求的响应对象，接口和 requests.Response 保持一致，各平台的 Parser 可以直接解析
+    """
+
+    def __init__(self, status_code, content, headers, url, encoding=None, history=()):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.url = url
+        self.encoding = encoding
+        self.history = history
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return jsonlib.loads(self.text)
+
+    def __bool__(self):
+        return self.ok
+
+
+class AsyncCookies(object):
+    """
+    aiohttp CookieJar 的包装，提供和 RequestsCookieJar 相同的 get_dict 和 update
+    """
+
+    def __init__(self, cookies=None):
+        self._pending = dict(cookies) if cookies else {}
+        self._pending_records = []
+        self._jar = None
+        # (domain, path, name, value) -> 过期时间戳
+        self._expires = {}
+
+    def bind(self, jar):
+        self._jar = jar
+        if self._pending:
+            jar.update_cookies(self._pending)
+            self._pending = {}
+        if self._pending_records:
+            self.restore(self._pending_records)
+            self._pending_records = []
+
+    # 带 domain 和 path 的 cookies，见 spider.session.cookie_records
+    def records(self):
+        if self._jar is None:
+            return [{'name': name, 'value': value, 'domain': '', 'path': '/', 'expires': None}
+                    for name, value in self._pending.items()] + list(self._pending_records)
+        return [{'name': morsel.key, 'value': morsel.value, 'domain': morsel['domain'], 'path': morsel['path'] or '/',
+                 'expires': self.expires(morsel)} for morsel in self._jar]
+
+    def expires(self, morsel):
+        """
+        和 requests 的 cookie.expires 一样返回整数时间戳，会话 cookie 返回 None。
+        max-age 是相对收到 cookie 的时间，第一次见到这个 cookie 的时候换算，之后保持不变
+        """
+        key = (morsel['domain'], morsel['path'], morsel.key, morsel.value)
+        if key not in self._expires:
+            expires = None
+            if morsel['max-age']:
+                try:
+                    expires = int(time.time()) + int(morsel['max-age'])
+                except ValueError:
+                    pass
+            elif morsel['expires']:
+                expires = http2time(morsel['expires'])
+            self._expires[key] = expires
+        return self._expires[key]
+
+    def restore(self, records):
+        if self._jar is None:
+            self._pending_records.extend(records)
+            return
+        from http.cookies import SimpleCookie
+        for record in records:
+            cookie = SimpleCookie()
+            cookie[record['name']] = record['value']
+            cookie[record['name']]['domain'] = record.get('domain') or ''
+            cookie[record['name']]['path'] = record.get('path') or '/'
+            if record.get('expires'):
+                cookie[record['name']]['expires'] = formatdate(record['expires'], usegmt=True)
+            self._jar.update_cookies(cookie)
+
+    def get_dict(self):
+        if self._jar is None:
+            return dict(self._pending)
+        return {morsel.key: morsel.value for morsel in self._jar}
+
+    def update(self, cookies):
+        if self._jar is None:
+            self._pending.update(cookies)
+        else:
+            self._jar.update_cookies(cookies)
+
+
+def _connect_trace_config():
+    """
+    aiohttp 的 TraceConfig，把建立连接的时间记到请求的 RequestSpan 上
+    """
+    import aiohttp
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.connect += time.perf_counter() - context.connect_start
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+class AsyncHttpUtil(object):
+    """
+    基于 aiohttp 的 HttpUtil，方法和 HttpUtil 一一对应，只是 get 和 post 需要 await
+    """
+
+    def __init__(self, headers=None, code_type=None, cookies=None, *args, **kwargs):
+        self._headers = headers
+        self._code_type = code_type
+        self._timeout = normalize_timeout(kwargs.get('timeout'))
+        self._session = None
+        self._cookies = AsyncCookies(cookies)
+        self._proxy = kwargs.get('proxies')
+        self._session_key = None
+        self._saved_cookies = None
+        self.login_state = LoginState(ttl=kwargs.get('login_ttl', LOGIN_TTL),
+                                      login_pattern=kwargs.get('login_pattern'))
+
+    def _get_session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            jar = aiohttp.CookieJar(unsafe=True)
+            self._cookies.bind(jar)
+            self._session = aiohttp.ClientSession(
+                headers=self._headers, cookie_jar=jar, trace_configs=[_connect_trace_config()])
+        return self._session
+
+    async def _request(self, method, url, data=None, **kwargs):
+        import asyncio
+        import aiohttp
+        if isinstance(data, dict):
+            # 和 requests 保持相同的表单编码方式，避免 bytes 字段被 aiohttp 当成文件上传
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            data = urlencode(data, doseq=True)
+            kwargs['headers'] = headers
+        span = RequestSpan(method, url) if metrics.active else None
+        if not breakers.allow(url):
+            return _reject(span)
+        source, url = url, redirector.rewrite(url)
+        delay = limiter.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        connect, read = self._timeout or timeouts.timeout_for(source)
+        try:
+            start = time.perf_counter()
+            async with self._get_session().request(method, url, data=data, proxy=self._proxy,
+                                                   timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+                                                   trace_request_ctx=span, **kwargs) as res:
+                ttfb = time.perf_counter() - start
+                timeouts.observe(source, span.connect if span is not None else None, ttfb)
+                content = await res.read()
+                if span is not None:
+                    span.ttfb = ttfb
+                    span.total = time.perf_counter() - start
+                    span.bytes = len(content)
+                    span.status = res.status
+                    metrics.record_request(span)
+                encoding = self._code_type or get_encoding_from_headers(res.headers)
+                response = AsyncResponse(res.status, content, res.headers, str(res.url), encoding, res.history)
+                breakers.record(source, res.status >= 500)
+                self.login_state.inspect(response)
+                if self._session_key is not None and (res.cookies or any(item.cookies for item in res.history)):
+                    await self.save_session(changed_only=True)
+                return response
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if span is not None:
+                span.total = time.perf_counter() - start
+                span.error = type(e).__name__
+                metrics.record_request(span)
+            if isinstance(e, asyncio.TimeoutError):
+                connect_timeout = getattr(aiohttp, 'ConnectionTimeoutError', ())
+                timeouts.observe_timeout(source, 'connect' if isinstance(e, connect_timeout) else 'read')
+            breakers.record(source, True)
+            logger.exception(e)
+            return None
+
+    async def get(self, url, **kwargs):
+        return await self._request('GET', url, **kwargs)
+
+    async def post(self, url, data=None, json=None, **kwargs):
+        return await self._request('POST', url, data=data, json=json, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def cookies(self):
+        return self._cookies
+
+    # 和 HttpUtil 相同，读写 sqlite 放到线程池中，不阻塞事件循环
+    async def bind_session(self, store, oj_name, username):
+        self._session_key = (store, oj_name, username)
+        records = await store.load_async(oj_name, username)
+        if records:
+            self._cookies.restore(records)
+        self._saved_cookies = records
+        return records
+
+    async def save_session(self, changed_only=False):
+        if self._session_key is None:
+            return
+        records = self._cookies.records()
+        if changed_only and records == self._saved_cookies:
+            return
+        store, oj_name, username = self._session_key
+        self._saved_cookies = records
+        await store.save_async(oj_name, username, records)
+
+
 class HtmlTag(object):
     class TagDesc(Enum):
         """
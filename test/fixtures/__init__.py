@@ -0,0 +1,49 @@
+import os
+
+from spider.utils import AsyncResponse
+
+FIXTURE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 每个平台的离线页面: 目录, 编码, 题号, 题目页, 结果页
+# 这些页面是按各 OJ 的页面结构手工构造的, 不是真实抓取的响应; 题目页约 2-4 KB,
+# 结果页约 7-14 KB, 其余约 1-3 KB. 基准测试的数字只反映解析器在这些小页面上的相对开销
+pages = {
+    'HDU': ('hdu', 'gb18030', '1000', 'problem.html', 'status.html'),
+    'POJ': ('poj', 'utf-8', '1000', 'problem.html', 'status.html'),
+    'ZOJ': ('zoj', 'utf-8', '1001', 'problem.html', 'status.html'),
+    'WUST': ('wust', 'utf-8', '1000', 'problem.html', 'status.html'),
+    'Aizu': ('aizu', 'utf-8', 'ITP1_1_A', 'problem.json', 'verdict.json'),
+    'Codeforces': ('codeforces', 'utf-8', '1A', 'problem.html', 'submission.html'),
+}
+
+# 其余页面: 登录后的首页 (is_login 检查的标记), 未登录的首页, 带语言列表的提交页
+corpus = {
+    'HDU': {'home': 'home.html', 'login': 'login.html', 'language': 'submit.html'},
+    'POJ': {'home': 'home.html', 'login': 'login.html', 'language': 'submit.html'},
+    'ZOJ': {'home': 'home.html', 'login': 'login.html', 'language': 'submit.html'},
+    'WUST': {'home': 'home.html', 'login': 'login.html', 'language': 'submit.html'},
+    'Aizu': {'home': 'self.json'},
+    'Codeforces': {'home': 'home.html', 'login': 'login.html', 'language': 'submit.html'},
+}
+
+
+def fixture_path(oj_name, name):
+    return os.path.join(FIXTURE_DIR, pages[oj_name][0], name)
+
+
+def load_response(oj_name, name, status_code=200):
+    """
+    把离线保存的页面包装成和 requests.Response 接口一致的响应
+    """
+    path = fixture_path(oj_name, name)
+    with open(path, 'rb') as f:
+        content = f.read()
+    return AsyncResponse(status_code, content, {}, 'file://' + path, encoding=pages[oj_name][1])
+
+
+def problem_response(oj_name):
+    return load_response(oj_name, pages[oj_name][3])
+
+
+def result_response(oj_name):
+    return load_response(oj_name, pages[oj_name][4])
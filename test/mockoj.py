@@ -0,0 +1,742 @@
+"""
+本地模拟的源OJ，页面结构和 test/fixtures 中保存的页面一致，可以在没有网络的环境下跑通 登录 -> 提交 -> 轮询 -> 结果 的完整流程。
+提交之后先排队 queue 秒，再运行 run 秒，然后给出最终结果：代码中包含 "wrong answer" 的判为 WA，
+包含 "compile error" 的判为 CE，其余判为 AC。
+
+    python -m test.mockoj --port 8800 --latency 0.05 --error-rate 0.01 --throttle 50
+    VJ_OJ_BASE=http://127.0.0.1:8800 python server-test.py
+
+在测试中使用:
+
+    with MockFarm(judge_time=(0.1, 0.1)):
+        core = Core('HDU')
+        core.submit(account, '1000', '0', code)
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from spider.redirect import redirector
+from test.fixtures import corpus, fixture_path, pages
+
+AC, WA, CE = 'AC', 'WA', 'CE'
+QUEUE, RUN = 'queue', 'run'
+# 登录 cookie 的 Max-Age
+SESSION_MAX_AGE = 3600
+
+# 每个平台可以提交的 (题号, 语言)
+targets = {
+    'HDU': ('1000', '0'),
+    'POJ': ('1000', '0'),
+    'ZOJ': ('1001', '1'),
+    'WUST': ('1000', '1'),
+    'Aizu': ('ITP1_1_A', 'C++'),
+    'Codeforces': ('1A', '54'),
+}
+
+
+def verdict_of(code):
+    code = str(code).lower()
+    if 'compile error' in code:
+        return CE
+    if 'wrong answer' in code:
+        return WA
+    return AC
+
+
+class Request(object):
+    def __init__(self, method, path, query, form, body, cookies, headers=None):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.form = form
+        self.body = body
+        self.cookies = cookies
+        self.headers = headers or {}
+        self.user = None
+
+    def arg(self, name, default=''):
+        value = self.form.get(name) or self.query.get(name)
+        return value[0] if value else default
+
+    def json(self):
+        return json.loads(self.body or b'{}')
+
+
+class Response(object):
+    def __init__(self, status=200, body=b'', content_type='text/html', headers=None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or []
+
+
+class Submission(object):
+    def __init__(self, rid, user, pid, language, code):
+        self.rid = rid
+        self.user = user
+        self.pid = str(pid)
+        self.language = str(language)
+        self.code = code
+        self.created = time.monotonic()
+        self.submitted_at = time.time()
+        self.submit_time = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    def stage(self, judge_time):
+        elapsed = time.monotonic() - self.created
+        if elapsed < judge_time[0]:
+            return QUEUE
+        if elapsed < judge_time[0] + judge_time[1]:
+            return RUN
+        return verdict_of(self.code)
+
+
+class Judge(object):
+    """
+    一个模拟的源OJ，子类提供路由和状态页中一行的格式，页面的其余部分直接使用 test/fixtures 中保存的页面
+    """
+    name = None
+    host = None
+    session_cookie = 'JSESSIONID'
+    first_rid = 1
+    page_size = 20
+    # 状态页中一行的正则，用来把保存的页面切成 表头 + 行 + 表尾
+    row_pattern = None
+    verdicts = {}
+    # 题面中的图片和附件，返回按文件名生成的内容，不同目录下的同名文件内容相同
+    asset_pattern = r'\.(?:png|jpe?g|gif|pdf|zip)$|/showImage$'
+
+    def __init__(self, farm):
+        self.farm = farm
+        self.encoding = pages[self.name][1]
+        self.submissions = []
+        self._next_rid = self.first_rid
+        self._lock = threading.Lock()
+        self._pages = {}
+
+    def page(self, name):
+        if name not in self._pages:
+            with open(fixture_path(self.name, name), 'rb') as f:
+                self._pages[name] = f.read().decode(self.encoding)
+        return self._pages[name]
+
+    def html(self, text, request, status=200):
+        # 保存的页面是 robot4test 登录时的样子，换成当前登录的用户
+        if request.user:
+            text = text.replace('robot4test', request.user)
+        return Response(status, text.encode(self.encoding, errors='replace'),
+                        f'text/html; charset={self.encoding}')
+
+    @staticmethod
+    def json(data, status=200, headers=None):
+        return Response(status, json.dumps(data).encode('utf-8'), 'application/json;charset=UTF-8', headers)
+
+    def redirect(self, path, headers=None):
+        return Response(302, b'', headers=[('Location', f'/{self.host}{path}')] + (headers or []))
+
+    def login(self, username, password):
+        if not username or not self.farm.check_account(username, password):
+            return None
+        token = uuid.uuid4().hex
+        self.farm.sessions[(self.name, token)] = username
+        return [('Set-Cookie', f'{self.session_cookie}={token}; Path=/{self.host}; Max-Age={SESSION_MAX_AGE}')]
+
+    def submit(self, user, pid, language, code):
+        with self._lock:
+            submission = Submission(self._next_rid, user, pid, language, code)
+            self._next_rid += 1
+            self.submissions.append(submission)
+            return submission
+
+    def find(self, rid):
+        with self._lock:
+            index = int(rid) - self.first_rid
+            if 0 <= index < len(self.submissions):
+                return self.submissions[index]
+        return None
+
+    def select(self, user=None, pid=None, rid_max=None, rid_min=None):
+        """
+        按运行id从大到小返回满足条件的提交，最多一页
+        """
+        with self._lock:
+            rows = list(reversed(self.submissions))
+        selected = []
+        for submission in rows:
+            if user and submission.user != user:
+                continue
+            if pid and submission.pid != pid:
+                continue
+            if rid_max is not None and submission.rid > rid_max:
+                continue
+            if rid_min is not None and submission.rid < rid_min:
+                continue
+            selected.append(submission)
+            if len(selected) >= self.page_size:
+                break
+        return selected
+
+    def verdict(self, submission):
+        return self.verdicts[submission.stage(self.farm.judge_time)]
+
+    def status_page(self, request, submissions, name='status.html'):
+        text = self.page(name)
+        rows = list(re.finditer(self.row_pattern, text, re.S))
+        lines = ''.join(self.row(index, submission) for index, submission in enumerate(submissions))
+        return self.html(text[:rows[0].start()] + lines + text[rows[-1].end():], request)
+
+    def row(self, index, submission):
+        raise NotImplementedError
+
+    def home(self, request):
+        return self.html(self.page('home.html' if request.user else 'login.html'), request)
+
+    def routes(self):
+        """
+        :return: {(method, path): handler}
+        """
+        raise NotImplementedError
+
+    def handle(self, request):
+        request.user = self.farm.sessions.get((self.name, request.cookies.get(self.session_cookie)))
+        handler = self.routes().get((request.method, request.path))
+        if handler is None:
+            for (method, path), item in self.routes().items():
+                if method == request.method and path.endswith('*') and request.path.startswith(path[:-1]):
+                    handler = item
+                    break
+        if handler is None and request.method == 'GET' and re.search(self.asset_pattern, request.path):
+            handler = self.asset
+        if handler is None:
+            return Response(404, b'Not Found', 'text/plain')
+        return handler(request)
+
+    @staticmethod
+    def asset(request):
+        name = request.arg('name') or request.path.rsplit('/', 1)[-1]
+        body = f'asset:{name}'.encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if request.headers.get('If-None-Match') == etag:
+            return Response(304, b'', 'application/octet-stream', [('ETag', etag)])
+        return Response(200, body, 'application/octet-stream', [('ETag', etag)])
+
+    # 和源OJ一样严格解析数字参数，不是数字的时候当作没有这个条件 (PHP 的 intval / Java 的 parseInt 失败)
+    @staticmethod
+    def int_arg(request, name):
+        value = request.arg(name)
+        return int(value) if value.isdigit() else None
+
+    def pid_arg(self, request, name):
+        value = self.int_arg(request, name)
+        return str(value) if value is not None else None
+
+
+class HDUJudge(Judge):
+    name = 'HDU'
+    host = 'acm.hdu.edu.cn'
+    session_cookie = 'PHPSESSID'
+    first_rid = 40000000
+    page_size = 15
+    row_pattern = r'<tr align=center >.*?</tr>\n'
+    verdicts = {QUEUE: 'Queuing', RUN: 'Running', AC: 'Accepted', WA: 'Wrong Answer', CE: 'Compilation Error'}
+
+    def row(self, index, submission):
+        return (f'<tr align=center ><td height=22px>{submission.rid}</td><td>{submission.submit_time}</td>'
+                f'<td><font color=red>{self.verdict(submission)}</font></td>'
+                f'<td><a href="/showproblem.php?pid={submission.pid}">{submission.pid}</a></td><td>15MS</td>'
+                f'<td>1768K</td><td><a href="/viewcode.php?rid={submission.rid}"  target=_blank>'
+                f'{len(submission.code)}B</a></td><td>G++</td><td class=fixedsize>'
+                f'<a href="/userstatus.php?user={submission.user}">{submission.user}</a></td></tr>\n')
+
+    def do_login(self, request):
+        headers = self.login(request.arg('username'), request.arg('userpass'))
+        return self.redirect('/' if headers else '/userloginex.php', headers)
+
+    def do_submit(self, request):
+        if not request.user:
+            return self.redirect('/userloginex.php')
+        if request.method == 'GET':
+            return self.html(self.page('submit.html'), request)
+        self.submit(request.user, request.arg('problemid'), request.arg('language'), request.arg('usercode'))
+        return self.redirect('/status.php')
+
+    def do_status(self, request):
+        return self.status_page(request, self.select(user=request.arg('user'), pid=self.pid_arg(request, 'pid'),
+                                                     rid_max=self.int_arg(request, 'first')))
+
+    def routes(self):
+        return {
+            ('GET', '/'): self.home,
+            ('POST', '/userloginex.php'): self.do_login,
+            ('GET', '/showproblem.php'): lambda request: self.html(self.page('problem.html'), request),
+            ('GET', '/submit.php'): self.do_submit,
+            ('POST', '/submit.php'): self.do_submit,
+            ('GET', '/status.php'): self.do_status,
+        }
+
+
+class POJJudge(Judge):
+    name = 'POJ'
+    host = 'poj.org'
+    first_rid = 24000000
+    row_pattern = r'<tr align=center>.*?</tr>\n'
+    verdicts = {QUEUE: 'Waiting', RUN: 'Running & Judging', AC: 'Accepted', WA: 'Wrong Answer', CE: 'Compile Error'}
+
+    def row(self, index, submission):
+        verdict = self.verdict(submission).replace('&', '&amp;')
+        return (f'<tr align=center><td>{submission.rid}</td>'
+                f'<td><a href=userstatus?user_id={submission.user}>{submission.user}</a></td>'
+                f'<td><a href=problem?id={submission.pid}>{submission.pid}</a></td>'
+                f'<td><font color=blue>{verdict}</font></td><td>388K</td><td>16MS</td><td>G++</td>'
+                f'<td>{len(submission.code)}B</td><td>{submission.submit_time}</td></tr>\n')
+
+    def do_login(self, request):
+        headers = self.login(request.arg('user_id1'), request.arg('password1'))
+        return self.redirect('/' if headers else '/login', headers)
+
+    def do_submit(self, request):
+        if not request.user:
+            return self.redirect('/login')
+        if request.method == 'GET':
+            return self.html(self.page('submit.html'), request)
+        code = request.arg('source')
+        if request.arg('encoded') == '1':
+            code = base64.b64decode(code).decode('utf-8', errors='replace')
+        self.submit(request.user, request.arg('problem_id'), request.arg('language'), code)
+        return self.redirect('/status')
+
+    def do_status(self, request):
+        top = self.int_arg(request, 'top')
+        return self.status_page(request, self.select(user=request.arg('user_id'),
+                                                     pid=self.pid_arg(request, 'problem_id'),
+                                                     rid_max=top - 1 if top else None))
+
+    def routes(self):
+        return {
+            ('GET', '/'): self.home,
+            ('POST', '/login'): self.do_login,
+            ('GET', '/problem'): lambda request: self.html(self.page('problem.html'), request),
+            ('GET', '/submit'): self.do_submit,
+            ('POST', '/submit'): self.do_submit,
+            ('GET', '/status'): self.do_status,
+        }
+
+
+class ZOJJudge(Judge):
+    name = 'ZOJ'
+    host = 'acm.zju.edu.cn'
+    first_rid = 5000000
+    row_pattern = r'<tr class="row(?:Odd|Even)">.*?</tr>\n'
+    verdicts = {QUEUE: 'Queuing', RUN: 'Compiling', AC: 'Accepted', WA: 'Wrong Answer', CE: 'Compilation Error'}
+
+    def row(self, index, submission):
+        verdict = self.verdict(submission)
+        reply = 'judgeReplyAC' if verdict == 'Accepted' else 'judgeReplyOther'
+        return (f'<tr class="{"rowOdd" if index % 2 == 0 else "rowEven"}"><td class="runId">{submission.rid}</td>'
+                f'<td class="runSubmitTime">{submission.submit_time}</td>'
+                f'<td class="runJudgeStatus"><span class="{reply}">\n{verdict}\n</span></td>'
+                f'<td class="runProblemId"><a href="/onlinejudge/showProblem.do?problemCode={submission.pid}">'
+                f'{submission.pid}</a></td><td class="runLanguage">C++</td><td class="runTime">0</td>'
+                f'<td class="runMemory">272</td><td class="runUserName">'
+                f'<a href="/onlinejudge/showUserStatus.do?userId=0"><font color="db6d00">{submission.user}</font></a>'
+                f'</td><td class="runAdminOperation">&nbsp;</td></tr>\n')
+
+    def do_login(self, request):
+        headers = self.login(request.arg('handle'), request.arg('password'))
+        return self.redirect('/onlinejudge/' if headers else '/onlinejudge/login.do', headers)
+
+    def do_submit(self, request):
+        if not request.user:
+            return self.redirect('/onlinejudge/login.do')
+        if request.method == 'GET':
+            return self.html(self.page('submit.html'), request)
+        self.submit(request.user, request.form.get('problemId', [''])[0], request.arg('languageId'),
+                    request.arg('source'))
+        return self.redirect('/onlinejudge/showRuns.do?contestId=1')
+
+    def do_status(self, request):
+        return self.status_page(request, self.select(user=request.arg('handle'), pid=request.arg('problemCode'),
+                                                     rid_max=self.int_arg(request, 'idEnd'),
+                                                     rid_min=self.int_arg(request, 'idStart')))
+
+    def routes(self):
+        return {
+            ('GET', '/onlinejudge/'): self.home,
+            ('GET', '/onlinejudge'): self.home,
+            ('POST', '/onlinejudge/login.do'): self.do_login,
+            ('GET', '/onlinejudge/showProblem.do'): lambda request: self.html(self.page('problem.html'), request),
+            ('GET', '/onlinejudge/submit.do'): self.do_submit,
+            ('POST', '/onlinejudge/submit.do'): self.do_submit,
+            ('GET', '/onlinejudge/showRuns.do'): self.do_status,
+        }
+
+
+class WUSTJudge(Judge):
+    name = 'WUST'
+    host = 'acm.wust.edu.cn'
+    session_cookie = 'PHPSESSID'
+    first_rid = 200000
+    row_pattern = r'<tr class="(?:even|odd)row">.*?</tr>\n'
+    verdicts = {QUEUE: 'Pending', RUN: 'Running & Judging', AC: 'Accepted', WA: 'Wrong Answer', CE: 'Compile Error'}
+
+    def row(self, index, submission):
+        verdict = self.verdict(submission).replace('&', '&amp;')
+        return (f'<tr class="{"evenrow" if index % 2 == 0 else "oddrow"}"><td>{submission.rid}</td>'
+                f'<td><a href="userinfo.php?user={submission.user}">{submission.user}</a></td>'
+                f'<td><a href="problem.php?id={submission.pid}&soj=0">{submission.pid}</a></td><td>0</td>'
+                f'<td><span class="btn">{verdict}</span></td><td>1120 KB</td><td>4 ms</td><td>C++</td>'
+                f'<td>{len(submission.code)} B</td><td>{submission.submit_time}</td></tr>\n')
+
+    def do_login(self, request):
+        headers = self.login(request.arg('user_id'), request.arg('password'))
+        return self.redirect('/' if headers else '/loginpage.php', headers)
+
+    def do_submit(self, request):
+        if not request.user:
+            return self.redirect('/loginpage.php')
+        if request.method == 'GET':
+            return self.html(self.page('submit.html'), request)
+        self.submit(request.user, request.arg('id'), request.arg('language'), request.arg('source'))
+        return self.redirect('/status.php')
+
+    def do_status(self, request):
+        return self.status_page(request, self.select(user=request.arg('user_id'), pid=request.arg('problem_id'),
+                                                     rid_max=self.int_arg(request, 'top')))
+
+    def routes(self):
+        return {
+            ('GET', '/'): self.home,
+            ('GET', '/loginpage.php'): lambda request: self.html(self.page('login.html'), request),
+            ('POST', '/login.php'): self.do_login,
+            ('GET', '/problem.php'): lambda request: self.html(self.page('problem.html'), request),
+            ('GET', '/submitpage.php'): self.do_submit,
+            ('POST', '/submit.php'): self.do_submit,
+            ('GET', '/status.php'): self.do_status,
+        }
+
+
+class AizuJudge(Judge):
+    name = 'Aizu'
+    host = 'judgeapi.u-aizu.ac.jp'
+    session_cookie = 'SESSION'
+    first_rid = 5000000
+    # AizuParser._judge_static_string 中的下标
+    verdicts = {QUEUE: 5, RUN: 9, AC: 4, WA: 1, CE: 0}
+
+    def do_session(self, request):
+        data = request.json()
+        headers = self.login(data.get('id'), data.get('password'))
+        if headers is None:
+            return self.json([{'id': 1102, 'code': 'USER_NOT_FOUND_OR_PASSWORD_INCORRECT'}], 400)
+        return self.json(self.self_data(data.get('id')), headers=headers)
+
+    def self_data(self, user):
+        with open(fixture_path(self.name, corpus[self.name]['home']), encoding='utf-8') as f:
+            data = json.load(f)
+        data['id'] = data['name'] = user
+        return data
+
+    def do_self(self, request):
+        if not request.user:
+            return self.json([{'id': 1401, 'code': 'UNAUTHORIZED'}], 401)
+        return self.json(self.self_data(request.user))
+
+    def do_submit(self, request):
+        if not request.user:
+            return self.json([{'id': 1401, 'code': 'UNAUTHORIZED'}], 401)
+        data = request.json()
+        submission = self.submit(request.user, data.get('problemId'), data.get('language'), data.get('sourceCode'))
+        return self.json({'token': uuid.uuid5(uuid.NAMESPACE_OID, str(submission.rid)).hex})
+
+    def record(self, submission):
+        return {'judgeId': submission.rid, 'judgeType': 2, 'userId': submission.user,
+                'problemId': submission.pid, 'submissionDate': int(submission.submitted_at * 1000),
+                'language': submission.language, 'cpuTime': 12, 'memory': 3064,
+                'codeSize': len(submission.code or ''), 'status': self.verdict(submission)}
+
+    def do_records(self, request):
+        parts = request.path.split('/')
+        if len(parts) != 6:
+            return self.json([], 404)
+        return self.json([self.record(submission) for submission in self.select(user=parts[3], pid=parts[5])])
+
+    def do_verdict(self, request):
+        submission = self.find(request.path.rsplit('/', 1)[-1] or 0)
+        if submission is None:
+            return self.json([{'id': 1404, 'code': 'NOT_FOUND'}], 404)
+        return self.json({'submissionRecord': self.record(submission), 'caseVerdicts': [], 'userOutput': None,
+                          'compileError': '', 'runtimeError': '', 'checkerOutput': None})
+
+    def do_description(self, request):
+        with open(fixture_path(self.name, pages[self.name][3]), 'rb') as f:
+            return Response(200, f.read(), 'application/json;charset=UTF-8')
+
+    def routes(self):
+        return {
+            ('POST', '/session'): self.do_session,
+            ('GET', '/self'): self.do_self,
+            ('GET', '/categories'): lambda request: self.json({'categories': []}),
+            ('GET', '/resources/descriptions/en/*'): self.do_description,
+            ('POST', '/submissions'): self.do_submit,
+            ('GET', '/submission_records/users/*'): self.do_records,
+            ('GET', '/verdicts/*'): self.do_verdict,
+        }
+
+
+class CodeforcesJudge(Judge):
+    name = 'Codeforces'
+    host = 'codeforces.com'
+    first_rid = 130000000
+    row_pattern = r'<tr data-submission-id=.*?</tr>\n'
+    submission_pattern = r'<tr><td>\d+</td>.*?</tr>\n'
+    verdicts = {QUEUE: 'In queue', RUN: 'Running on test 1', AC: 'Accepted', WA: 'Wrong answer on test 2',
+                CE: 'Compilation error'}
+
+    def contest(self, submission):
+        return re.sub(r'\D', '', submission.pid) or '1'
+
+    def cell(self, submission):
+        verdict = self.verdict(submission)
+        return f"<span class='verdict-{'accepted' if verdict == 'Accepted' else 'rejected'}'>{verdict}</span>"
+
+    def row(self, index, submission):
+        contest = self.contest(submission)
+        return (f'<tr data-submission-id="{submission.rid}"><td class="id-cell">'
+                f'<a href="/contest/{contest}/submission/{submission.rid}">{submission.rid}</a></td>'
+                f'<td class="status-small"><span class="format-time">{submission.submit_time}</span></td>'
+                f'<td class="status-party-cell"><a href="/profile/{submission.user}">{submission.user}</a></td>'
+                f'<td class="status-small"><a href="/contest/{contest}/problem/{submission.pid[-1:]}">'
+                f'{submission.pid}</a></td><td>GNU C++17</td>'
+                f'<td class="status-cell status-small status-verdict-cell"><span class="submissionVerdictWrapper">'
+                f'{self.cell(submission)}</span></td><td class="time-consumed-cell">15 ms</td>'
+                f'<td class="memory-consumed-cell">0 KB</td></tr>\n')
+
+    def do_enter(self, request):
+        if request.method == 'GET':
+            return self.html(self.page('login.html'), request)
+        headers = self.login(request.arg('handleOrEmail'), request.arg('password'))
+        return self.redirect('/' if headers else '/enter', headers)
+
+    def do_submit(self, request):
+        if not request.user:
+            return self.redirect('/enter')
+        if request.method == 'GET':
+            return self.html(self.page('submit.html'), request)
+        self.submit(request.user, request.arg('submittedProblemCode'), request.arg('programTypeId'),
+                    request.arg('source'))
+        return self.redirect('/problemset/status?my=on')
+
+    def do_status(self, request):
+        return self.status_page(request, self.select(user=request.user or ''))
+
+    def do_contest(self, request):
+        parts = request.path.split('/')
+        if len(parts) == 5 and parts[3] == 'problem':
+            return self.html(self.page('problem.html'), request)
+        if len(parts) == 5 and parts[3] == 'submission':
+            submission = self.find(re.sub(r'\D', '', parts[4]) or 0)
+            if submission is None:
+                return self.html(self.page('login.html'), request, 404)
+            text = self.page('submission.html')
+            row = re.search(self.submission_pattern, text, re.S)
+            line = (f'<tr><td>{submission.rid}</td><td><a href="/profile/{submission.user}" '
+                    f'class="rated-user user-gray">{submission.user}</a></td><td>'
+                    f'<a href="/contest/{self.contest(submission)}/problem/{submission.pid[-1:]}">{submission.pid}'
+                    f'</a></td><td>\n GNU C++17\n</td><td>{self.cell(submission)}</td><td>\n 15 ms\n</td><td>\n'
+                    f' 0 KB\n</td><td class="format-time">{submission.submit_time}</td><td class="format-time">'
+                    f'{submission.submit_time}</td><td><a href="/contest/{self.contest(submission)}/submission/'
+                    f'{submission.rid}">Compare</a></td></tr>\n')
+            return self.html(text[:row.start()] + line + text[row.end():], request)
+        return Response(404, b'Not Found', 'text/plain')
+
+    def routes(self):
+        return {
+            ('GET', '/'): self.home,
+            ('GET', '/enter'): self.do_enter,
+            ('POST', '/enter'): self.do_enter,
+            ('GET', '/problemset/submit'): self.do_submit,
+            ('POST', '/problemset/submit'): self.do_submit,
+            ('GET', '/problemset/status'): self.do_status,
+            ('GET', '/contest/*'): self.do_contest,
+        }
+
+
+judges = [HDUJudge, POJJudge, ZOJJudge, WUSTJudge, AizuJudge, CodeforcesJudge]
+
+
+class Throttle(object):
+    """
+    每个域名每秒最多 rate 个请求，超过的请求直接拒绝
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._tokens.get(host, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self._tokens[host] = (tokens - 1 if allowed else tokens, now)
+            return allowed
+
+
+class MockFarm(object):
+    """
+    :param latency: 每个请求固定的延迟秒数
+    :param jitter: 在 latency 之上随机增加 0 ~ jitter 秒
+    :param error_rate: 返回 500 的概率
+    :param throttle: 每个域名每秒允许的请求数，超过的返回 503，为空的时候不限制
+    :param judge_time: (排队秒数, 运行秒数)
+    :param accounts: {用户名: 密码}，为空的时候接受任意非空的用户名
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle=None, judge_time=(0.5, 0.5),
+                 accounts=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = Throttle(throttle) if throttle else None
+        self.judge_time = judge_time
+        self.accounts = accounts
+        self.sessions = {}
+        self.judges = {judge.host: judge(self) for judge in judges}
+        self.stats = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def judge(self, name):
+        return next(judge for judge in self.judges.values() if judge.name == name)
+
+    def check_account(self, username, password):
+        return self.accounts is None or self.accounts.get(username) == password
+
+    def count(self, host, status):
+        with self._lock:
+            key = (host, status)
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def handle(self, request, host):
+        judge = self.judges.get(host)
+        if judge is None:
+            return Response(404, b'Unknown Host', 'text/plain')
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.throttle and not self.throttle.allow(host):
+            return Response(503, b'Service Temporarily Unavailable', 'text/plain', [('Retry-After', '1')])
+        if self.error_rate and self._random.random() < self.error_rate:
+            return Response(500, b'Internal Server Error', 'text/plain')
+        return judge.handle(request)
+
+    @property
+    def base(self):
+        if self._server is None:
+            return None
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, host='127.0.0.1', port=0):
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self.base
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # 让 HttpUtil 和 AsyncHttpUtil 的请求都发到这里
+    def install(self):
+        redirector.set_base(self.base, list(self.judges))
+
+    @staticmethod
+    def uninstall():
+        redirector.set_base(None)
+
+    def __enter__(self):
+        self.start()
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+        self.stop()
+
+
+def _handler(farm):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _dispatch(self, method):
+            parts = urlsplit(self.path)
+            host, _, path = parts.path.lstrip('/').partition('/')
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            form = {}
+            if 'application/x-www-form-urlencoded' in (self.headers.get('Content-Type') or ''):
+                form = parse_qs(body.decode('utf-8', errors='replace'), keep_blank_values=True)
+            cookies = {key: morsel.value for key, morsel in SimpleCookie(self.headers.get('Cookie') or '').items()}
+            request = Request(method, '/' + path, parse_qs(parts.query, keep_blank_values=True), form, body,
+                              cookies, self.headers)
+            response = farm.handle(request, host)
+            farm.count(host, response.status)
+            self.send_response(response.status)
+            self.send_header('Content-Type', response.content_type)
+            self.send_header('Content-Length', str(len(response.body)))
+            for key, value in response.headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(response.body)
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的延迟秒数')
+    parser.add_argument('--jitter', type=float, default=0.0, help='随机增加的延迟秒数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的概率')
+    parser.add_argument('--throttle', type=float, default=None, help='每个域名每秒允许的请求数')
+    parser.add_argument('--queue', type=float, default=0.5, help='提交之后排队的秒数')
+    parser.add_argument('--run', type=float, default=0.5, help='排队之后运行的秒数')
+    args = parser.parse_args()
+
+    farm = MockFarm(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle=args.throttle,
+                    judge_time=(args.queue, args.run))
+    print(f'mock OJ farm listening on {farm.start(args.host, args.port)}')
+    try:
+        farm._thread.join()
+    except KeyboardInterrupt:
+        farm.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from aiohttp import web
+
+from spider.config import Problem
+from spider.core import AsyncCore, Core
+from spider.utils import AsyncHttpUtil
+
+
+class TestAsyncHttpUtil(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def form(request):
+            data = await request.post()
+            response = web.Response(body='{}={}'.format(data.get('user'), data.get('code')).encode('gb18030'))
+            response.set_cookie('sid', 'abc')
+            return response
+
+        async def whoami(request):
+            return web.Response(text=request.cookies.get('sid', ''))
+
+        app = web.Application()
+        app.router.add_post('/form', form)
+        app.router.add_get('/whoami', whoami)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self._base = 'http://127.0.0.1:{}'.format(self._runner.addresses[0][1])
+
+    async def asyncTearDown(self):
+        await self._runner.cleanup()
+
+    async def test_get_and_post(self):
+        req = AsyncHttpUtil(code_type='gb18030')
+        res = await req.post(self._base + '/form', data={'user': '测试', 'code': b'int'})
+        self.assertTrue(res)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.text, '测试=int')
+        res = await req.get(self._base + '/whoami')
+        self.assertEqual(res.text, 'abc')
+        self.assertEqual(req.cookies.get_dict(), {'sid': 'abc'})
+        await req.close()
+
+    async def test_connection_error(self):
+        req = AsyncHttpUtil(cookies={'sid': 'xyz'})
+        self.assertEqual(req.cookies.get_dict(), {'sid': 'xyz'})
+        self.assertIsNone(await req.get('http://127.0.0.1:1/'))
+        await req.close()
+
+
+class TestAsyncCore(unittest.IsolatedAsyncioTestCase):
+    async def test_build_all_support(self):
+        for item in Core.get_supports():
+            async with AsyncCore(item) as core:
+                self.assertIsNotNone(core.get_home_page_url(), msg=f'{item} error')
+                self.assertFalse(core.account_required())
+        self.assertIsNone(AsyncCore('THISOJISNONE').get_home_page_url())
+
+    async def test_get_problems(self):
+        async with AsyncCore('HDU') as core:
+            async def get_problem(pid, account=None):
+                await asyncio.sleep(0.01 * int(pid))
+                problem = Problem(Problem.Status.STATUS_SUCCESS)
+                problem.remote_id = pid
+                return problem
+
+            core._oj.get_problem = get_problem
+            finished = [problem.remote_id async for problem in core.iter_problems(['3', '1', '2'], limit=3)]
+            self.assertListEqual(finished, ['1', '2', '3'])
+            problems = await core.get_problems(['3', '1', '2'])
+            self.assertListEqual([problem.remote_id for problem in problems], ['3', '1', '2'])
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import unittest
+
+from bs4 import BeautifulSoup
+
+from benchmark.suite import load_baseline, regressions, run, save_baseline
+from spider.parser_backend import backends
+from test.fixtures import corpus, fixture_path, load_response, pages
+
+
+class TestCorpus(unittest.TestCase):
+    def test_files(self):
+        for oj_name, (_, _, _, problem_file, result_file) in pages.items():
+            for name in [problem_file, result_file, 'expected.json'] + list(corpus[oj_name].values()):
+                with self.subTest(oj_name=oj_name, name=name):
+                    self.assertTrue(os.path.isfile(fixture_path(oj_name, name)))
+
+    def test_language(self):
+        for oj_name, items in corpus.items():
+            if 'language' not in items:
+                continue
+            with self.subTest(oj_name=oj_name):
+                soup = BeautifulSoup(load_response(oj_name, items['language']).text, 'lxml')
+                options = [option for select in soup.find_all('select') for option in select.find_all('option')]
+                self.assertTrue(options)
+
+    def test_login(self):
+        for oj_name, items in corpus.items():
+            if 'login' not in items:
+                continue
+            with self.subTest(oj_name=oj_name):
+                self.assertRegex(load_response(oj_name, items['home']).text, r'(?i)logout')
+                self.assertNotRegex(load_response(oj_name, items['login']).text, r'(?i)logout')
+        self.assertEqual(json.loads(load_response('Aizu', corpus['Aizu']['home']).text)['id'], 'robot4test')
+
+
+class TestSuite(unittest.TestCase):
+    def test_run(self):
+        for backend in backends:
+            with self.subTest(backend=backend):
+                results = run(1, backend, repeat=1)
+                self.assertSetEqual(set(results), set(pages))
+                for items in results.values():
+                    self.assertSetEqual(set(items), {'problem_parse', 'result_parse', 'update_tag'})
+                    for item in items.values():
+                        self.assertGreater(item['rate'], 0)
+                        self.assertGreater(item['peak'], 0)
+
+    def test_regressions(self):
+        baseline = {'HDU': {'problem_parse': {'rate': 100, 'peak': 1000}}}
+        results = {'HDU': {'problem_parse': {'rate': 80, 'peak': 1100}, 'result_parse': {'rate': 1, 'peak': 1}}}
+        self.assertListEqual(regressions(results, baseline, 0.3), [])
+        results['HDU']['problem_parse'] = {'rate': 60, 'peak': 1400}
+        self.assertListEqual(regressions(results, baseline, 0.3), [
+            ('HDU', 'problem_parse', 'rate', 100, 60),
+            ('HDU', 'problem_parse', 'peak', 1000, 1400),
+        ])
+
+    def test_baseline(self):
+        with tempfile.TemporaryDirectory() as path:
+            path = os.path.join(path, 'baseline.json')
+            self.assertDictEqual(load_baseline(path), {})
+            results = {'HDU': {'problem_parse': {'rate': 100, 'peak': 1000}}}
+            save_baseline(results, 'bs4', path)
+            save_baseline(results, 'lxml', path)
+            baseline = load_baseline(path)
+            self.assertDictEqual(baseline['bs4']['results'], results)
+            self.assertDictEqual(baseline['lxml']['results'], results)
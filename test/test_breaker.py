@@ -0,0 +1,79 @@
+import time
+import unittest
+
+from spider.breaker import STATE_CLOSED, STATE_OPEN, BreakerRegistry, breakers, health
+from spider.config import Account, Problem
+from spider.core import Core
+from test.mockoj import MockFarm
+
+
+class TestBreakerRegistry(unittest.TestCase):
+    def test_open(self):
+        registry = BreakerRegistry(threshold=3, reset_timeout=60)
+        url = 'http://poj.org/problem?id=1000'
+        for _ in range(2):
+            registry.record(url, True)
+        registry.record(url, False)
+        self.assertTrue(registry.allow(url))
+        for _ in range(3):
+            registry.record(url, True)
+        self.assertFalse(registry.allow(url))
+        self.assertEqual(registry.states()['POJ']['state'], STATE_OPEN)
+        # 其他平台和不认识的域名不受影响
+        self.assertTrue(registry.allow('http://acm.hdu.edu.cn/'))
+        self.assertTrue(registry.allow('http://example.com/'))
+        with registry.probing():
+            self.assertTrue(registry.allow(url))
+        registry.reset()
+        self.assertTrue(registry.allow(url))
+
+
+class TestCircuit(unittest.TestCase):
+    def setUp(self):
+        breakers.configure(threshold=3, reset_timeout=0.3)
+        self.farm = MockFarm(latency=0.05)
+        self.farm.__enter__()
+        self.account = Account('robot', 'secret')
+
+    def tearDown(self):
+        self.farm.__exit__(None, None, None)
+        breakers.reset()
+        breakers.configure(threshold=5, reset_timeout=30)
+
+    def test_fail_fast(self):
+        self.farm.error_rate = 1
+        core = Core('POJ')
+        for _ in range(3):
+            self.assertEqual(core.get_problem('1000', self.account).status, Problem.Status.STATUS_RETRYABLE)
+        requests = self.farm.stats[('poj.org', 500)]
+        start = time.monotonic()
+        self.assertEqual(core.get_problem('1000', self.account).status, Problem.Status.STATUS_RETRYABLE)
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(self.farm.stats[('poj.org', 500)], requests)
+
+        # 后台探测在源OJ恢复之前不会关闭熔断器，恢复之后下一次探测关闭
+        time.sleep(0.5)
+        self.assertEqual(breakers.states()['POJ']['state'], STATE_OPEN)
+        self.farm.error_rate = 0
+        self.assertEqual(Core('HDU').get_problem('1000', self.account).status, Problem.Status.STATUS_SUCCESS)
+        deadline = time.monotonic() + 3
+        while breakers.states()['POJ']['state'] != STATE_CLOSED and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(core.get_problem('1000', self.account).status, Problem.Status.STATUS_SUCCESS)
+
+    def test_health(self):
+        start = time.monotonic()
+        snapshot = Core.get_health(max_age=0)
+        elapsed = time.monotonic() - start
+        self.assertSetEqual(set(snapshot), set(Core.get_supports()))
+        self.assertTrue(all(status['working'] and status['state'] == STATE_CLOSED for status in snapshot.values()))
+        # 每个平台并发探测，总时间接近最慢的一个而不是所有平台之和
+        slowest = max(status['elapsed'] for status in snapshot.values())
+        self.assertLess(elapsed, slowest + sum(status['elapsed'] for status in snapshot.values()) / 2)
+        requests = sum(self.farm.stats.values())
+        self.assertDictEqual(Core.get_health(), snapshot)
+        self.assertEqual(sum(self.farm.stats.values()), requests)
+
+        self.farm.error_rate = 1
+        snapshot = health.refresh()
+        self.assertFalse(snapshot['ZOJ']['working'])
@@ -1,6 +1,8 @@
+import json
+import pickle
 import unittest
 
-from spider.config import Result
+from spider.config import Problem, Result
 
 
 class TestResult(unittest.TestCase):
@@ -18,3 +20,50 @@ class TestResult(unittest.TestCase):
                                                'compile_info': None,
                                                'verdict_info': 'Accepted',
                                                'verdict': Result.Verdict.VERDICT_RUNNING})
+
+    def test_encode(self):
+        result = Result(Result.Status.STATUS_RESULT_SUCCESS)
+        result.unique_key = 1234567
+        result.verdict = Result.Verdict.VERDICT_CE
+        result.verdict_info = 'Compilation Error'
+        result.compile_info = 'main.cpp:1: 错误'
+        data = result.to_dict()
+        self.assertEqual(data['status'], 'Result Success')
+        self.assertEqual(data['verdict'], 'CE')
+        self.assertEqual(json.loads(json.dumps(data)), data)
+
+        for decoded in (Result.from_dict(data), Result.from_bytes(result.to_bytes()),
+                        Result.from_bytes(memoryview(result.to_bytes())), pickle.loads(pickle.dumps(result))):
+            self.assertDictEqual(decoded.__dict__, result.__dict__)
+        self.assertIs(Result.from_dict({'verdict': 'AC', 'unknown': 1}).verdict, Result.Verdict.VERDICT_AC)
+        with self.assertRaises(ValueError):
+            Problem.from_bytes(result.to_bytes())
+        with self.assertRaises(AttributeError):
+            result.unknown = 1
+
+
+class TestProblem(unittest.TestCase):
+    def test_encode(self):
+        problem = Problem(Problem.Status.STATUS_SUCCESS)
+        problem.remote_id = '1000'
+        problem.remote_oj = 'HDU'
+        problem.title = 'A + B Problem'
+        problem.time_limit = 1.5
+        problem.special_judge = False
+        problem.html = '<p>计算 a + b</p>' * 100
+        encoded = problem.to_bytes()
+        self.assertLess(len(encoded), len(json.dumps(problem.to_dict())))
+        decoded = Problem.from_bytes(encoded)
+        self.assertDictEqual(decoded.__dict__, problem.__dict__)
+        self.assertIs(decoded.status, Problem.Status.STATUS_SUCCESS)
+        self.assertIs(decoded.special_judge, False)
+
+        # 字段数较少的旧数据，缺少的字段为 None
+        old = bytearray(Problem().to_bytes())
+        old[2] -= 1
+        self.assertIsNone(Problem.from_bytes(bytes(old[:-1])).template)
+
+        # 修改 __dict__ 的副本不影响对象
+        problem.__dict__['title'] = 'changed'
+        self.assertEqual(problem.title, 'A + B Problem')
+        self.assertFalse(hasattr(Problem(), '__weakref__'))
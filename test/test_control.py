@@ -1,13 +1,22 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
-from spider.platforms.hdu import HDU
-from spider.core import Core, OJBuilder
+from spider.config import Problem, Result
+from spider.platforms import PlatformRegistry, builtin
+from spider.platforms.hdu import HDU, AsyncHDU, HDUParser
+from spider.core import Core, OJBuilder, get_concurrency
 
 
 class TestOJBuilder(unittest.TestCase):
     def test_build_oj(self):
         self.assertEqual(type(OJBuilder.build_oj('HDU')), HDU)
         self.assertIsNone(OJBuilder.build_oj('THISOJISNONE'))
+        self.assertEqual(type(OJBuilder.build_async_oj('HDU')), AsyncHDU)
 
     def test_all_support(self):
         for item in Core.get_supports():
@@ -15,3 +24,99 @@ class TestOJBuilder(unittest.TestCase):
                 self.assertTrue(Core(item).is_working(), msg=f'{item} error')
             except Exception as e:
                 print(e)
+
+
+class TestPlatformRegistry(unittest.TestCase):
+    def test_get(self):
+        registry = PlatformRegistry(builtin, group=None)
+        self.assertIs(registry.get('HDU'), HDU)
+        self.assertIs(registry.get('HDU', asynchronous=True), AsyncHDU)
+        self.assertIs(registry.get('hdu'), None)
+        with self.assertRaises(ModuleNotFoundError):
+            registry.get('THISOJISNONE')
+
+        registry.register('HDU2', 'spider.platforms.hdu:HDU')
+        self.assertIs(registry.get('HDU2', asynchronous=True), AsyncHDU)
+        registry.register('Mirror', HDU)
+        self.assertIs(registry.get('Mirror'), HDU)
+        self.assertIs(registry.get('Mirror', asynchronous=True), AsyncHDU)
+        self.assertIn('Mirror', registry.names())
+
+    def test_lazy_import(self):
+        # 导入 spider.core 不加载网络和解析库，也不在当前目录创建日志目录
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = 'import sys, spider.core; print(" ".join(sorted(m for m in ("requests", "bs4", "lxml", ' \
+                 '"asyncio", "sqlite3", "spider.platforms.hdu") if m in sys.modules)))'
+        # 同步的 Core 用到平台和 spider.utils 的时候也不加载异步库，没有配置仓库的时候不加载 sqlite3
+        sync = 'import sys, spider.core, spider.utils; spider.core.Core("HDU").find_language; ' \
+               'print(" ".join(sorted(m for m in ("asyncio", "aiohttp", "sqlite3") if m in sys.modules)))'
+        for code in (script, sync):
+            with tempfile.TemporaryDirectory() as cwd:
+                output = subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True, stdout=subprocess.PIPE,
+                                        env=dict(os.environ, PYTHONPATH=root), universal_newlines=True).stdout
+                self.assertListEqual(os.listdir(cwd), [])
+            self.assertEqual(output.strip(), '')
+
+
+class TestBatch(unittest.TestCase):
+    def test_get_problems(self):
+        core = Core('Codeforces')
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def get_problem(pid, account=None):
+            with lock:
+                running.append(pid)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(pid)
+            if pid == '1B':
+                raise AttributeError('unexpected page')
+            problem = Problem(Problem.Status.STATUS_SUCCESS)
+            problem.remote_id = pid
+            return problem
+
+        core._oj.get_problem = get_problem
+        pids = [f'{i}A' for i in range(1, 10)] + ['1B']
+        problems = core.get_problems(pids, max_workers=8)
+        self.assertListEqual([problem.remote_id for problem in problems], pids)
+        self.assertEqual(problems[-1].status, Problem.Status.STATUS_ERROR)
+        self.assertTrue(all(problem.status == Problem.Status.STATUS_SUCCESS for problem in problems[:-1]))
+        self.assertLessEqual(max(peak), get_concurrency('Codeforces'))
+
+    def test_get_results_by_rids(self):
+        core = Core('HDU')
+        pages = []
+
+        def get_result_page(rid):
+            pages.append(rid)
+            page = []
+            for key in range(int(rid), int(rid) - HDU.status_page_size, -1):
+                result = Result(Result.Status.STATUS_RESULT_SUCCESS)
+                result.unique_key, result.verdict_info = str(key), 'Accepted'
+                page.append(result)
+            return page
+
+        core._oj.get_result_page = get_result_page
+        results = core.get_results_by_rids([100, 95, 86, 80, 3])
+        self.assertListEqual(pages, ['100', '80', '3'])
+        self.assertEqual(results['86'].verdict, Result.Verdict.VERDICT_AC)
+        self.assertEqual(len(results), 5)
+
+        # 源OJ挂了的时候只请求一次状态页，这一批都标记为失败
+        pages.clear()
+        core._oj.get_result_page = lambda rid: pages.append(rid)
+        results = core.get_results_by_rids([100, 95, 86])
+        self.assertListEqual(pages, ['100'])
+        self.assertTrue(all(result.status == Result.Status.STATUS_RESULT_ERROR for result in results.values()))
+        self.assertEqual(len(results), 3)
+        self.assertIsNone(HDUParser().result_list_parse(None))
+
+        # 不是数字的运行id不参与翻页，逐个查询
+        core._oj.get_result_page = get_result_page
+        core.get_result_by_rid_and_pid = lambda rid, pid: Result(Result.Status.STATUS_RESULT_ERROR)
+        results = core.get_results_by_rids(['100', 'abc'])
+        self.assertEqual(results['100'].verdict, Result.Verdict.VERDICT_AC)
+        self.assertEqual(results['abc'].status, Result.Status.STATUS_RESULT_ERROR)
@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+import unittest
+
+from spider.config import Problem
+from spider.core import Core
+from spider.crawler import Crawler, id_range, parse_ids
+from spider.store import ProblemStore
+from spider.utils import AsyncResponse
+from test.mockoj import MockFarm
+
+
+class Killed(Exception):
+    pass
+
+
+class KilledCrawler(Crawler):
+    """
+    写完 limit 个题目之后模拟进程被杀掉
+    """
+    limit = 0
+
+    def _count(self, name):
+        super()._count(name)
+        if sum(self.state.stats.values()) >= self.limit:
+            raise Killed()
+
+
+class TestCrawler(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.temp.name, 'hdu.jsonl')
+        self.checkpoint = self.output + '.checkpoint'
+        self.calls = []
+        self.core = Core('HDU')
+        self.core._oj.get_problem = self.get_problem
+        # 题号是 7 的倍数的题目第一次返回 STATUS_RETRYABLE
+        self.flaky = set(str(pid) for pid in range(1000, 1100, 7))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def get_problem(self, pid, account=None):
+        self.calls.append(pid)
+        if pid in self.flaky:
+            self.flaky.remove(pid)
+            status = Problem.Status.STATUS_RETRYABLE
+        else:
+            status = Problem.Status.STATUS_SUCCESS
+        problem = Problem(status)
+        problem.remote_oj, problem.remote_id, problem.title = 'HDU', pid, f'Problem {pid}'
+        return problem
+
+    def lines(self):
+        with open(self.output, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_ids(self):
+        self.assertListEqual(list(id_range(1000, 1002)), ['1000', '1001', '1002'])
+        self.assertListEqual(list(parse_ids('1000-1001')), ['1000', '1001'])
+        self.assertListEqual(list(parse_ids('1A, 1B')), ['1A', '1B'])
+        path = os.path.join(self.temp.name, 'ids.txt')
+        with open(path, 'w') as f:
+            f.write('# POJ\n1000\n\n1001\n')
+        self.assertListEqual(list(parse_ids('@' + path)), ['1000', '1001'])
+
+    def test_run(self):
+        stats = Crawler(self.core, self.output, self.checkpoint, max_workers=4).run(id_range(1000, 1099))
+        self.assertDictEqual(stats, {'STATUS_SUCCESS': 100, 'retried': 15})
+        lines = self.lines()
+        self.assertListEqual(sorted(line['remote_id'] for line in lines), list(id_range(1000, 1099)))
+        self.assertTrue(all(line['status'] == Problem.Status.STATUS_SUCCESS.value for line in lines))
+        self.assertEqual(len(self.calls), 115)
+        # 已经完成的检查点再运行一次不会再抓取
+        Crawler(self.core, self.output, self.checkpoint).run(id_range(1000, 1099))
+        self.assertEqual(len(self.calls), 115)
+
+    def test_resume(self):
+        crawler = KilledCrawler(self.core, self.output, self.checkpoint, max_workers=4, checkpoint_every=10)
+        crawler.limit = 37
+        with self.assertRaises(Killed):
+            crawler.run(id_range(1000, 1099))
+        with open(self.checkpoint) as f:
+            self.assertGreaterEqual(json.load(f)['position'], 20)
+        crawler.limit = 200
+        stats = crawler.run(id_range(1000, 1099))
+        self.assertEqual(stats['STATUS_SUCCESS'], 100)
+        self.assertListEqual(sorted(line['remote_id'] for line in self.lines()), list(id_range(1000, 1099)))
+        # 只有最后一个检查点之后的题目被重新抓取
+        self.assertLess(len(self.calls), 115 + 4 * 2 + 10)
+
+    def test_final_pass(self):
+        stats = Crawler(self.core, self.output, retries=0).run(['1007', '1008'])
+        self.assertDictEqual(stats, {'STATUS_SUCCESS': 1, 'STATUS_RETRYABLE': 1})
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_mockoj(self):
+        with MockFarm():
+            stats = Crawler(Core('POJ'), self.output, self.checkpoint).run(['1000', '1001'])
+        self.assertDictEqual(stats, {'STATUS_SUCCESS': 2})
+        self.assertListEqual(sorted(line['remote_id'] for line in self.lines()), ['1000', '1001'])
+
+    def test_incremental(self):
+        core = Core('HDU', store=ProblemStore(':memory:'))
+        counter = [0]
+        parsed = []
+
+        def fetch_problem(pid, headers=None):
+            counter[0] += 1
+            title = 'A + B' if pid != '1003' or counter[0] <= 5 else 'A - B'
+            page = f"<h1 style='color:#1A5CC8'>{title}</h1>Total Submission(s): {counter[0]}<center>"
+            return AsyncResponse(200, page.encode(), {}, '')
+
+        def parse_problem(response, pid):
+            parsed.append(pid)
+            problem = Problem(Problem.Status.STATUS_SUCCESS)
+            problem.remote_oj, problem.remote_id, problem.html = 'HDU', pid, response.text
+            return problem
+
+        core._oj.fetch_problem, core._oj.parse_problem = fetch_problem, parse_problem
+        changelog = os.path.join(self.temp.name, 'changes.jsonl')
+        stats = Crawler(core, self.output, changelog=changelog).run(id_range(1000, 1004))
+        self.assertDictEqual(stats, {'added': 5})
+        self.assertEqual(len(self.lines()), 5)
+
+        stats = Crawler(core, self.output, changelog=changelog, max_workers=1).run(id_range(1000, 1004))
+        self.assertDictEqual(stats, {'unchanged': 4, 'modified': 1})
+        self.assertListEqual([line['remote_id'] for line in self.lines()], ['1003'])
+        with open(changelog) as f:
+            self.assertListEqual([json.loads(line)['change'] for line in f], ['modified'])
+        self.assertEqual(len(parsed), 6)
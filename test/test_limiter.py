@@ -0,0 +1,30 @@
+import os
+import tempfile
+import time
+import unittest
+
+from spider.limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_token_bucket(self):
+        limiter = RateLimiter(limits={})
+        limiter.set_platform_limit('HDU', 100, 2)
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.acquire('http://acm.hdu.edu.cn/status.php')
+        self.assertGreaterEqual(time.monotonic() - start, 0.015)
+        self.assertEqual(limiter.acquire('http://poj.org/'), 0)
+        stats = limiter.stats()
+        self.assertEqual(stats['acm.hdu.edu.cn']['requests'], 4)
+        self.assertEqual(stats['acm.hdu.edu.cn']['waited'], 2)
+        self.assertGreater(stats['acm.hdu.edu.cn']['wait_time'], 0)
+        self.assertEqual(stats['poj.org']['waited'], 0)
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as path:
+            backend = os.path.join(path, 'limiter.db')
+            first = RateLimiter(limits={'codeforces.com': (1, 1)}, backend=backend)
+            second = RateLimiter(limits={'codeforces.com': (1, 1)}, backend=backend)
+            self.assertEqual(first.reserve('http://codeforces.com/'), 0)
+            self.assertGreater(second.reserve('http://codeforces.com/'), 0.5)
@@ -0,0 +1,136 @@
+import asyncio
+import unittest
+
+from spider.config import Account
+from spider.core import AsyncCore, Core
+from spider.metrics import Histogram, MemorySink, MetricsSink, RequestSpan, current_operation, metrics, operation, \
+    platform_of
+from spider.utils import HttpUtil
+from test.mockoj import MockFarm
+
+
+class ListSink(MetricsSink):
+    def __init__(self):
+        self.requests = []
+        self.parses = []
+
+    def record_request(self, span):
+        self.requests.append(span)
+
+    def record_parse(self, platform, operation, seconds):
+        self.parses.append((platform, operation, seconds))
+
+
+class TestHistogram(unittest.TestCase):
+    def test_quantile(self):
+        histogram = Histogram(buckets=(1, 2, 4))
+        self.assertEqual(histogram.quantile(0.5), 0.0)
+        for value in (0.5, 1.5, 1.5, 3, 100):
+            histogram.observe(value)
+        self.assertListEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.sum, 106.5)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.75)
+        self.assertEqual(histogram.quantile(0.99), 4)
+
+    def test_prometheus(self):
+        sink = MemorySink()
+        span = RequestSpan('GET', 'http://poj.org/status', operation='get_result')
+        span.status, span.ttfb, span.total, span.bytes = 200, 0.02, 0.03, 2048
+        sink.record_request(span)
+        sink.record_parse('POJ', 'result_parse', 0.004)
+        text = sink.to_prometheus()
+        self.assertIn('# TYPE spider_http_request_seconds histogram', text)
+        self.assertIn('spider_http_request_seconds_bucket{platform="POJ",operation="get_result",le="0.05"} 1', text)
+        self.assertIn('spider_http_request_seconds_bucket{platform="POJ",operation="get_result",le="+Inf"} 1', text)
+        self.assertIn('spider_http_response_bytes_sum{platform="POJ",operation="get_result"} 2048', text)
+        self.assertIn('spider_http_requests_total{platform="POJ",operation="get_result",status="200"} 1', text)
+        self.assertIn('spider_parse_seconds_count{platform="POJ",operation="result_parse"} 1', text)
+        self.assertEqual(sink.counter('spider_http_requests_total', platform='POJ'), 1)
+        self.assertEqual(sink.histogram('spider_http_ttfb_seconds', platform='POJ', operation='get_result').count, 1)
+
+
+class TestOperation(unittest.TestCase):
+    def test_context(self):
+        self.assertEqual(current_operation(), '')
+        with operation('submit'):
+            self.assertEqual(current_operation(), 'submit')
+            with operation('get_result'):
+                self.assertEqual(current_operation(), 'get_result')
+            self.assertEqual(current_operation(), 'submit')
+        self.assertEqual(current_operation(), '')
+
+    def test_decorator(self):
+        @operation('sync')
+        def sync():
+            return current_operation()
+
+        @operation('async')
+        async def run():
+            return current_operation()
+
+        self.assertEqual(sync(), 'sync')
+        self.assertEqual(asyncio.run(run()), 'async')
+        self.assertEqual(current_operation(), '')
+
+    def test_platform(self):
+        self.assertEqual(platform_of('http://acm.hdu.edu.cn/status.php'), 'HDU')
+        self.assertEqual(platform_of('https://judgeapi.u-aizu.ac.jp/self'), 'Aizu')
+        self.assertEqual(platform_of('http://example.com/'), 'other')
+        self.assertEqual(platform_of('https://static.example.net/a.png'), 'other')
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.sink = ListSink()
+        metrics.add_sink(self.sink)
+        self.farm = MockFarm(judge_time=(0, 0))
+        self.farm.__enter__()
+
+    def tearDown(self):
+        self.farm.__exit__(None, None, None)
+        metrics.remove_sink(self.sink)
+
+    def test_core(self):
+        core = Core('HDU')
+        core.get_problem('1000', Account('robot', 'secret'))
+        span = self.sink.requests[-1]
+        self.assertEqual((span.method, span.platform, span.operation, span.status), ('GET', 'HDU', 'get_problem', 200))
+        self.assertEqual(span.url, 'http://acm.hdu.edu.cn/showproblem.php?pid=1000')
+        self.assertGreater(span.bytes, 1000)
+        self.assertGreater(span.connect, 0)
+        self.assertLessEqual(span.ttfb, span.total)
+        self.assertEqual(self.sink.parses[-1][:2], ('HDU', 'problem_parse'))
+
+        core.get_problem('1000', Account('robot', 'secret'))
+        self.assertEqual(self.sink.requests[-1].connect, 0)
+
+        core.submit(Account('robot', 'secret'), '1000', '0', 'code')
+        self.assertSetEqual({span.operation for span in self.sink.requests[2:]}, {'submit'})
+        self.assertIn('POST', [span.method for span in self.sink.requests[2:]])
+
+    def test_async(self):
+        async def run():
+            async with AsyncCore('POJ') as core:
+                await core.get_problem('1000', Account('robot', 'secret'))
+
+        asyncio.run(run())
+        span = self.sink.requests[-1]
+        self.assertEqual((span.platform, span.operation, span.status), ('POJ', 'get_problem', 200))
+        self.assertGreater(span.connect, 0)
+        self.assertGreater(span.bytes, 1000)
+
+    def test_error(self):
+        base = self.farm.base
+        self.farm.__exit__(None, None, None)
+        self.assertIsNone(HttpUtil().get(base + '/'))
+        self.assertEqual(self.sink.requests[-1].error, 'ConnectionError')
+        self.farm.__enter__()
+
+    def test_disabled(self):
+        metrics.enabled = False
+        try:
+            Core('POJ').is_working()
+        finally:
+            metrics.enabled = True
+        self.assertListEqual(self.sink.requests, [])
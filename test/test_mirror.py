@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from spider.config import Account
+from spider.core import Core
+from spider.mirror import AssetMirror, AssetStore, normalize_url
+from spider.utils import AsyncResponse
+from test.mockoj import MockFarm
+
+BASE = 'https://static.example.com/assets'
+
+
+class TestAssetMirror(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.store = AssetStore(self.temp.name)
+
+    def tearDown(self):
+        self.store.close()
+        self.temp.cleanup()
+
+    def files(self):
+        return sorted(name for _, _, names in os.walk(self.temp.name) for name in names
+                      if not name.startswith('index.sqlite'))
+
+    def test_find_assets(self):
+        html = ('<img class="vj-image" src="http://acm.hdu.edu.cn/../data/images/1.jpg"/>'
+                '<a class="vj-anchor" href="http://poj.org/files/1000.pdf" target="_blank">'
+                '<a class="vj-anchor" href="http://poj.org/searchproblem?field=source&amp;key=POJ">'
+                '<img src="data:image/png;base64,AAAA"/>'
+                '<img src="http://acm.zju.edu.cn/onlinejudge/showImage?name=1001.gif&amp;x=1"/>')
+        self.assertListEqual(AssetMirror.find_assets(html), [
+            ('http://acm.hdu.edu.cn/../data/images/1.jpg', 'http://acm.hdu.edu.cn/data/images/1.jpg'),
+            ('http://poj.org/files/1000.pdf', 'http://poj.org/files/1000.pdf'),
+            ('http://acm.zju.edu.cn/onlinejudge/showImage?name=1001.gif&amp;x=1',
+             'http://acm.zju.edu.cn/onlinejudge/showImage?name=1001.gif&x=1'),
+        ])
+        self.assertIsNone(normalize_url('/images/1.jpg'))
+
+    def test_store(self):
+        asset = self.store.put('http://poj.org/images/1.jpg',
+                               AsyncResponse(200, b'jpg', {'ETag': '"1"', 'Content-Type': 'image/jpeg'}, ''))
+        self.assertEqual(asset.name, f'{asset.digest[:2]}/{asset.digest}.jpg')
+        with open(self.store.path(asset), 'rb') as f:
+            self.assertEqual(f.read(), b'jpg')
+        # 内容相同的文件只保存一份，没有扩展名的时候按 Content-Type 猜
+        other = self.store.put('http://poj.org/showImage?name=1',
+                               AsyncResponse(200, b'jpg', {'Content-Type': 'image/png'}, ''))
+        self.assertEqual(other.digest, asset.digest)
+        self.assertEqual(other.extension, '.png')
+        self.assertDictEqual(self.store.get('http://poj.org/images/1.jpg').conditional_headers(),
+                             {'If-None-Match': '"1"'})
+        os.remove(self.store.path(asset))
+        self.assertIsNone(self.store.get('http://poj.org/images/1.jpg'))
+
+    def test_mirror(self):
+        html = ('<p><img class="vj-image" src="http://acm.hdu.edu.cn/a/1.png"/>'
+                '<img class="vj-image" src="http://poj.org/b/1.png"/>'
+                '<a class="vj-anchor" href="http://poj.org/files/data.zip">data</a>'
+                '<a class="vj-anchor" href="http://poj.org/faq.htm">faq</a>'
+                '<img class="vj-image" src="http://poj.org/missing"/></p>')
+        with MockFarm() as farm:
+            mirror = AssetMirror(self.store, BASE + '/', max_workers=4)
+            mirrored = mirror.mirror_html(html)
+            self.assertEqual(mirror.stats['downloaded'], 3)
+            self.assertEqual(mirror.stats['failed'], 1)
+            self.assertEqual(len(self.files()), 2)
+            self.assertNotIn('http://acm.hdu.edu.cn/a/1.png', mirrored)
+            self.assertNotIn('data.zip', mirrored)
+            self.assertIn('href="http://poj.org/faq.htm"', mirrored)
+            self.assertIn('src="http://poj.org/missing"', mirrored)
+            name = self.store.get('http://poj.org/b/1.png').name
+            self.assertIn(f'src="{BASE}/{name}"', mirrored)
+
+            # 已经下载过的不再请求，过期之后带 If-None-Match 重新校验
+            requests = sum(farm.stats.values())
+            self.assertEqual(mirror.mirror_html(html), mirrored)
+            self.assertEqual(mirror.stats['reused'], 3)
+            self.assertEqual(sum(farm.stats.values()), requests + 1)
+            mirror.refresh_after = 0
+            self.assertEqual(mirror.mirror_html(html), mirrored)
+            self.assertEqual(mirror.stats['revalidated'], 3)
+            self.assertEqual(farm.stats.get(('poj.org', 304)), 2)
+            mirror.close()
+
+    def test_core(self):
+        with MockFarm():
+            mirror = AssetMirror(self.store, BASE)
+            problem = Core('HDU', mirror=mirror).get_problem('1000', Account('robot', 'secret'))
+            mirror.close()
+        self.assertEqual(mirror.stats['downloaded'], 1)
+        asset = self.store.get('http://acm.hdu.edu.cn/data/images/C1000-1.jpg')
+        self.assertIn(f'src="{BASE}/{asset.name}"', problem.html)
+        self.assertNotIn('C1000-1.jpg', problem.html)
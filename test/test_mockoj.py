@@ -0,0 +1,161 @@
+import asyncio
+import time
+import unittest
+
+from spider.config import Account, Problem, Result
+from spider.core import AsyncCore, Core
+from spider.platforms.hdu import HDUParser
+from spider.redirect import Redirector, redirector
+from test.mockoj import MockFarm, Throttle, targets
+
+
+class TestRedirector(unittest.TestCase):
+    def test_rewrite(self):
+        redirect = Redirector()
+        self.assertEqual(redirect.rewrite('http://poj.org/status?top=1'), 'http://poj.org/status?top=1')
+        redirect.set_base('http://127.0.0.1:8800/')
+        self.assertEqual(redirect.rewrite('http://poj.org/status?top=1'),
+                         'http://127.0.0.1:8800/poj.org/status?top=1')
+        self.assertEqual(redirect.rewrite('http://codeforces.com'), 'http://127.0.0.1:8800/codeforces.com/')
+        redirect.set_base('http://127.0.0.1:8800/mock', hosts=['poj.org'])
+        self.assertEqual(redirect.rewrite('https://judgeapi.u-aizu.ac.jp/self'), 'https://judgeapi.u-aizu.ac.jp/self')
+        self.assertEqual(redirect.rewrite('http://poj.org/'), 'http://127.0.0.1:8800/mock/poj.org/')
+
+
+class TestMockFarm(unittest.TestCase):
+    def setUp(self):
+        self.farm = MockFarm(judge_time=(0.15, 0.15))
+        self.farm.__enter__()
+        self.account = Account('robot', 'secret')
+
+    def tearDown(self):
+        self.farm.__exit__(None, None, None)
+
+    def wait_verdict(self, core, pid):
+        deadline = time.monotonic() + 5
+        result = core.get_result(self.account, pid)
+        while result.verdict == Result.Verdict.VERDICT_RUNNING and time.monotonic() < deadline:
+            time.sleep(0.1)
+            result = core.get_result(self.account, pid)
+        return result
+
+    def test_redirect(self):
+        self.assertEqual(redirector.base, self.farm.base)
+
+    def test_submit(self):
+        for oj_name, (pid, language) in targets.items():
+            with self.subTest(oj_name=oj_name):
+                core = Core(oj_name)
+                self.assertTrue(core.is_working())
+                self.assertTrue(core.find_language(self.account))
+                self.assertEqual(core.get_problem(pid, self.account).status, Problem.Status.STATUS_SUCCESS)
+
+                result = core.submit(self.account, pid, language, 'int main() {}')
+                self.assertEqual(result.status, Result.Status.STATUS_SUBMIT_SUCCESS)
+                result = core.get_result(self.account, pid)
+                self.assertEqual(result.status, Result.Status.STATUS_RESULT_SUCCESS)
+                self.assertEqual(result.verdict, Result.Verdict.VERDICT_RUNNING)
+                result = self.wait_verdict(core, pid)
+                self.assertEqual(result.verdict, Result.Verdict.VERDICT_AC)
+                rid = result.unique_key
+
+                core.submit(self.account, pid, language, '// wrong answer')
+                self.assertEqual(self.wait_verdict(core, pid).verdict, Result.Verdict.VERDICT_WA)
+                self.assertEqual(core.get_result_by_rid_and_pid(rid, pid).verdict, Result.Verdict.VERDICT_AC)
+
+    def test_run_id(self):
+        for oj_name, (pid, language) in targets.items():
+            with self.subTest(oj_name=oj_name):
+                core = Core(oj_name)
+                first = core.submit(self.account, pid, language, 'int main() {}')
+                second = core.submit(self.account, pid, language, '// wrong answer')
+                self.assertTrue(first.unique_key)
+                self.assertNotEqual(first.unique_key, second.unique_key)
+                time.sleep(0.4)
+                # 按运行id查询，较早的提交不会被同一个账号较新的提交覆盖
+                self.assertEqual(core.get_result_by_rid_and_pid(first.unique_key, pid).verdict,
+                                 Result.Verdict.VERDICT_AC)
+                self.assertEqual(core.get_result_by_rid_and_pid(second.unique_key, pid).verdict,
+                                 Result.Verdict.VERDICT_WA)
+        # 已经登录之后，一次提交只有提交页 (ZOJ、WUST、Codeforces)、提交和跳转到的状态页的请求，
+        # Aizu 的提交接口不返回运行id，提交之后查询一次提交记录
+        requests = {'HDU': 2, 'POJ': 2, 'ZOJ': 3, 'WUST': 3, 'Aizu': 2, 'Codeforces': 3}
+        for oj_name, (pid, language) in targets.items():
+            with self.subTest(oj_name=oj_name, requests=requests[oj_name]):
+                core = Core(oj_name)
+                core.submit(self.account, pid, language, 'int main() {}')
+                before = sum(self.farm.stats.values())
+                self.assertTrue(core.submit(self.account, pid, language, 'int main() {}').unique_key)
+                self.assertEqual(sum(self.farm.stats.values()) - before, requests[oj_name])
+        # 状态页中取这个账号在这道题上最靠前的一行，其他账号和其他题目的提交不算
+        core = Core('HDU')
+        rid = core.submit(self.account, '1000', '0', 'int main() {}').unique_key
+        Core('HDU').submit(Account('other', 'secret'), '1000', '0', 'int main() {}')
+        core.submit(self.account, '1001', '0', 'int main() {}')
+        page = core._oj._req.get('http://acm.hdu.edu.cn/status.php')
+        self.assertEqual(HDUParser().submitted_run_id(page, 'robot', '1000'), rid)
+        self.assertIsNone(HDUParser().submitted_run_id(page, 'nobody', '1000'))
+        # 提交没有跳转到状态页的时候，同一个账号之前的提交不会被当作这次提交
+        core._oj._req.post = lambda url, data=None, json=None, **kwargs: core._oj._req.get('http://acm.hdu.edu.cn/')
+        self.assertIsNone(core.submit(self.account, '1000', '0', 'int main() {}').unique_key)
+        # Aizu 的提交记录还没有出现的时候，最新一条是之前的提交，不记录运行id
+        aizu = Core('Aizu')._oj
+        records = aizu._req.get(aizu.result_url(self.account, 'ITP1_1_A'))
+        self.assertTrue(aizu.recent_run_id(records, time.time() - 1))
+        self.assertIsNone(aizu.recent_run_id(records, time.time() + 10))
+        self.assertIsNone(Core('Codeforces')._oj.attach_run_id_from_status(
+            Result(Result.Status.STATUS_SUBMIT_SUCCESS),
+            '<tr data-submission-id="2"><a href="/contest/1/problem/B">1B</a></tr>', '1A').unique_key)
+
+    def test_problem_filter(self):
+        for oj_name in ('HDU', 'POJ'):
+            with self.subTest(oj_name=oj_name):
+                core = Core(oj_name)
+                core.submit(self.account, '1000', '0', '// wrong answer')
+                core.submit(self.account, '1001', '0', 'int main() {}')
+                # 同一个账号之后提交了其他题目，按题号查询仍然是这道题的结果
+                self.assertEqual(self.wait_verdict(core, '1000').verdict, Result.Verdict.VERDICT_WA)
+                self.assertEqual(self.wait_verdict(core, '1001').verdict, Result.Verdict.VERDICT_AC)
+
+    def test_accounts(self):
+        self.farm.accounts = {'robot': 'secret'}
+        core = Core('HDU')
+        self.assertEqual(core.submit(Account('robot', 'wrong'), '1000', '0', '').status,
+                         Result.Status.STATUS_SUBMIT_ERROR)
+        self.assertEqual(core.submit(self.account, '1000', '0', '').status, Result.Status.STATUS_SUBMIT_SUCCESS)
+        # 登录失败时和原来一样返回空字典，调用方可以直接遍历
+        for oj_name in ('HDU', 'Codeforces'):
+            with self.subTest(oj_name=oj_name):
+                self.assertEqual(Core(oj_name).find_language(Account('robot', 'wrong')), {})
+
+        async def find_language():
+            async with AsyncCore('Codeforces') as core:
+                return await core.find_language(Account('robot', 'wrong'))
+        self.assertEqual(asyncio.run(find_language()), {})
+
+    def test_faults(self):
+        self.farm.error_rate = 1
+        self.assertEqual(Core('POJ').get_problem('1000', self.account).status, Problem.Status.STATUS_RETRYABLE)
+        self.assertEqual(self.farm.stats[('poj.org', 500)], 1)
+        self.farm.error_rate = 0
+        self.farm.throttle = Throttle(1)
+        core = Core('POJ')
+        self.assertEqual(core.get_problem('1000', self.account).status, Problem.Status.STATUS_SUCCESS)
+        self.assertEqual(core.get_problem('1000', self.account).status, Problem.Status.STATUS_RETRYABLE)
+        self.assertEqual(self.farm.stats[('poj.org', 503)], 1)
+
+    def test_async(self):
+        async def run(oj_name, pid, language):
+            async with AsyncCore(oj_name) as core:
+                self.assertTrue(await core.is_working())
+                self.assertTrue(await core.find_language(self.account))
+                self.assertEqual((await core.get_problem(pid, self.account)).status, Problem.Status.STATUS_SUCCESS)
+                result = await core.submit(self.account, pid, language, '// compile error')
+                self.assertEqual(result.status, Result.Status.STATUS_SUBMIT_SUCCESS)
+                await asyncio.sleep(0.5)
+                return await core.get_result(self.account, pid)
+
+        # 异步版本和同步版本共用地址、表单和解析，这里覆盖每个平台的异步请求
+        for oj_name, (pid, language) in targets.items():
+            with self.subTest(oj_name=oj_name):
+                self.assertEqual(asyncio.run(run(oj_name, pid, language)).verdict, Result.Verdict.VERDICT_CE)
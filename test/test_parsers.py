@@ -0,0 +1,96 @@
+import json
+import unittest
+from enum import Enum
+
+from bs4 import BeautifulSoup
+
+from benchmark.parsers import parsers
+from spider.parser_backend import backends, html_tree, node_string, node_text, stripped_strings, to_html
+from spider.platforms.hdu import HDUParser
+from test.fixtures import fixture_path, load_response, pages, problem_response, result_response
+
+snippets = [
+    '<div class=" a  b ">x &amp; y &lt; z<br><hr noshade></div>',
+    '<p id=a title=\'say "hi"\'>one <b>two</b> three</p>',
+    '<div>\n  <span>a</span>\n\t<span> </span>\n</div>',
+    '<pre>  keep\n  <b> </b>  </pre>',
+    '<div><script>if (a < b && c) {}</script><style>p > a {}</style>text</div>',
+    '<head><meta charset="gbk"><meta http-equiv="Content-Type" content="text/html; charset=gb2312"></head>',
+    '<div><!-- comment --><img src="a.png" alt=""><a href="/x" rel="nofollow  me">link</a></div>',
+    '<ruby>kanji<rt>kana</rt></ruby><template><p>hidden</p></template>',
+    '<table><tr><td>1</td><td><font color=red>Accepted</font></td></tr></table>',
+]
+
+
+def dump(obj):
+    data = {}
+    for key, value in obj.__dict__.items():
+        if isinstance(value, Enum):
+            value = value.value
+        elif value is not None and not isinstance(value, (bool, str)):
+            value = str(value)
+        data[key] = value
+    return data
+
+
+class TestParsers(unittest.TestCase):
+    """
+    expected.json 是用 bs4 整页解析时的输出，只解析部分节点以及换成 lxml 后端之后结果都必须完全一致
+    """
+
+    def test_parse(self):
+        for backend in backends:
+            for oj_name, parser_class in parsers.items():
+                with self.subTest(backend=backend, oj_name=oj_name):
+                    with open(fixture_path(oj_name, 'expected.json'), encoding='utf-8') as f:
+                        expected = json.load(f)
+                    parser = parser_class()
+                    parser.backend = backend
+                    pid = pages[oj_name][2]
+                    problem = parser.problem_parse(problem_response(oj_name), pid, 'http://example/' + pid)
+                    self.assertDictEqual(dump(problem), expected['problem'])
+                    self.assertDictEqual(dump(parser.result_parse(result_response(oj_name))), expected['result'])
+                    if 'results' in expected:
+                        results = parser.result_list_parse(result_response(oj_name))
+                        self.assertListEqual([dump(result) for result in results], expected['results'])
+
+    def test_container(self):
+        # 标题所在容器之外 (顶部公告、页脚) 的 panel 不属于题面
+        for backend in backends:
+            with self.subTest(backend=backend):
+                parser = HDUParser()
+                parser.backend = backend
+                problem = parser.problem_parse(load_response('HDU', 'problem_notice.html'), '1000', '')
+                self.assertEqual(problem.html, parser.problem_parse(problem_response('HDU'), '1000', '').html)
+                self.assertNotIn('Contest Notice', problem.html)
+
+
+class TestSerializer(unittest.TestCase):
+    """
+    lxml 后端的输出必须和 bs4 完全一致
+    """
+
+    def assertSameTree(self, text):
+        soup = BeautifulSoup(text, 'lxml')
+        root = html_tree(text)
+        tags = soup.find_all(True)
+        elements = [node for node in root.iter() if isinstance(node.tag, str)]
+        self.assertEqual(len(tags), len(elements))
+        for tag, node in zip(tags, elements):
+            self.assertEqual(str(tag), to_html(node))
+            self.assertEqual(tag.string, node_string(node))
+            self.assertEqual(tag.get_text(), node_text(node))
+            self.assertListEqual(list(tag.stripped_strings), list(stripped_strings(node)))
+
+    def test_snippets(self):
+        for snippet in snippets:
+            with self.subTest(snippet=snippet):
+                self.assertSameTree(snippet)
+
+    def test_fixtures(self):
+        for oj_name, (_, _, _, problem_file, result_file) in pages.items():
+            for name in (problem_file, result_file):
+                if not name.endswith('.html'):
+                    continue
+                with self.subTest(oj_name=oj_name, name=name):
+                    self.assertSameTree(load_response(oj_name, name).text)
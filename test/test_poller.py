@@ -0,0 +1,131 @@
+import threading
+import time
+import unittest
+
+from spider.config import Account, Result
+from spider.poller import VerdictPoller, get_poller
+
+
+class FakeCore(object):
+    def __init__(self, verdicts, submit_status=Result.Status.STATUS_SUBMIT_SUCCESS):
+        self.verdicts = list(verdicts)
+        self.submit_status = submit_status
+        self.calls = []
+
+    def submit(self, account, pid, language, code):
+        return Result(self.submit_status)
+
+    def get_result_delay(self):
+        return 0
+
+    def get_remote_oj(self):
+        return 'HDU'
+
+    def supports_result_page(self):
+        return False
+
+    def _next(self):
+        result = Result(Result.Status.STATUS_RESULT_SUCCESS)
+        result.unique_key = '42'
+        result.verdict = self.verdicts.pop(0)
+        return result
+
+    def get_result(self, account, pid):
+        self.calls.append('get_result')
+        return self._next()
+
+    def get_result_by_rid_and_pid(self, rid, pid):
+        self.calls.append(rid)
+        return self._next()
+
+
+class TestVerdictPoller(unittest.TestCase):
+    def setUp(self):
+        self.poller = VerdictPoller(initial_delay=0.01, factor=2, max_delay=0.05, timeout=5)
+        self.account = Account('robot4test', 'robot4test')
+
+    def tearDown(self):
+        self.poller.stop()
+
+    def test_submit(self):
+        core = FakeCore([Result.Verdict.VERDICT_RUNNING, Result.Verdict.VERDICT_RUNNING, Result.Verdict.VERDICT_AC])
+        handle = self.poller.submit(core, self.account, '1000', 'C++', 'int main(){}')
+        result = handle.result(timeout=5)
+        self.assertEqual(result.verdict, Result.Verdict.VERDICT_AC)
+        self.assertListEqual(core.calls, ['get_result', '42', '42'])
+        self.assertEqual(handle.polls, 3)
+
+    def test_submit_error(self):
+        core = FakeCore([], submit_status=Result.Status.STATUS_SPIDER_ERROR)
+        handle = self.poller.submit(core, self.account, '1000', 'C++', 'int main(){}')
+        self.assertEqual(handle.result(timeout=5).status, Result.Status.STATUS_SPIDER_ERROR)
+        self.assertListEqual(core.calls, [])
+
+    def test_track(self):
+        core = FakeCore([Result.Verdict.VERDICT_WA])
+        handle = self.poller.track(core, self.account, '1000', rid='7')
+        self.assertEqual(handle.result(timeout=5).verdict, Result.Verdict.VERDICT_WA)
+        self.assertListEqual(core.calls, ['7'])
+
+    def test_batch(self):
+        class PagedCore(FakeCore):
+            def supports_result_page(self):
+                return True
+
+            def get_results_by_rids(self, rids, pid=None):
+                self.calls.append(sorted(rids))
+                results = {}
+                for rid in rids:
+                    results[rid] = Result(Result.Status.STATUS_RESULT_SUCCESS)
+                    results[rid].unique_key = rid
+                    results[rid].verdict = Result.Verdict.VERDICT_AC
+                return results
+
+        core = PagedCore([])
+        poller = VerdictPoller(initial_delay=0.01, coalesce=1)
+        handles = [poller.track(core, self.account, '1000', rid=rid) for rid in ['11', '12', '13']]
+        self.assertTrue(all(handle.result(timeout=5).verdict == Result.Verdict.VERDICT_AC for handle in handles))
+        self.assertIn(['11', '12', '13'], core.calls)
+        self.assertLess(len(core.calls), 3)
+        poller.stop()
+
+    def test_stop(self):
+        class SlowCore(FakeCore):
+            def submit(self, account, pid, language, code):
+                release.wait(5)
+                return super().submit(account, pid, language, code)
+
+        release = threading.Event()
+        release.set()
+        core = SlowCore([])
+        poller = VerdictPoller(initial_delay=60)
+        queued = poller.submit(core, self.account, '1000', 'C++', 'int main(){}')
+        while not poller.pending():
+            time.sleep(0.01)
+        release.clear()
+        running = poller.submit(core, self.account, '1000', 'C++', 'int main(){}')
+        poller.stop()
+        # 停止之后等待结果的调用不会一直挂起，用最后一次查询到的结果结束
+        self.assertEqual(queued.result(timeout=1).status, Result.Status.STATUS_SUBMIT_SUCCESS)
+        self.assertFalse(running.done())
+        release.set()
+        self.assertEqual(running.result(timeout=5).status, Result.Status.STATUS_SUBMIT_SUCCESS)
+        self.assertListEqual(core.calls, [])
+
+    def test_after_stop(self):
+        core = FakeCore([Result.Verdict.VERDICT_AC])
+        self.poller.stop()
+        # 停止之后的提交和跟踪立即结束，不会因为线程池已经关闭抛出 RuntimeError
+        handle = self.poller.submit(core, self.account, '1000', 'C++', 'int main(){}')
+        self.assertEqual(handle.result(timeout=1).status, Result.Status.STATUS_SUBMIT_ERROR)
+        handle = self.poller.track(core, self.account, '1000', rid='7')
+        self.assertEqual(handle.result(timeout=1).status, Result.Status.STATUS_RESULT_ERROR)
+        self.assertListEqual(core.calls, [])
+        # 共享的 poller 被停止之后 get_poller 返回一个新的
+        stopped = get_poller()
+        stopped.stop()
+        poller = get_poller()
+        self.assertIsNot(poller, stopped)
+        self.assertIs(get_poller(), poller)
+        self.assertEqual(poller.track(core, self.account, '1000', rid='7').result(timeout=5).verdict,
+                         Result.Verdict.VERDICT_AC)
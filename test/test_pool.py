@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+
+from spider.config import Account, Result
+from spider.poller import VerdictPoller
+from spider.pool import AccountPool, CorePool, PoolExhausted
+from test.mockoj import MockFarm, targets
+
+
+class TestCorePool(unittest.TestCase):
+    def test_reuse(self):
+        pool = CorePool()
+        account = Account('robot4test', 'robot4test')
+        core = pool.checkout('HDU', account)
+        pool.checkin(core)
+        self.assertIs(pool.checkout('HDU', account), core)
+        self.assertIsNot(pool.checkout('HDU', Account('other', 'other')), core)
+        self.assertIsNot(pool.checkout('HDU', account, proxies='socks5://127.0.0.1:1080'), core)
+        self.assertDictEqual(pool.stats(), {'total': 3, 'busy': 3, 'idle': 0})
+
+    def test_limits(self):
+        pool = CorePool(max_per_key=1, max_total=2)
+        core = pool.checkout('HDU')
+        self.assertRaises(PoolExhausted, pool.checkout, 'HDU', wait=0.05)
+        threading.Timer(0.05, pool.checkin, args=(core,)).start()
+        self.assertIs(pool.checkout('HDU', wait=1), core)
+        pool.checkin(core)
+        pool.checkin(pool.checkout('POJ'))
+        pool.checkin(pool.checkout('ZOJ'))
+        self.assertDictEqual(pool.stats(), {'total': 2, 'busy': 0, 'idle': 2})
+
+    def test_idle_eviction(self):
+        pool = CorePool(idle_timeout=0.01)
+        with pool.core('HDU'):
+            pass
+        time.sleep(0.02)
+        pool.evict_idle()
+        self.assertDictEqual(pool.stats(), {'total': 0, 'busy': 0, 'idle': 0})
+
+
+class TestAccountPool(unittest.TestCase):
+    def setUp(self):
+        self.accounts = [Account('robot1', 'secret'), Account('robot2', 'secret')]
+        self.pool = AccountPool('HDU', self.accounts, core_pool=CorePool())
+
+    def test_lease(self):
+        first, second = self.pool.lease(), self.pool.lease()
+        self.assertNotEqual(first.account.username, second.account.username)
+        self.assertIsNot(first.core, second.core)
+        self.assertRaises(PoolExhausted, self.pool.lease, wait=0.05)
+        threading.Timer(0.05, first.release).start()
+        self.assertIs(self.pool.lease(wait=1).account, first.account)
+
+    def test_cooldown_and_health(self):
+        pool = AccountPool('HDU', self.accounts[:1], cooldown=0.1, max_failures=2, penalty=0.2,
+                           core_pool=CorePool())
+        pool.lease().release(Result(Result.Status.STATUS_RESULT_SUCCESS))
+        self.assertRaises(PoolExhausted, pool.lease, wait=0.02)
+        start = time.monotonic()
+        pool.lease(wait=1).release(Result(Result.Status.STATUS_SUBMIT_ERROR))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        with pool.lease(wait=1) as lease:
+            lease.release(Result(Result.Status.STATUS_SUBMIT_ERROR))
+        stats = pool.stats()[0]
+        self.assertFalse(stats['healthy'])
+        self.assertEqual(stats['failures'], 2)
+        self.assertEqual(stats['last_error'], Result.Status.STATUS_SUBMIT_ERROR.value)
+        self.assertRaises(PoolExhausted, pool.lease, wait=0.1)
+        pool.lease(wait=1).release(Result(Result.Status.STATUS_RESULT_SUCCESS))
+        self.assertTrue(pool.stats()[0]['healthy'])
+
+    def test_submit(self):
+        poller = VerdictPoller(initial_delay=0.05, factor=1, timeout=10)
+        codes = ['int main() {}', '// wrong answer', '// compile error']
+        expected = [Result.Verdict.VERDICT_AC, Result.Verdict.VERDICT_WA, Result.Verdict.VERDICT_CE]
+        try:
+            with MockFarm(judge_time=(0.1, 0.1), accounts={'robot1': 'secret', 'robot2': 'secret'}):
+                pid, language = targets['HDU']
+                handles = [self.pool.submit_code_async(pid, language, code, poller=poller, wait=30)
+                           for code in codes]
+                self.assertListEqual([handle.result(timeout=30).verdict for handle in handles], expected)
+        finally:
+            poller.stop()
+        self.assertListEqual(sorted(stats['submissions'] for stats in self.pool.stats()), [1, 2])
+        # 登录之后的 cookies 保存回账号
+        self.assertTrue(all(account.cookies for account in self.accounts))
+
+    def test_lease_timeout(self):
+        # 一直没有最终结果的提交在 lease_timeout 之后归还账号
+        pool = AccountPool('HDU', self.accounts[:1], lease_timeout=0.2, core_pool=CorePool())
+        poller = VerdictPoller(initial_delay=60)
+        try:
+            with MockFarm(judge_time=(0, 0)):
+                pid, language = targets['HDU']
+                handle = pool.submit_code_async(pid, language, 'int main() {}', poller=poller, wait=5)
+                self.assertRaises(PoolExhausted, pool.lease, wait=0.05)
+                pool.lease(wait=5).release()
+                self.assertFalse(handle.done())
+                self.assertEqual(pool.stats()[0]['last_error'], repr(TimeoutError('lease expired')))
+        finally:
+            poller.stop()
@@ -0,0 +1,66 @@
+import io
+import os
+import tempfile
+import unittest
+
+from spider.config import Account
+from spider.core import Core
+from spider.profiling import MODE_ALL, MODE_CPROFILE, Profiler, profiler, summarize, top_allocations
+from test.mockoj import MockFarm
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.directory = self.temp.name
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def files(self, *parts):
+        path = os.path.join(self.directory, *parts)
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    def test_run(self):
+        profile = Profiler(MODE_ALL, rate=1, directory=self.directory, keep=4)
+        self.assertEqual(profile.run('POJ', 'parse', lambda n: [str(i) for i in range(n)], 1000)[-1], '999')
+        files = self.files('POJ', 'parse')
+        self.assertEqual([os.path.splitext(name)[1] for name in files], ['.prof', '.tracemalloc'])
+
+        for _ in range(3):
+            profile.run('POJ', 'parse', sum, range(10))
+        self.assertEqual(len(self.files('POJ', 'parse')), 4)
+        self.assertEqual(profile.written, 4)
+
+        stream = io.StringIO()
+        self.assertEqual(summarize(self.directory, stream=stream), 2)
+        self.assertIn('builtins.sum', stream.getvalue())
+        self.assertTrue(top_allocations(self.directory))
+
+    def test_sampling(self):
+        profile = Profiler(MODE_CPROFILE, rate=0, directory=self.directory)
+        self.assertFalse(profile.enabled)
+        profile.run('POJ', 'parse', sum, range(10))
+        self.assertEqual(self.files(), [])
+        profile.enable(MODE_CPROFILE, rate=1)
+        with profile._busy:
+            profile.run('POJ', 'parse', sum, range(10))
+        self.assertEqual(profile.skipped, 1)
+        self.assertEqual(self.files(), [])
+        with self.assertRaises(ValueError):
+            profile.enable('perf')
+
+    def test_core(self):
+        saved = (profiler.mode, profiler.rate, profiler.directory)
+        profiler.enable(MODE_CPROFILE, rate=1, directory=self.directory)
+        try:
+            with MockFarm():
+                Core('HDU').get_problem('1000', Account('robot', 'secret'))
+                Core('POJ').is_working()
+        finally:
+            profiler.enable(*saved)
+        self.assertEqual(len(self.files('HDU', 'get_problem')), 1)
+        self.assertEqual(len(self.files('POJ', 'is_working')), 1)
+        stream = io.StringIO()
+        summarize(os.path.join(self.directory, 'HDU'), stream=stream)
+        self.assertIn('problem_parse', stream.getvalue())
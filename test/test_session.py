@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from spider.config import Account, Result
+from spider.core import AsyncCore, Core
+from spider.redirect import redirector
+from spider.session import SessionStore, sessions
+from test.mockoj import SESSION_MAX_AGE, MockFarm, targets
+
+
+def submit_in_process(base, hosts, path, oj_name, pid, language):
+    # 子进程用 spawn 启动，重新指向模拟的源OJ和会话文件
+    redirector.set_base(base, hosts)
+    sessions.set_backend(path)
+    result = Core(oj_name).submit(Account('robot', 'secret'), pid, language, 'int main() {}')
+    return result.status == Result.Status.STATUS_SUBMIT_SUCCESS
+
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.store = SessionStore(os.path.join(self.temp.name, 'sessions.sqlite'), ttl=60, lease=0.5)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_save(self):
+        self.assertIsNone(self.store.load('HDU', 'robot'))
+        self.store.save('HDU', 'robot', {'PHPSESSID': '1'})
+        self.assertListEqual(self.store.load('HDU', 'robot'), [{'name': 'PHPSESSID', 'value': '1'}])
+        self.assertIsNone(self.store.load('POJ', 'robot'))
+        # cookies 自己的过期时间更早的时候以 cookies 为准
+        self.store.save('POJ', 'robot', {'JSESSIONID': '2'}, expires_at=time.time() - 1)
+        self.assertIsNone(self.store.load('POJ', 'robot'))
+        self.assertEqual(self.store.purge(), 1)
+        # 另一个进程打开同一个文件可以读到
+        self.assertEqual(SessionStore(self.store._path).load('HDU', 'robot')[0]['value'], '1')
+
+    def test_lock(self):
+        token = self.store.try_lock('HDU', 'robot')
+        self.assertIsNotNone(token)
+        self.assertIsNone(self.store.try_lock('HDU', 'robot'))
+        self.assertIsNotNone(self.store.try_lock('HDU', 'other'))
+        self.store.unlock('HDU', 'robot', token)
+        with self.store.lock('HDU', 'robot'):
+            self.assertIsNone(self.store.try_lock('HDU', 'robot'))
+        # 持有租约的进程崩溃之后租约到期自动释放
+        self.assertIsNotNone(self.store.try_lock('HDU', 'robot'))
+        start = time.monotonic()
+        with self.store.lock('HDU', 'robot'):
+            self.assertGreater(time.monotonic() - start, 0.3)
+
+
+class TestSharedLogin(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        sessions.set_backend(os.path.join(self.temp.name, 'sessions.sqlite'))
+        self.farm = MockFarm(judge_time=(0, 0))
+        self.farm.__enter__()
+
+    def tearDown(self):
+        self.farm.__exit__(None, None, None)
+        sessions.set_backend(None)
+        self.temp.cleanup()
+
+    def expires_at(self, oj_name):
+        return sessions._connect().execute('SELECT expires_at FROM sessions WHERE oj = ? AND username = ?',
+                                           (oj_name, 'robot')).fetchone()[0]
+
+    def logins(self, oj_name):
+        return sum(1 for name, _ in self.farm.sessions if name == oj_name)
+
+    def test_shared(self):
+        for oj_name, (pid, language) in targets.items():
+            with self.subTest(oj_name=oj_name):
+                # 每个 Core 相当于一个新启动的进程，Account 中没有 cookies
+                results = []
+
+                def worker():
+                    results.append(Core(oj_name).submit(Account('robot', 'secret'), pid, language, 'int main() {}'))
+
+                threads = [threading.Thread(target=worker) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertTrue(all(result.status == Result.Status.STATUS_SUBMIT_SUCCESS for result in results))
+                self.assertEqual(self.logins(oj_name), 1)
+                self.assertTrue(sessions.load(oj_name, 'robot'))
+
+    def test_processes(self):
+        path = os.path.join(self.temp.name, 'sessions.sqlite')
+        args = [(self.farm.base, list(self.farm.judges), path, 'HDU', '1000', '0')] * 4
+        with multiprocessing.get_context('spawn').Pool(4) as pool:
+            self.assertTrue(all(pool.starmap(submit_in_process, args)))
+        self.assertEqual(self.logins('HDU'), 1)
+
+    def test_expired(self):
+        account = Account('robot', 'secret')
+        Core('POJ').submit(account, '1000', '0', 'int main() {}')
+        # 源OJ上的会话失效之后重新登录并写回
+        stale = sessions.load('POJ', 'robot')
+        self.farm.sessions.clear()
+        self.assertEqual(Core('POJ').submit(account, '1000', '0', '').status, Result.Status.STATUS_SUBMIT_SUCCESS)
+        self.assertEqual(self.logins('POJ'), 1)
+        self.assertNotEqual(sessions.load('POJ', 'robot'), stale)
+
+    def test_async(self):
+        async def run():
+            async with AsyncCore('HDU') as first, AsyncCore('HDU') as second:
+                account = Account('robot', 'secret')
+                return await asyncio.gather(first.submit(account, '1000', '0', 'int main() {}'),
+                                            second.submit(account, '1000', '0', 'int main() {}'))
+
+        results = asyncio.run(run())
+        self.assertTrue(all(result.status == Result.Status.STATUS_SUBMIT_SUCCESS for result in results))
+        self.assertEqual(self.logins('HDU'), 1)
+        # 和同步版本一样按 cookie 的 Max-Age 保存过期时间
+        self.assertLessEqual(self.expires_at('HDU'), time.time() + SESSION_MAX_AGE)
+        self.assertEqual(Core('HDU').submit(Account('robot', 'secret'), '1000', '0', '').status,
+                         Result.Status.STATUS_SUBMIT_SUCCESS)
+        self.assertEqual(self.logins('HDU'), 1)
+
+    def test_async_locked(self):
+        # 另一个进程持有 sqlite 的写锁期间，读写会话在线程池中等待，事件循环照常运行
+        path = os.path.join(self.temp.name, 'sessions.sqlite')
+        holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        holder.execute('BEGIN EXCLUSIVE')
+        threading.Timer(0.5, holder.execute, ('COMMIT',)).start()
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def run():
+            ticker = asyncio.ensure_future(tick())
+            try:
+                async with AsyncCore('HDU') as core:
+                    return await core.submit(Account('robot', 'secret'), '1000', '0', 'int main() {}')
+            finally:
+                ticker.cancel()
+
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(run()).status, Result.Status.STATUS_SUBMIT_SUCCESS)
+        holder.close()
+        self.assertGreater(time.monotonic() - start, 0.4)
+        self.assertLess(max(later - earlier for earlier, later in zip(ticks, ticks[1:])), 0.2)
+        self.assertTrue(sessions.load('HDU', 'robot'))
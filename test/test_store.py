@@ -0,0 +1,120 @@
+import unittest
+
+from spider.config import Account, Problem
+from spider.core import CHANGE_ADDED, CHANGE_MODIFIED, CHANGE_REMOVED, CHANGE_STALE, CHANGE_UNCHANGED, Core
+from spider.store import ProblemStore, statement_hash
+from spider.utils import AsyncResponse
+
+
+class TestProblemStore(unittest.TestCase):
+    def test_store(self):
+        store = ProblemStore(':memory:')
+        problem = Problem(Problem.Status.STATUS_SUCCESS)
+        problem.remote_oj = 'HDU'
+        problem.remote_id = '1000'
+        problem.title = 'A + B Problem'
+        store.put(problem, AsyncResponse(200, b'<html>', {'ETag': '"abc"'}, 'http://acm.hdu.edu.cn/'))
+        stored = store.get('HDU', 1000)
+        self.assertDictEqual(stored.problem.__dict__, problem.__dict__)
+        self.assertDictEqual(stored.conditional_headers(), {'If-None-Match': '"abc"'})
+        self.assertTrue(stored.is_unchanged(AsyncResponse(304, b'', {}, '')))
+        self.assertTrue(stored.is_unchanged(AsyncResponse(200, b'<html>', {}, '')))
+        self.assertFalse(stored.is_unchanged(AsyncResponse(200, b'<html> ', {}, '')))
+        self.assertFalse(stored.is_unchanged(None))
+        self.assertIsNone(store.get('HDU', '1001'))
+
+    def test_core_revalidate(self):
+        pages = [AsyncResponse(200, b'<html>1</html>', {'Last-Modified': 'Mon'}, ''),
+                 AsyncResponse(304, b'', {}, ''),
+                 AsyncResponse(200, b'<html>2</html>', {}, '')]
+        requests = []
+        parsed = []
+        core = Core('HDU', store=ProblemStore(':memory:'))
+
+        def fetch_problem(pid, headers=None):
+            requests.append(headers)
+            return pages[len(requests) - 1]
+
+        def parse_problem(response, pid):
+            parsed.append(response)
+            problem = Problem(Problem.Status.STATUS_SUCCESS)
+            problem.remote_oj, problem.remote_id, problem.html = 'HDU', pid, response.text
+            return problem
+
+        core._oj.fetch_problem, core._oj.parse_problem = fetch_problem, parse_problem
+        account = Account('robot4test', 'robot4test')
+        self.assertEqual(core.get_problem('1000', account).html, '<html>1</html>')
+        self.assertEqual(core.get_problem('1000', account).html, '<html>1</html>')
+        self.assertEqual(core.get_problem('1000', account).html, '<html>2</html>')
+        self.assertListEqual(requests, [None, {'If-Modified-Since': 'Mon'}, {'If-Modified-Since': 'Mon'}])
+        self.assertEqual(len(parsed), 2)
+
+    def test_core_stale(self):
+        pages = [AsyncResponse(200, b'<html>1</html>', {}, ''), None, AsyncResponse(503, b'busy', {}, ''), None]
+        core = Core('HDU', store=ProblemStore(':memory:'))
+
+        def fetch_problem(pid, headers=None):
+            return pages.pop(0)
+
+        def parse_problem(response, pid):
+            problem = Problem(Problem.Status.STATUS_RETRYABLE)
+            if response is not None and response.status_code == 200:
+                problem.status, problem.html = Problem.Status.STATUS_SUCCESS, response.text
+            problem.remote_oj, problem.remote_id = 'HDU', pid
+            return problem
+
+        core._oj.fetch_problem, core._oj.parse_problem = fetch_problem, parse_problem
+        account = Account('robot4test', 'robot4test')
+        self.assertEqual(core.get_problem('1000', account).html, '<html>1</html>')
+        # 源OJ请求失败或者返回 5xx 的时候使用仓库中的题目
+        problem = core.get_problem('1000', account)
+        self.assertEqual(problem.status, Problem.Status.STATUS_SUCCESS)
+        self.assertEqual(problem.html, '<html>1</html>')
+        problem, change = list(core.iter_changes(['1000']))[0]
+        self.assertEqual((problem.html, change), ('<html>1</html>', CHANGE_STALE))
+        # 仓库中没有的题目仍然返回 RETRYABLE
+        self.assertEqual(core.get_problem('1001', account).status, Problem.Status.STATUS_RETRYABLE)
+
+    def test_statement_hash(self):
+        pattern, volatile = r'(<h1>[\s\S]*?)<hr>', (r'Submissions: \d+',)
+        page = '<script>var t = {};</script><h1>A + B</h1><p>Submissions: {}</p>  <p>Calculate a + b.</p><hr>{}'
+        first = AsyncResponse(200, page.format(1, 10, 'footer').encode(), {}, '')
+        second = AsyncResponse(200, page.format(2, 11, 'other\n footer').encode(), {}, '')
+        changed = AsyncResponse(200, page.format(1, 10, 'footer').replace('a + b', 'a - b').encode(), {}, '')
+        self.assertEqual(statement_hash(first, pattern, volatile), statement_hash(second, pattern, volatile))
+        self.assertNotEqual(statement_hash(first, pattern, volatile), statement_hash(changed, pattern, volatile))
+        self.assertNotEqual(statement_hash(first), statement_hash(second))
+        self.assertIsNone(statement_hash(AsyncResponse(304, b'', {}, '')))
+
+    def test_core_changes(self):
+        page = '<h1 style=\'color:#1A5CC8\'>{}</h1>Total Submission(s): {}<center>'
+        pages = {
+            '1000': [page.format('A', 1), page.format('A', 2), page.format('A + B', 3)],
+            '1001': [page.format('B', 1), 'No such problem'],
+            '1002': ['No such problem'],
+        }
+        parsed = []
+        core = Core('HDU', store=ProblemStore(':memory:'))
+
+        def fetch_problem(pid, headers=None):
+            return AsyncResponse(200, pages[pid].pop(0).encode(), {}, '')
+
+        def parse_problem(response, pid):
+            parsed.append(pid)
+            problem = Problem(Problem.Status.STATUS_SUCCESS)
+            if 'No such problem' in response.text:
+                problem.status = Problem.Status.STATUS_RETRYABLE
+            problem.remote_oj, problem.remote_id, problem.title = 'HDU', pid, response.text.partition('</h1>')[0]
+            return problem
+
+        core._oj.fetch_problem, core._oj.parse_problem = fetch_problem, parse_problem
+        changes = dict((problem.remote_id, change) for problem, change in core.iter_changes(['1000', '1001', '1002']))
+        self.assertDictEqual(changes, {'1000': CHANGE_ADDED, '1001': CHANGE_ADDED, '1002': None})
+        # 只有提交数变化，不再解析
+        changes = dict((problem.remote_id, change) for problem, change in core.iter_changes(['1000', '1001']))
+        self.assertDictEqual(changes, {'1000': CHANGE_UNCHANGED, '1001': CHANGE_REMOVED})
+        self.assertListEqual(sorted(parsed), ['1000', '1001', '1001', '1002'])
+        core.forget_problem('1001')
+        self.assertEqual(list(core.iter_changes(['1000']))[0][1], CHANGE_MODIFIED)
+        with self.assertRaises(ValueError):
+            Core('HDU').iter_changes(['1000'])
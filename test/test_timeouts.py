@@ -0,0 +1,79 @@
+import time
+import unittest
+
+from spider.config import Account, Problem
+from spider.core import Core
+from spider.metrics import operation
+from spider.timeouts import AdaptiveTimeouts, RollingHistogram, TimeoutPolicy, timeouts
+from test.mockoj import MockFarm
+
+URL = 'http://poj.org/problem?id=1000'
+
+
+class TestRollingHistogram(unittest.TestCase):
+    def test_quantile(self):
+        histogram = RollingHistogram(window=0.2, slots=2)
+        self.assertIsNone(histogram.quantile(0.99))
+        for _ in range(99):
+            histogram.observe(0.1)
+        histogram.observe(3)
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.1, delta=0.025)
+        self.assertAlmostEqual(histogram.quantile(1), 3, delta=0.75)
+        time.sleep(0.25)
+        self.assertEqual(histogram.count(), 0)
+
+
+class TestAdaptiveTimeouts(unittest.TestCase):
+    def setUp(self):
+        policy = TimeoutPolicy(floor=(0.5, 1), ceiling=(5, 10), factor=3, min_samples=10)
+        self.timeouts = AdaptiveTimeouts({'POJ': policy})
+
+    def test_adapt(self):
+        self.assertTupleEqual(self.timeouts.timeout('POJ'), (5, 10))
+        for _ in range(10):
+            self.timeouts.observe(URL, 0.01, 0.1)
+        self.assertTupleEqual(self.timeouts.timeout('POJ'), (0.5, 1))
+        for _ in range(5):
+            self.timeouts.observe(URL, None, 2)
+        connect, read = self.timeouts.timeout('POJ')
+        self.assertEqual(connect, 0.5)
+        self.assertTrue(6 <= read <= 7.5)
+        # 超时按 ceiling 记样本
+        for _ in range(5):
+            self.timeouts.observe_timeout(URL, 'read')
+        self.assertEqual(self.timeouts.timeout('POJ')[1], 10)
+        # 不属于任何平台的域名都是 other，使用默认的范围
+        self.assertTupleEqual(self.timeouts.timeout('other'), (7, 12))
+
+    def test_operation(self):
+        with operation('get_result'):
+            for _ in range(10):
+                self.timeouts.observe(URL, 0.01, 0.1)
+        with operation('submit'):
+            for _ in range(10):
+                self.timeouts.observe(URL, 0.01, 2)
+            self.assertTrue(6 <= self.timeouts.timeout_for(URL)[1] <= 7.5)
+        with operation('get_result'):
+            self.assertEqual(self.timeouts.timeout_for(URL)[1], 1)
+        # 没有样本的操作使用整个平台的直方图
+        with operation('get_problem'):
+            self.assertTrue(6 <= self.timeouts.timeout_for(URL)[1] <= 7.5)
+        self.timeouts.set_policy('POJ', TimeoutPolicy(floor=(1, 8), ceiling=(5, 20)), operation='get_result')
+        with operation('get_result'):
+            self.assertEqual(self.timeouts.timeout_for(URL)[1], 8)
+        self.timeouts.enabled = False
+        self.assertTupleEqual(self.timeouts.timeout('POJ'), (5, 10))
+
+
+class TestHttpTimeouts(unittest.TestCase):
+    def test_override(self):
+        account = Account('robot', 'secret')
+        with MockFarm(latency=0.3):
+            core = Core('HDU', timeout=0.1)
+            self.assertTupleEqual(core._oj._req._timeout, (0.1, 0.1))
+            self.assertEqual(core.get_problem('1000', account).status, Problem.Status.STATUS_RETRYABLE)
+            core = Core('HDU')
+            self.assertIsNone(core._oj._req._timeout)
+            self.assertEqual(core.get_problem('1000', account).status, Problem.Status.STATUS_SUCCESS)
+        stats = timeouts.stats()[('HDU', 'get_problem')]
+        self.assertGreaterEqual(stats['read'], 2)
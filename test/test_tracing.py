@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from spider.config import Account, Result
+from spider.core import Core
+from spider.poller import VerdictPoller
+from spider.tracing import JsonLinesExporter, MemoryExporter, SubmissionTrace, activate, current_trace, stage, tracer
+from test.mockoj import MockFarm, targets
+
+
+class TestSubmissionTrace(unittest.TestCase):
+    @staticmethod
+    def result(verdict, verdict_info):
+        result = Result(Result.Status.STATUS_RESULT_SUCCESS)
+        result.verdict, result.verdict_info = verdict, verdict_info
+        return result
+
+    def test_stage(self):
+        with stage('poll') as span:
+            self.assertIsNone(span)
+            self.assertIsNone(current_trace())
+        trace = SubmissionTrace('POJ', '1000', 'robot')
+        with activate(trace):
+            self.assertIs(current_trace(), trace)
+            with stage('submit') as submit:
+                with stage('login') as login:
+                    pass
+            with self.assertRaises(ValueError):
+                with stage('poll'):
+                    raise ValueError('broken page')
+        self.assertIsNone(current_trace())
+        self.assertEqual(login.parent_id, submit.span_id)
+        self.assertEqual(submit.parent_id, trace.root.span_id)
+        self.assertEqual(trace.spans[-1].error, 'ValueError: broken page')
+
+    def test_times(self):
+        trace = SubmissionTrace('POJ', '1000')
+        trace.mark_submitted(Result(Result.Status.STATUS_SUBMIT_SUCCESS))
+        trace.observe(self.result(Result.Verdict.VERDICT_RUNNING, 'Waiting'))
+        self.assertIsNone(trace.queue_time)
+        trace.observe(self.result(Result.Verdict.VERDICT_RUNNING, 'Running & Judging'))
+        judging_at = trace.judging_at
+        trace.observe(self.result(Result.Verdict.VERDICT_AC, 'Accepted'))
+        trace.observe(self.result(Result.Verdict.VERDICT_WA, 'Wrong Answer'))
+        self.assertEqual(trace.judging_at, judging_at)
+        self.assertEqual(trace.verdict, Result.Verdict.VERDICT_AC)
+        self.assertEqual(trace.polls, 4)
+        self.assertAlmostEqual(trace.queue_time + trace.judge_time, trace.finished_at - trace.submitted_at)
+        self.assertTrue(trace.finish())
+        self.assertFalse(trace.finish())
+        self.assertEqual(trace.root.attributes['verdict'], 'AC')
+
+    def test_export(self):
+        trace = SubmissionTrace('HDU', '1000', 'robot')
+        child = trace.add_span('http', start=trace.root.start, end=trace.root.start + 0.1, method='POST', status=200)
+        trace.finish()
+        data = json.loads(json.dumps(trace.to_dict()))
+        self.assertEqual(data['platform'], 'HDU')
+        self.assertEqual([span['name'] for span in data['spans']], ['submission', 'http'])
+
+        spans = trace.to_otlp()['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual(spans[1]['parentSpanId'], trace.root.span_id)
+        self.assertEqual(len(spans[0]['traceId']), 32)
+        duration = int(child.end * 1e9) - int(child.start * 1e9)
+        self.assertEqual(int(spans[1]['endTimeUnixNano']) - int(spans[1]['startTimeUnixNano']), duration)
+        self.assertIn({'key': 'status', 'value': {'intValue': '200'}}, spans[1]['attributes'])
+        self.assertNotIn('parentSpanId', spans[0])
+
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, 'traces.jsonl')
+            JsonLinesExporter(filename).export(trace)
+            JsonLinesExporter(filename, otlp=True).export(trace)
+            with open(filename) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual(lines[0]['trace_id'], trace.trace_id)
+        self.assertIn('resourceSpans', lines[1])
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.exporter = MemoryExporter()
+        tracer.add_exporter(self.exporter)
+        self.farm = MockFarm(judge_time=(0.1, 0.1))
+        self.farm.__enter__()
+        self.account = Account('robot', 'secret')
+
+    def tearDown(self):
+        self.farm.__exit__(None, None, None)
+        tracer.remove_exporter(self.exporter)
+
+    def test_submit(self):
+        for oj_name in ('HDU', 'ZOJ', 'Codeforces'):
+            with self.subTest(oj_name=oj_name):
+                pid, language = targets[oj_name]
+                core = Core(oj_name)
+                trace = tracer.start(oj_name, pid, self.account.username)
+                with activate(trace):
+                    result = core.submit(self.account, pid, language, 'int main() {}')
+                    self.assertEqual(result.status, Result.Status.STATUS_SUBMIT_SUCCESS)
+                    deadline = time.monotonic() + 5
+                    while result.verdict != Result.Verdict.VERDICT_AC and time.monotonic() < deadline:
+                        time.sleep(0.03)
+                        result = core.get_result(self.account, pid)
+                tracer.finish(trace, result)
+
+                names = [span.name for span in trace.spans]
+                self.assertTrue({'submission', 'submit', 'login', 'http', 'poll', 'classify'} <= set(names))
+                if oj_name != 'HDU':
+                    self.assertIn('form', names)
+                spans = {span.span_id: span for span in trace.spans}
+                post = [span for span in trace.spans if span.attributes.get('method') == 'POST'][-1]
+                self.assertEqual(spans[post.parent_id].name, 'submit')
+                self.assertEqual(trace.verdict, Result.Verdict.VERDICT_AC)
+                self.assertGreater(trace.judge_time, 0)
+                self.assertLess(trace.queue_time, 1)
+                self.assertIs(self.exporter.traces[-1], trace)
+
+        summary = self.exporter.percentiles()
+        self.assertSetEqual(set(summary), {'HDU', 'ZOJ', 'Codeforces'})
+        self.assertEqual(summary['ZOJ']['judge_time']['count'], 1)
+        self.assertIn('p99', summary['HDU']['verdict_latency'])
+
+    def test_poller(self):
+        core = Core('POJ')
+        core._oj.result_delay = 0
+        poller = VerdictPoller(initial_delay=0.05, factor=1, coalesce=0)
+        try:
+            handle = poller.submit(core, self.account, *targets['POJ'], 'int main() {}')
+            self.assertEqual(handle.result(timeout=5).verdict, Result.Verdict.VERDICT_AC)
+        finally:
+            poller.stop()
+        trace = handle.trace
+        self.assertIs(self.exporter.traces[-1], trace)
+        self.assertEqual(trace.root.attributes['status'], Result.Status.STATUS_RESULT_SUCCESS.value)
+        self.assertEqual(trace.polls, handle.polls)
+        self.assertEqual(len([span for span in trace.spans if span.name == 'poll']), handle.polls)
+        self.assertIsNotNone(trace.verdict_latency)
+
+    def test_disabled(self):
+        tracer.enabled = False
+        try:
+            self.assertIsNone(tracer.start('HDU', '1000'))
+            with activate(None):
+                self.assertIsNone(current_trace())
+        finally:
+            tracer.enabled = True
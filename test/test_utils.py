@@ -1,6 +1,6 @@
 import unittest
 
-from spider.utils import HttpUtil
+from spider.utils import AsyncResponse, HttpUtil, LoginState
 
 
 class TestUtils(unittest.TestCase):
@@ -22,3 +22,29 @@ class TestUtils(unittest.TestCase):
 
         self.assertEqual(HttpUtil.abs_url('1121-1.png', 'https://prefixai.com/'),
                          ('1121-1.png', 'https://prefixai.com/1121-1.png'))
+
+
+class TestLoginState(unittest.TestCase):
+    def test_ttl(self):
+        state = LoginState(ttl=60)
+        self.assertFalse(state.is_fresh())
+        state.mark()
+        self.assertTrue(state.is_fresh())
+        self.assertTrue(state.is_fresh())
+        self.assertEqual((state.hits, state.misses, state.invalidations), (2, 1, 0))
+        state = LoginState(ttl=0)
+        state.mark()
+        self.assertFalse(state.is_fresh())
+
+    def test_invalidate(self):
+        state = LoginState(ttl=60, login_pattern=r'codeforces\.com/enter')
+        state.mark()
+        state.inspect(AsyncResponse(200, b'', {}, 'http://codeforces.com/enter', history=()))
+        self.assertTrue(state.is_fresh())
+        state.inspect(AsyncResponse(200, b'', {}, 'http://codeforces.com/enter?back=%2F', history=(None,)))
+        self.assertFalse(state.is_fresh())
+        state.mark()
+        state.inspect(AsyncResponse(401, b'', {}, 'https://judgeapi.u-aizu.ac.jp/self'))
+        self.assertFalse(state.is_fresh())
+        self.assertEqual(state.invalidations, 2)
+        self.assertGreaterEqual(LoginState.totals()['invalidations'], 2)